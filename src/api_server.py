@@ -0,0 +1,136 @@
+import asyncio
+import json
+import threading
+from urllib.parse import parse_qsl
+
+# 路由表: (HTTP方法, 路径) -> 动作名
+ROUTES = {
+    ("POST", "/scan"): "scan",
+    ("POST", "/validate"): "validate",
+    ("GET", "/carton"): "carton",
+    ("POST", "/print"): "print",
+    ("GET", "/box/preview"): "preview",
+}
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+class LocalApiServer:
+    """
+    本地 HTTP/JSON 接口 (默认关闭)，供 PLC / 手持终端直接推送扫描、触发打印。
+    基于 asyncio，在独立线程中运行；每个请求都交给 dispatch(动作, 参数) 处理，
+    dispatch 返回 concurrent.futures.Future，由界面线程按顺序执行，
+    因此多台设备并发请求时，装箱状态的读写仍然是串行的。
+    """
+    MAX_BODY = 64 * 1024
+
+    def __init__(self, dispatch, host="127.0.0.1", port=8765):
+        self.dispatch = dispatch
+        self.host = host
+        self.port = port
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self.error = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="LocalApiServer", daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+        return self.error is None
+
+    def stop(self):
+        if self._loop and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread: self._thread.join(timeout=2)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle_conn, self.host, self.port))
+            # 端口为 0 时由系统分配，回写实际端口
+            self.port = self._server.sockets[0].getsockname()[1]
+        except Exception as e:
+            self.error = str(e)
+            print(f"API Server Error: {e}")
+            self._ready.set()
+            return
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            # 关闭仍保持着的长连接
+            tasks = asyncio.all_tasks(self._loop)
+            for t in tasks: t.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.run_until_complete(self._server.wait_closed())
+            self._loop.close()
+
+    async def _handle_conn(self, reader, writer):
+        try:
+            # HTTP/1.1 默认长连接，一个连接上可以连续发送多个请求
+            while True:
+                line = await reader.readline()
+                if not line: break
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"ok": False, "msg": "bad request line"}, False)
+                    break
+
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""): break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                length = int(headers.get("content-length", 0) or 0)
+                if length > self.MAX_BODY:
+                    await self._respond(writer, 413, {"ok": False, "msg": "body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, result = await self._route(method, target, body)
+                await self._respond(writer, status, result, keep_alive)
+                if not keep_alive: break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            try: writer.close()
+            except: pass
+
+    async def _route(self, method, target, body):
+        path, _, query = target.partition("?")
+        if (method, path) == ("GET", "/health"):
+            return 200, {"ok": True}
+        action = ROUTES.get((method, path))
+        if not action:
+            return 404, {"ok": False, "msg": f"unknown endpoint {method} {path}"}
+
+        try:
+            payload = json.loads(body.decode("utf-8")) if body else {}
+            if not isinstance(payload, dict): raise ValueError("payload must be an object")
+        except ValueError as e:
+            return 400, {"ok": False, "msg": f"bad json: {e}"}
+        for k, v in parse_qsl(query):
+            payload.setdefault(k, v)
+
+        try:
+            result = await asyncio.wrap_future(self.dispatch(action, payload))
+            return 200, result
+        except Exception as e:
+            return 500, {"ok": False, "msg": str(e)}
+
+    async def _respond(self, writer, status, result, keep_alive):
+        data = json.dumps(result, ensure_ascii=False, default=str).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + data)
+        await writer.drain()
@@ -1,9 +1,18 @@
 import win32com.client
 import os
 import pythoncom
+from collections import Counter
 from src.database import Database
+from src.metrics import metrics
+from src.template_catalog import template_catalog
+from src.printer_registry import printer_registry
 
 class BartenderPrinter:
+    # 模板命名数据源缓存 (全进程共享): {模板路径: (mtime, frozenset(字段名) 或 None)}
+    _field_cache = {}
+    # 模板中不存在、被跳过的字段计数: {(模板文件名, 字段名): 次数}
+    unmatched_keys = Counter()
+
     def __init__(self):
         self.db = Database() # 初始化数据库连接
         self.bt_app = None
@@ -28,49 +37,120 @@ class BartenderPrinter:
             print(f"Bartender Launch Error: {e}")
             return None
 
+    def _get_template_fields(self, bt_format, template_path):
+        """
+        读取模板中定义的命名数据源 (记录在模板目录索引中，模板内容变化后自动重新读取；
+        不在模板根目录下的模板按路径 + 修改时间缓存)。
+        读取失败时返回 None，调用方回退为逐个尝试设置。
+        """
+        info = template_catalog.resolve(template_path)
+        if info and info.fields is not None:
+            return info.fields or None
+        if info:
+            mtime = info.mtime
+        else:
+            try: mtime = os.path.getmtime(template_path)
+            except OSError: mtime = None
+        hit = self._field_cache.get(template_path)
+        if hit and hit[0] == mtime:
+            return hit[1]
+
+        fields = None
+        try:
+            subs = bt_format.NamedSubStrings
+            try:
+                fields = frozenset(s.Name for s in subs)
+            except TypeError:
+                fields = frozenset(subs.Item(i).Name for i in range(1, subs.Count + 1))
+        except Exception as e:
+            print(f"Bartender Introspect Error: {e}")
+        # 读不到任何字段时不做过滤，避免误跳过全部数据
+        if not fields: fields = None
+        self._field_cache[template_path] = (mtime, fields)
+        # 回填到模板目录 (读不到时记为空集，避免每次打开都重新读取)
+        if info: info.fields = fields or frozenset()
+        return fields
+
+    def get_unmatched_report(self):
+        """返回 [(模板文件名, 字段名, 次数)]，按次数降序"""
+        return [(t, k, n) for (t, k), n in self.unmatched_keys.most_common()]
+
+    def _set_fields(self, bt_format, fields, tmpl_name, data_map):
+        # data_map 包含: name, spec, code69, 1, 2, 3...
+        # 只发送模板中真实存在的字段，省去大量无效的 COM 调用
+        for key, value in data_map.items():
+            if fields is not None and key not in fields:
+                # 每个模板的每个缺失字段只提示一次
+                if (tmpl_name, key) not in self.unmatched_keys:
+                    print(f"Bartender: 模板 {tmpl_name} 中没有字段 [{key}]，已跳过")
+                self.unmatched_keys[(tmpl_name, key)] += 1
+                continue
+            try:
+                # 尝试设置命名数据源
+                bt_format.SetNamedSubStringValue(key, str(value))
+            except:
+                pass 
+
     def print_label(self, template_path, data_map, printer_name=None):
+        printed, msg = self.print_batch(template_path, [data_map], printer_name)
+        return printed == 1, msg
+
+    def print_batch(self, template_path, data_maps, printer_name=None, progress=None):
+        """
+        批量打印：模板只打开一次，依次填充每一箱的数据并 PrintOut，最后统一关闭。
+        progress: 可选回调 progress(已完成数, 总数)
+        返回 (成功张数, 消息)
+        """
+        # 查模板目录索引和打印机缓存 (均为内存查询)，模板缺失或打印机脱机时不进入 COM 调用
+        if not template_catalog.exists(template_path):
+            return 0, f"找不到模板文件: {template_path}"
+        target_printer = printer_name or self.db.get_default_printer()
+        ok, msg = printer_registry.check(target_printer)
+        if not ok: return 0, msg
+
         # 1. 尝试获取 app 实例 (懒加载)
         app = self._get_bt_app()
         if not app:
-            return False, "无法启动 Bartender，请确认已安装软件。"
-
-        if not os.path.exists(template_path):
-            return False, f"找不到模板文件: {template_path}"
+            return 0, "无法启动 Bartender，请确认已安装软件。"
 
         bt_format = None
+        printed = 0
         try:
             # 2. 打开模板 (ReadOnly=True)
-            bt_format = app.Formats.Open(template_path, True, "")
+            with metrics.span("bt.open"):
+                bt_format = app.Formats.Open(template_path, True, "")
             
             # 3. 设置默认打印机
-            target_printer = self.db.get_setting('default_printer')
-            if target_printer and target_printer != "使用系统默认打印机":
+            if target_printer:
                 bt_format.Printer = target_printer
 
-            # 4. 设置数据源
-            # data_map 包含: name, spec, code69, 1, 2, 3...
-            for key, value in data_map.items():
-                try:
-                    # 尝试设置命名数据源
-                    bt_format.SetNamedSubStringValue(key, str(value))
-                except:
-                    pass 
+            fields = self._get_template_fields(bt_format, template_path)
+            tmpl_name = os.path.basename(template_path)
+            for data_map in data_maps:
+                # 4. 设置数据源
+                with metrics.span("bt.set_fields"):
+                    self._set_fields(bt_format, fields, tmpl_name, data_map)
 
-            # 5. 打印
-            # PrintOut(ShowStatusWindow, ShowDialog)
-            bt_format.PrintOut(False, False) 
+                # 5. 打印
+                # PrintOut(ShowStatusWindow, ShowDialog)
+                with metrics.span("bt.print_out"):
+                    bt_format.PrintOut(False, False) 
+                printed += 1
+                if progress: progress(printed, len(data_maps))
             
             # 6. 关闭模板 (不保存)
             # CloseOptions: 1 = btDoNotSaveChanges
-            bt_format.Close(1) 
+            with metrics.span("bt.close"):
+                bt_format.Close(1) 
             
-            return True, "打印成功"
+            return printed, "打印成功" if printed == 1 else f"已打印 {printed} 张"
         except Exception as e:
             # 异常处理：尝试关闭模板防止锁死
             try:
                 if bt_format: bt_format.Close(1)
             except: pass
-            return False, f"打印出错: {str(e)}"
+            done = f" (已打印 {printed}/{len(data_maps)})" if len(data_maps) > 1 else ""
+            return printed, f"打印出错{done}: {str(e)}"
 
     def quit(self):
         """退出 Bartender 进程"""
@@ -0,0 +1,128 @@
+"""
+箱号核对：找出流水号缺口、重复箱号、计数与记录不一致。
+
+按 box_no 分组一次扫描 records (走 idx_records_box_no)，用箱号规则的正则 (BoxRuleEngine.compile_rule)
+反解出流水号，归到计数键 (产品, 箱规, 年, 月, 返修等级) 下，再与 box_counters 对比。
+"""
+import datetime
+import os
+from collections import Counter, defaultdict
+
+from src.config import DIAG_DIR
+from src.database import op_get_box_counter, op_list_box_counters, op_set_box_counter
+
+BOX_GROUP_QUERY = """
+    SELECT box_no, MIN(name), MIN(batch), MIN(print_date), SUM(box_sn_seq = 1), COUNT(*)
+    FROM records GROUP BY box_no
+"""
+
+def _ranges(nums):
+    """[1,2,3,7,8] -> [(1,3),(7,8)]"""
+    out = []
+    for n in nums:
+        if out and n == out[-1][1] + 1: out[-1] = (out[-1][0], n)
+        else: out.append((n, n))
+    return out
+
+def _fmt_ranges(ranges, limit=20):
+    s = ", ".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges[:limit])
+    return s + (f" ... 共 {len(ranges)} 段" if len(ranges) > limit else "")
+
+def reconcile(conn, engine, catalog, progress=None):
+    """
+    conn: 只读连接；engine: BoxRuleEngine；catalog: 已同步的 ProductCatalog
+    返回报告 dict:
+        keys:       [{key, boxes, max_seq, counter, gaps, dup_seqs, tail}]  (仅列出有问题的计数键)
+        duplicates: [(box_no, 箱数, SN数)]  同一箱号被打印了多箱
+        unmatched:  无法按规则反解的箱号数量
+        total_boxes
+    """
+    rules = dict(conn.execute("SELECT id, rule_string FROM box_rules").fetchall())
+    regex_cache = {}
+    def regex_for(p):
+        r = regex_cache.get(p.id)
+        if r is None:
+            fmt = rules.get(p.rule_id)
+            r = regex_cache[p.id] = engine.compile_rule(fmt, p) if fmt else False
+        return r
+
+    seqs = defaultdict(list)
+    duplicates = []
+    unmatched = total = 0
+    cur = conn.execute(BOX_GROUP_QUERY)
+    while True:
+        rows = cur.fetchmany(5000)
+        if not rows: break
+        for box_no, name, batch, pdate, cartons, units in rows:
+            total += 1
+            if (cartons or 0) > 1: duplicates.append((box_no, cartons, units))
+            hit = None
+            for p in catalog.find_by_name(name):
+                rx = regex_for(p)
+                m = rx.fullmatch(box_no or "") if rx else None
+                if m: hit = (p, int(m.group('seq'))) if 'seq' in rx.groupindex else None; break
+            if not hit or not pdate or len(pdate) < 7:
+                unmatched += 1
+                continue
+            p, seq = hit
+            try: level = int(batch or 0)
+            except ValueError: level = 0
+            seqs[(p.id, p.rule_id, int(pdate[:4]), int(pdate[5:7]), level)].append(seq)
+        if progress: progress(total)
+
+    counters = {c[:5]: c[5] for c in op_list_box_counters(conn.cursor())}
+    issues = []
+    for key in set(seqs) | set(counters):
+        level = key[4]
+        base = level * 10000
+        found = sorted(seqs.get(key, []))
+        counter = counters.get(key, op_get_box_counter(conn.cursor(), *key))
+        max_seq = found[-1] if found else base
+        cnt = Counter(found)
+        uniq = sorted(cnt)
+        dup_seqs = [s for s in uniq if cnt[s] > 1]
+        missing = []
+        prev = base
+        for s in uniq:
+            if s > prev + 1: missing.extend(range(prev + 1, s))
+            prev = max(prev, s)
+        tail = counter - max_seq # >0: 预留/打印失败未入库；<0: 计数落后，会重复发号
+        if missing or dup_seqs or tail:
+            issues.append({"key": key, "boxes": len(found), "max_seq": max_seq, "counter": counter,
+                           "gaps": _ranges(missing), "dup_seqs": dup_seqs, "tail": tail})
+    issues.sort(key=lambda i: i["key"])
+    return {"keys": issues, "duplicates": duplicates, "unmatched": unmatched, "total_boxes": total}
+
+def repair_counters(conn, report):
+    """把落后于已打印最大流水号的计数推进到该值 (只会调大，不会调小)；返回修复的计数键数量"""
+    cur = conn.cursor()
+    n = 0
+    for item in report["keys"]:
+        if item["tail"] < 0:
+            op_set_box_counter(cur, *item["key"], item["max_seq"])
+            n += 1
+    return n
+
+def format_report(report, catalog=None):
+    lines = [f"核对时间: {datetime.datetime.now():%Y-%m-%d %H:%M:%S}",
+             f"箱号总数: {report['total_boxes']}，无法按规则解析: {report['unmatched']}",
+             f"重复箱号 (同一箱号打印了多箱): {len(report['duplicates'])}"]
+    for box_no, cartons, units in report["duplicates"][:200]:
+        lines.append(f"    {box_no}: {cartons} 箱 / {units} 个SN")
+    lines.append(f"有问题的计数: {len(report['keys'])}")
+    for it in report["keys"]:
+        pid, rid, y, m, lvl = it["key"]
+        p = catalog.get(pid) if catalog else None
+        lines.append(f"  [{p.name if p else pid}] 箱规{rid} {y}-{m:02d} 返修{lvl}: "
+                     f"箱数 {it['boxes']}，最大流水 {it['max_seq']}，计数 {it['counter']}")
+        if it["tail"] < 0: lines.append(f"      ! 计数落后 {-it['tail']}，会再次发出已用过的箱号")
+        elif it["tail"] > 0: lines.append(f"      计数超前 {it['tail']} (预留/打印失败未入库)")
+        if it["gaps"]: lines.append(f"      缺号: {_fmt_ranges(it['gaps'])}")
+        if it["dup_seqs"]: lines.append(f"      重复流水号: {', '.join(map(str, it['dup_seqs'][:50]))}")
+    return "\n".join(lines)
+
+def save_report(text):
+    os.makedirs(DIAG_DIR, exist_ok=True)
+    path = os.path.join(DIAG_DIR, f"box_reconcile_{datetime.datetime.now():%Y%m%d_%H%M%S}.txt")
+    with open(path, "w", encoding="utf-8") as f: f.write(text)
+    return path
@@ -1,10 +1,16 @@
 import datetime
 import re # 引入正则模块
 from src.database import Database
+from src.metrics import metrics
+
+# 日期编码在箱号中的形态 (与 parse_date_code 对应)，用于反解箱号
+DATE_CODE_PATTERNS = {"YYYY": r"\d{4}", "Y2": r"\d{2}", "Y1": r"\d", "MM": r"\d{2}", "M1": r"[1-9ABC]", "DD": r"\d{2}"}
+RULE_TOKEN = re.compile(r"\{(SN4|YYYY|Y2|Y1|MM|M1|DD|SEQ(\d+))\}")
 
 class BoxRuleEngine:
     def __init__(self, db: Database):
         self.db = db
+        self._formatters = {}
 
     def parse_date_code(self, code, dt):
         """处理自定义日期编码"""
@@ -29,6 +35,10 @@ class BoxRuleEngine:
         """
         product_info: dict (must contain 'id', 'sn4')
         """
+        with metrics.span("box_no.generate"):
+            return self._generate_box_no(rule_id, product_info, repair_level)
+
+    def _generate_box_no(self, rule_id, product_info, repair_level):
         cursor = self.db.conn.cursor()
         cursor.execute("SELECT rule_string FROM box_rules WHERE id=?", (rule_id,))
         res = cursor.fetchone()
@@ -46,31 +56,99 @@ class BoxRuleEngine:
         next_seq = current_seq + 1
         
         # 2. 解析规则
-        result = rule_fmt
-        
-        # 替换基础变量
-        result = result.replace("{SN4}", str(product_info.get('sn4', '0000')))
-        
-        # 替换时间变量
-        for code in ["YYYY", "Y2", "Y1", "MM", "M1", "DD"]:
-            placeholder = f"{{{code}}}"
-            if placeholder in result:
-                result = result.replace(placeholder, self.parse_date_code(code, now))
-
-        # 3. 替换动态流水号 {SEQn}
-        # 使用正则查找所有 {SEQ数字} 的模式
-        def seq_replacer(match):
-            # 获取括号内的数字，例如 {SEQ3} -> 3
-            width = int(match.group(1))
-            # 格式化数字，例如 1 -> 001
-            return f"{next_seq:0{width}d}"
-
-        # 正则替换：匹配 {SEQ + 数字 + }
-        result = re.sub(r"\{SEQ(\d+)\}", seq_replacer, result)
-
-        return result, next_seq
-
-    def commit_sequence(self, rule_id, product_id, repair_level=0):
-        """打印成功后提交计数"""
+        return self.format_box_no(rule_fmt, product_info, now, next_seq), next_seq
+
+    def format_box_no(self, rule_fmt, product_info, now, next_seq):
+        """按规则字符串生成箱号 (不读写计数)"""
+        return self.compile_formatter(rule_fmt, product_info)(now, next_seq)
+
+    def compile_formatter(self, rule_fmt, product_info):
+        """
+        把箱号规则预先拆成 [常量 / 日期编码 / 流水号] 片段，返回 fmt(now, seq) -> 箱号。
+        按 (规则, SN前缀) 缓存，批量生成 (预印、规则模拟) 时每个箱号只做一次拼接
+        """
+        sn4 = str(product_info.get('sn4', '0000'))
+        key = (rule_fmt, sn4)
+        fmt = self._formatters.get(key)
+        if fmt: return fmt
+
+        parts = [] # (类型, 值): 'text' 常量, 'date' 日期编码, 'seq' 流水号位宽
+        pos = 0
+        for m in RULE_TOKEN.finditer(rule_fmt):
+            if m.start() > pos: parts.append(('text', rule_fmt[pos:m.start()]))
+            tok = m.group(1)
+            if tok == "SN4": parts.append(('text', sn4))
+            elif m.group(2): parts.append(('seq', int(m.group(2))))
+            else: parts.append(('date', tok))
+            pos = m.end()
+        if pos < len(rule_fmt): parts.append(('text', rule_fmt[pos:]))
+        parse = self.parse_date_code
+
+        def fmt(now, seq):
+            out = []
+            for kind, val in parts:
+                if kind == 'text': out.append(val)
+                elif kind == 'seq': out.append(f"{seq:0{val}d}")
+                else: out.append(parse(val, now))
+            return "".join(out)
+
+        if len(self._formatters) > 256: self._formatters.clear()
+        self._formatters[key] = fmt
+        return fmt
+
+    def compile_rule(self, rule_fmt, product_info):
+        """
+        把箱号规则编译成正则 (format_box_no 的逆运算)，用于从已打印的箱号反解流水号。
+        分组: seq (流水号)，以及规则中出现的日期编码 (YYYY/Y2/Y1/MM/M1/DD)。
+        流水号超出位宽时 format_box_no 会输出更多位，所以 {SEQn} 匹配 n 位及以上。
+        """
+        pattern, pos, used = "", 0, set()
+        for m in RULE_TOKEN.finditer(rule_fmt):
+            pattern += re.escape(rule_fmt[pos:m.start()])
+            tok = m.group(1)
+            if tok == "SN4":
+                pattern += re.escape(str(product_info.get('sn4', '0000')))
+            else:
+                name = "seq" if m.group(2) else tok
+                body = r"\d{%d,}" % int(m.group(2)) if m.group(2) else DATE_CODE_PATTERNS[tok]
+                # 同一编码出现多次时只有第一次捕获
+                pattern += f"(?P<{name}>{body})" if name not in used else f"(?:{body})"
+                used.add(name)
+            pos = m.end()
+        pattern += re.escape(rule_fmt[pos:])
+        return re.compile(pattern)
+
+    def reserve_box_numbers(self, rule_id, product_info, count, repair_level=0):
+        """
+        批量预留箱号：一次性把计数推进 count，返回 [(箱号, 流水号), ...]。
+        预留后即使打印失败，这些箱号也不会再被分配 (避免重号)。
+        """
+        cursor = self.db.conn.cursor()
+        cursor.execute("SELECT rule_string FROM box_rules WHERE id=?", (rule_id,))
+        res = cursor.fetchone()
+        if not res or count <= 0: return []
+
+        now = datetime.datetime.now()
+        pid = product_info.get('id', 0)
+        first = self.db.reserve_box_counter(pid, rule_id, now.year, now.month, repair_level, count)
+        return [(self.format_box_no(res[0], product_info, now, seq), seq) for seq in range(first, first + count)]
+
+    def reserve_box_no(self, rule_id, product_info, repair_level=0):
+        """
+        封箱时原子预留一个箱号 (服务模式下由数据库服务分配，多工位不会拿到同一个号)。
+        返回 (箱号, 计数键)，计数键交给 release_box_no 在打印失败时归还；没有规则时返回 (None, None)
+        """
+        cursor = self.db.conn.cursor()
+        cursor.execute("SELECT rule_string FROM box_rules WHERE id=?", (rule_id,))
+        res = cursor.fetchone()
+        if not res: return None, None
+
         now = datetime.datetime.now()
-        self.db.increment_box_counter(product_id, rule_id, now.year, now.month, repair_level)
+        pid = product_info.get('id', 0)
+        seq = self.db.reserve_box_counter(pid, rule_id, now.year, now.month, repair_level, 1)
+        return self.format_box_no(res[0], product_info, now, seq), (pid, rule_id, now.year, now.month, repair_level, seq)
+
+    def release_box_no(self, key):
+        """归还 reserve_box_no 预留的箱号 (其他工位已在其后预留时留空号，不会重号)"""
+        if key: return self.db.release_box_counter(*key)
+        return False
@@ -1,5 +1,6 @@
 import os
 import sys
+import socket
 
 def get_resource_path(relative_path):
     """获取资源绝对路径，兼容开发环境和PyInstaller打包后的环境"""
@@ -7,7 +8,18 @@ def get_resource_path(relative_path):
         return os.path.join(sys._MEIPASS, relative_path)
     return os.path.join(os.path.abspath("."), relative_path)
 
+def get_station_id():
+    """工位标识：优先取环境变量 LABEL_STATION，否则使用计算机名"""
+    return os.environ.get("LABEL_STATION") or socket.gethostname()
+
 DB_NAME = "label_printer.db"
+def get_app_data_dir():
+    """本机数据目录：Windows 为 %LOCALAPPDATA%\\LabelPrinter，其他系统为 ~/.label_printer"""
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("APPDATA")
+    return os.path.join(base, "LabelPrinter") if base else os.path.join(os.path.expanduser("~"), ".label_printer")
+
+# 诊断输出 (耗时统计、慢查询日志等) 目录；不放在当前工作目录，避免混进程序目录/代码仓库
+DIAG_DIR = os.environ.get("LABEL_DIAG_DIR") or os.path.join(get_app_data_dir(), "diagnostics")
 PASSWORD = "123456"
 
 # 默认字段映射
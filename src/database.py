@@ -3,16 +3,323 @@ import json
 import shutil
 import os
 import datetime
+import time
 from src.config import DEFAULT_MAPPING
+from src.events import event_bus, commit_local, ENTITIES
+from src.settings_cache import get_settings_cache, parse_mapping, parse_printer
+from src.product_catalog import get_product_catalog
+from src.query_log import ProfiledConnection, query_stats
+from src.reports import summary_query
+
+# ================= 数据操作 (本地直连与数据库服务共用) =================
+# 均只接收 cursor、不自行提交，由调用方决定事务边界
+
+# SQLite 单条语句的参数上限较低 (旧版本为 999)，IN 查询需要分块
+SQL_CHUNK = 500
+
+RECORD_COLUMNS = "box_no, box_sn_seq, name, spec, model, color, code69, sn, prod_date, print_date, batch"
+
+# 箱号计数按 (产品, 箱规, 年, 月, 返修等级) 复合主键存储；没有记录时从 返修等级*10000 起算
+BOX_COUNTER_DDL = """
+    CREATE TABLE IF NOT EXISTS box_counters (
+        product_id INTEGER NOT NULL, rule_id INTEGER NOT NULL, year INTEGER NOT NULL,
+        month INTEGER NOT NULL, repair_level INTEGER NOT NULL DEFAULT 0, current_val INTEGER NOT NULL,
+        PRIMARY KEY (product_id, rule_id, year, month, repair_level)
+    ) WITHOUT ROWID
+"""
+_COUNTER_WHERE = "product_id=? AND rule_id=? AND year=? AND month=? AND repair_level=?"
+
+def op_get_box_counter(cur, product_id, rule_id, year, month, repair_level=0):
+    cur.execute(f"SELECT current_val FROM box_counters WHERE {_COUNTER_WHERE}",
+                (product_id, rule_id, year, month, repair_level))
+    res = cur.fetchone()
+    return res[0] if res else repair_level * 10000
+
+def op_reserve_box_counter(cur, product_id, rule_id, year, month, repair_level=0, count=1):
+    """将计数推进 count (单条 UPSERT 自增)，返回预留的第一个流水号 (调用方需持有写事务)"""
+    key = (product_id, rule_id, year, month, repair_level)
+    cur.execute("INSERT INTO box_counters (product_id, rule_id, year, month, repair_level, current_val) "
+                "VALUES (?,?,?,?,?,?) ON CONFLICT (product_id, rule_id, year, month, repair_level) "
+                "DO UPDATE SET current_val = current_val + ?", key + (repair_level * 10000 + count, count))
+    cur.execute(f"SELECT current_val FROM box_counters WHERE {_COUNTER_WHERE}", key)
+    return cur.fetchone()[0] - count + 1
+
+def op_release_box_counter(cur, product_id, rule_id, year, month, repair_level, seq):
+    """归还刚预留的流水号 seq：仅当它仍是最后一个 (期间没有其他工位再预留) 时把计数退回一位，返回是否归还"""
+    cur.execute(f"UPDATE box_counters SET current_val = current_val - 1 WHERE {_COUNTER_WHERE} AND current_val=?",
+                (product_id, rule_id, year, month, repair_level, seq))
+    return cur.rowcount > 0
+
+def op_set_box_counter(cur, product_id, rule_id, year, month, repair_level, value):
+    cur.execute("INSERT OR REPLACE INTO box_counters (product_id, rule_id, year, month, repair_level, current_val) "
+                "VALUES (?,?,?,?,?,?)", (product_id, rule_id, year, month, repair_level, value))
+
+def op_list_box_counters(cur, product_id=None, year=None, month=None):
+    """计数列表 (可按产品/年/月过滤，走主键前缀)，返回 [(product_id, rule_id, year, month, repair_level, current_val)]"""
+    sql = "SELECT product_id, rule_id, year, month, repair_level, current_val FROM box_counters WHERE 1=1"
+    params = []
+    for col, val in (("product_id", product_id), ("year", year), ("month", month)):
+        if val is not None:
+            sql += f" AND {col}=?"; params.append(val)
+    cur.execute(sql + " ORDER BY product_id, rule_id, year, month, repair_level", params)
+    return [tuple(r) for r in cur.fetchall()]
+
+def op_reset_box_counters(cur, keys):
+    """批量重置：删除计数行，下次从 返修等级*10000 重新起算。keys: [(product_id, rule_id, year, month, repair_level)]"""
+    cur.executemany(f"DELETE FROM box_counters WHERE {_COUNTER_WHERE}", [tuple(k)[:5] for k in keys])
+    return len(keys)
+
+def migrate_box_counters(cur):
+    """旧版 key TEXT ('P12_R3_2026_10_0') 计数表迁移到复合主键表 (调用方需持有写事务)"""
+    cur.execute("PRAGMA table_info(box_counters)")
+    if 'key' not in [c[1] for c in cur.fetchall()]: return 0
+    cur.execute("SELECT key, current_val FROM box_counters")
+    rows = []
+    for key, val in cur.fetchall():
+        try:
+            p, r, y, m, lvl = key.split("_")
+            rows.append((int(p[1:]), int(r[1:]), int(y), int(m), int(lvl), val or 0))
+        except ValueError:
+            print(f"Skip invalid box counter key: {key}")
+    cur.execute("ALTER TABLE box_counters RENAME TO box_counters_old")
+    cur.execute(BOX_COUNTER_DDL)
+    cur.executemany("INSERT INTO box_counters VALUES (?,?,?,?,?,?) ON CONFLICT (product_id, rule_id, year, month, repair_level) "
+                    "DO UPDATE SET current_val = MAX(current_val, excluded.current_val)", rows)
+    cur.execute("DROP TABLE box_counters_old")
+    return len(rows)
+
+def op_find_existing_sns(cur, sns):
+    """一次查出 sns 中已存在于打印记录的 SN"""
+    sns = list(sns)
+    found = set()
+    for i in range(0, len(sns), SQL_CHUNK):
+        chunk = sns[i:i + SQL_CHUNK]
+        cur.execute(f"SELECT sn FROM records WHERE sn IN ({','.join('?' * len(chunk))})", chunk)
+        found.update(r[0] for r in cur.fetchall())
+    return found
+
+class DuplicateSNError(Exception):
+    """写入打印记录时 SN 与已有记录冲突 (records.sn 唯一索引)，sns 为冲突的 SN"""
+    def __init__(self, sns):
+        self.sns = sorted(sns)
+        super().__init__("SN 已打印过: " + ", ".join(self.sns[:10]) + (" ..." if len(self.sns) > 10 else ""))
+
+def op_insert_records(cur, rows):
+    """
+    rows: 按 RECORD_COLUMNS 顺序的元组列表。
+    整批一条 INSERT；SN 冲突时整批回滚，并查出冲突的 SN 抛出 DuplicateSNError (调用方需持有写事务，否则 SAVEPOINT 会自行提交)
+    """
+    cur.execute("SAVEPOINT insert_records")
+    try:
+        cur.executemany(f"INSERT INTO records ({RECORD_COLUMNS}) VALUES (?,?,?,?,?,?,?,?,?,?,?)", rows)
+    except sqlite3.IntegrityError:
+        cur.execute("ROLLBACK TO insert_records")
+        cur.execute("RELEASE insert_records")
+        sns = [r[7] for r in rows]
+        dups = op_find_existing_sns(cur, sns)
+        seen = set()
+        for sn in sns:
+            if sn in seen: dups.add(sn)
+            seen.add(sn)
+        if not dups: raise
+        raise DuplicateSNError(dups)
+    cur.execute("RELEASE insert_records")
+    return len(rows)
+
+def op_delete_box_records(cur, box_no, sns):
+    """撤销一箱的记录 (先写记录后打印，打印失败时调用)"""
+    sns = list(sns)
+    n = 0
+    for i in range(0, len(sns), SQL_CHUNK):
+        chunk = sns[i:i + SQL_CHUNK]
+        cur.execute(f"DELETE FROM records WHERE box_no=? AND sn IN ({','.join('?' * len(chunk))})", [box_no] + chunk)
+        n += cur.rowcount
+    return n
+
+# records.sn 唯一索引迁移：重复的 SN 只保留最早一条，其余移入隔离表备查
+QUARANTINE_DDL = """
+    CREATE TABLE IF NOT EXISTS records_quarantine (
+        id INTEGER PRIMARY KEY, box_sn_seq INTEGER, name TEXT, spec TEXT, model TEXT, color TEXT,
+        code69 TEXT, sn TEXT, box_no TEXT, prod_date TEXT, print_date TEXT, batch TEXT, quarantined_at TEXT
+    )
+"""
+DUPLICATE_SN_IDS = """
+    SELECT r.id FROM records r
+    JOIN (SELECT sn, MIN(id) AS keep FROM records WHERE sn IS NOT NULL GROUP BY sn HAVING COUNT(*) > 1) d
+      ON r.sn = d.sn AND r.id <> d.keep
+"""
+
+# 装箱清单暂存表 (客户预先提供的 SN -> 箱 对应表，见 src/manifest.py)，只在本工位使用
+MANIFEST_DDL = [
+    """CREATE TABLE IF NOT EXISTS manifests (
+        id INTEGER PRIMARY KEY, file TEXT, product_id INTEGER, batch TEXT, created_at TEXT,
+        cartons INTEGER, units INTEGER
+    )""",
+    # status: ok 待装箱 / bad 不符合SN规则 / printed 已有打印记录 / done 已按清单装箱
+    """CREATE TABLE IF NOT EXISTS manifest_items (
+        manifest_id INTEGER NOT NULL, sn TEXT NOT NULL, carton TEXT NOT NULL, line INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'ok', box_no TEXT,
+        PRIMARY KEY (manifest_id, sn)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_manifest_items_carton ON manifest_items (manifest_id, carton)",
+]
+
+# ================= 统计汇总表 =================
+# box_summary 按 (小时, 产品名称, 69码, 批次) 汇总箱数/数量，由 records 上的触发器增量维护，
+# 报表直接查汇总表，不再扫描百万级的 records。箱数按 box_sn_seq=1 (每箱第一个 SN) 计。
+_SUMMARY_KEY = "substr({r}.print_date, 1, 13), COALESCE({r}.name, ''), COALESCE({r}.code69, ''), COALESCE({r}.batch, '')"
+_SUMMARY_MATCH = ("hour = substr({r}.print_date, 1, 13) AND name = COALESCE({r}.name, '') "
+                  "AND code69 = COALESCE({r}.code69, '') AND batch = COALESCE({r}.batch, '')")
+_SUMMARY_ADD = ("INSERT INTO box_summary (hour, name, code69, batch, boxes, units) "
+                "SELECT " + _SUMMARY_KEY + ", {r}.box_sn_seq = 1, 1 WHERE {r}.print_date IS NOT NULL "
+                "ON CONFLICT (hour, name, code69, batch) DO UPDATE SET boxes = boxes + excluded.boxes, units = units + 1;")
+_SUMMARY_SUB = ("UPDATE box_summary SET boxes = boxes - ({r}.box_sn_seq = 1), units = units - 1 WHERE " + _SUMMARY_MATCH + ";"
+                "DELETE FROM box_summary WHERE " + _SUMMARY_MATCH + " AND units <= 0;")
+
+SUMMARY_DDL = [
+    """CREATE TABLE IF NOT EXISTS box_summary (
+        hour TEXT NOT NULL, name TEXT NOT NULL, code69 TEXT NOT NULL, batch TEXT NOT NULL,
+        boxes INTEGER NOT NULL DEFAULT 0, units INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (hour, name, code69, batch)
+    ) WITHOUT ROWID""",
+    "CREATE TRIGGER IF NOT EXISTS trg_records_summary_ins AFTER INSERT ON records BEGIN "
+    + _SUMMARY_ADD.format(r="NEW") + " END",
+    "CREATE TRIGGER IF NOT EXISTS trg_records_summary_del AFTER DELETE ON records BEGIN "
+    + _SUMMARY_SUB.format(r="OLD") + " END",
+    "CREATE TRIGGER IF NOT EXISTS trg_records_summary_upd AFTER UPDATE OF print_date, name, code69, batch, box_sn_seq ON records BEGIN "
+    + _SUMMARY_SUB.format(r="OLD") + _SUMMARY_ADD.format(r="NEW") + " END",
+]
+
+SUMMARY_BACKFILL = """
+    INSERT INTO box_summary (hour, name, code69, batch, boxes, units)
+    SELECT substr(print_date, 1, 13), COALESCE(name, ''), COALESCE(code69, ''), COALESCE(batch, ''),
+           SUM(box_sn_seq = 1), COUNT(*)
+    FROM records WHERE print_date IS NOT NULL GROUP BY 1, 2, 3, 4
+"""
+
+def records_query(keyword="", start=None, end=None, limit=1000):
+    """历史记录查询语句 (按 SN/箱号 模糊搜索 + 打印日期范围)，返回 (sql, params)"""
+    sql = """
+        SELECT id, box_no, box_sn_seq, name, spec, model, color, sn, code69, print_date 
+        FROM records 
+        WHERE 1=1
+    """
+    params = []
+    if start and end:
+        sql += " AND print_date >= ? AND print_date <= ?"
+        params += [f"{start} 00:00:00", f"{end} 23:59:59"]
+    if keyword:
+        sql += " AND (sn LIKE ? OR box_no LIKE ?)"
+        params += [f"%{keyword}%", f"%{keyword}%"]
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(int(limit))
+    return sql, params
+
+def op_search_records(cur, keyword="", start=None, end=None, limit=1000):
+    sql, params = records_query(keyword, start, end, limit)
+    cur.execute(sql, params)
+    return cur.fetchall()
+
+BOX_RECORD_QUERY = "SELECT box_no, sn, spec, model, color, code69, prod_date, print_date FROM records WHERE box_no IN ({}) ORDER BY box_no, box_sn_seq"
+
+def op_fetch_box_records(cur, box_nos):
+    """读取若干箱的记录，返回 {箱号: [(sn, spec, model, color, code69, prod_date, print_date), ...]}"""
+    out = {}
+    box_nos = list(box_nos)
+    for i in range(0, len(box_nos), SQL_CHUNK):
+        chunk = box_nos[i:i + SQL_CHUNK]
+        cur.execute(BOX_RECORD_QUERY.format(",".join("?" * len(chunk))), chunk)
+        for r in cur.fetchall():
+            out.setdefault(r[0], []).append(tuple(r[1:]))
+    return out
+
+def op_delete_records(cur, ids):
+    ids = list(ids)
+    n = 0
+    for i in range(0, len(ids), SQL_CHUNK):
+        chunk = ids[i:i + SQL_CHUNK]
+        cur.execute(f"DELETE FROM records WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+        n += cur.rowcount
+    return n
+
+# 今日产量：产品 + 规格 + 型号 + 颜色 + 批次 + 69码 + SN前缀
+DAILY_QUERY = """
+    SELECT COUNT(DISTINCT box_no) FROM records 
+    WHERE name=? AND spec=? AND model=? AND color=? AND batch=? 
+    AND code69=? AND sn LIKE ? AND print_date LIKE ?
+"""
+
+def op_count_daily_boxes(cur, params):
+    cur.execute(DAILY_QUERY, list(params))
+    return cur.fetchone()[0]
+
+def op_run_summary(cur, **kwargs):
+    """统计报表汇总查询，返回 (表头, 行)"""
+    sql, params, headers = summary_query(**kwargs)
+    cur.execute(sql, params)
+    return list(headers), cur.fetchall()
+
+# 按条件清理打印记录：分块删除，每块单独提交，块之间让出写锁，不阻塞工位打印
+PURGE_CHUNK = 2000
+
+def purge_filter(start=None, end=None, box_no=None, name=None):
+    """清理条件 -> (where, params)。start / end: 'YYYY-MM-DD' (含)；box_no / name 精确匹配"""
+    where, params = [], []
+    if start:
+        where.append("print_date >= ?"); params.append(f"{start} 00:00:00")
+    if end:
+        where.append("print_date <= ?"); params.append(f"{end} 23:59:59")
+    if box_no:
+        where.append("box_no = ?"); params.append(box_no)
+    if name:
+        where.append("name = ?"); params.append(name)
+    if not where: raise ValueError("至少需要一个清理条件")
+    return " AND ".join(where), params
+
+def op_count_purge(cur, filters):
+    where, params = purge_filter(**filters)
+    cur.execute(f"SELECT COUNT(*) FROM records WHERE {where}", params)
+    return cur.fetchone()[0]
+
+def count_purge(conn, **filters):
+    return op_count_purge(conn.cursor(), filters)
+
+def op_purge_chunk(cur, filters, chunk=PURGE_CHUNK):
+    """按条件删除一块记录，返回删除条数"""
+    where, params = purge_filter(**filters)
+    cur.execute(f"DELETE FROM records WHERE id IN (SELECT id FROM records WHERE {where} LIMIT ?)", params + [chunk])
+    return cur.rowcount
+
+def purge_records(conn, filters, chunk=PURGE_CHUNK, progress=None, cancelled=None, pause=0.01):
+    """
+    在 conn (写连接) 上按条件分块删除记录，返回删除条数。
+    box_summary 由删除触发器在同一事务内更新；progress(已删除数) 每块回调一次，cancelled() 为真时在块之间停止
+    """
+    purge_filter(**filters) # 条件为空时在开始前报错
+    total = 0
+    while not (cancelled and cancelled()):
+        n = op_purge_chunk(conn.cursor(), filters, chunk)
+        commit_local(conn)
+        total += n
+        if progress: progress(total)
+        if n < chunk: break
+        time.sleep(pause)
+    return total
 
 class Database:
     def __init__(self, db_name='label_printer.db'):
         self.db_name = os.path.abspath(db_name)
         # check_same_thread=False 允许在后台线程中使用此连接进行查询
-        self.conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        # ProfiledConnection 为每条语句计时，慢查询写入诊断目录 (DIAG_DIR) 下的 slow_queries.log
+        self.conn = sqlite3.connect(self.db_name, check_same_thread=False, factory=ProfiledConnection)
         
         # --- 核心性能优化区 ---
         try:
+            # 0. 新建的库启用增量回收 (必须在开启 WAL、建表之前设置)
+            # 删除记录留下的空闲页由空闲维护 (MaintenanceScheduler) 逐步归还给文件系统
+            if self.conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+                self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+
             # 1. 开启 WAL (Write-Ahead Logging) 模式
             # 作用：读写完全分离。当你在后台线程查询几百万条历史记录时，
             # 前台依然可以毫秒级写入新的打印记录，互不阻塞。
@@ -31,7 +338,17 @@ class Database:
             pass
             
         self.cursor = self.conn.cursor()
+        self.settings_cache = get_settings_cache(self.db_name)
+        self.catalog = get_product_catalog(self.db_name)
         self.setup_db()
+        self.apply_slow_query_setting()
+
+        # 客户端/服务器模式：配置了数据库服务地址时，热点读写转发给服务进程
+        self.remote = None
+        addr = os.environ.get("LABEL_DB_SERVER") or self.get_setting('db_server')
+        if addr:
+            from src.db_client import DbClient
+            self.remote = DbClient.from_address(addr, os.environ.get("LABEL_DB_TOKEN") or self.get_setting('db_token'))
 
     def setup_db(self):
         # 表结构定义
@@ -66,19 +383,28 @@ class Database:
             )
         ''')
         self.cursor.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)')
-        self.cursor.execute('CREATE TABLE IF NOT EXISTS box_counters (key TEXT PRIMARY KEY, current_val INTEGER)')
+        # 扫描预写日志：记录当前未封箱的 SN，程序崩溃/断电后可恢复
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scan_journal (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                station TEXT NOT NULL, product_id INTEGER NOT NULL,
+                batch TEXT, sn TEXT NOT NULL, scan_time TEXT
+            )
+        ''')
         
         # --- 索引优化：百万级数据查询的生命线 ---
         index_queries = [
-            "CREATE INDEX IF NOT EXISTS idx_records_sn ON records (sn)",
             "CREATE INDEX IF NOT EXISTS idx_records_box_no ON records (box_no)",
             "CREATE INDEX IF NOT EXISTS idx_records_print_date ON records (print_date)",
             "CREATE INDEX IF NOT EXISTS idx_records_name ON records (name)",
             "CREATE INDEX IF NOT EXISTS idx_products_name ON products (name)",
-            "CREATE INDEX IF NOT EXISTS idx_products_code69 ON products (code69)"
+            "CREATE INDEX IF NOT EXISTS idx_products_code69 ON products (code69)",
+            "CREATE INDEX IF NOT EXISTS idx_scan_journal_station ON scan_journal (station, product_id)"
         ]
         for q in index_queries:
             self.cursor.execute(q)
+        for q in MANIFEST_DDL:
+            self.cursor.execute(q)
 
         # 字段检查补全
         self._check_and_add_column('products', 'rule_id', 'INTEGER DEFAULT 0')
@@ -86,6 +412,10 @@ class Database:
         self._check_and_add_column('box_rules', 'rule_string', 'TEXT')
         # 新增：检查 records 表是否有 batch 字段，没有则添加
         self._check_and_add_column('records', 'batch', 'TEXT')
+
+        self._setup_summary()
+        self._setup_box_counters()
+        self._setup_sn_unique()
         
         # 初始化默认设置
         default_mapping_json = json.dumps(DEFAULT_MAPPING)
@@ -98,6 +428,67 @@ class Database:
         
         self.conn.commit()
 
+    def _setup_summary(self):
+        """
+        统计汇总表 + 触发器。首次创建时用已有记录回填；
+        建表、建触发器、回填在同一个写事务中完成，多个工位同时首次启动也不会漏算或重复
+        """
+        self.conn.commit()
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='box_summary'")
+            new_summary = self.cursor.fetchone() is None
+            for q in SUMMARY_DDL:
+                self.cursor.execute(q)
+            if new_summary:
+                self.cursor.execute(SUMMARY_BACKFILL)
+            self.cursor.execute("COMMIT")
+        except Exception:
+            self.cursor.execute("ROLLBACK")
+            raise
+
+    def _setup_box_counters(self):
+        """箱号计数表：新库直接建表，旧库 (字符串 key) 在同一个写事务内迁移"""
+        self.conn.commit()
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            n = migrate_box_counters(self.cursor)
+            self.cursor.execute(BOX_COUNTER_DDL)
+            self.cursor.execute("COMMIT")
+            if n: print(f"Migrated {n} box counters")
+        except Exception:
+            self.cursor.execute("ROLLBACK")
+            raise
+
+    def _setup_sn_unique(self):
+        """
+        records.sn 唯一索引。已有重复 SN 的旧库先把重复行移入 records_quarantine
+        (删除经触发器同步到汇总表)，再把普通索引换成唯一索引
+        """
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_records_sn_unique'")
+        if self.cursor.fetchone(): return
+        self.conn.commit()
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_records_sn ON records (sn)")
+            self.cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS dup_ids AS {DUPLICATE_SN_IDS}")
+            self.cursor.execute("SELECT COUNT(*) FROM temp.dup_ids")
+            n = self.cursor.fetchone()[0]
+            if n:
+                self.cursor.execute(QUARANTINE_DDL)
+                self.cursor.execute(f"INSERT OR REPLACE INTO records_quarantine (id, {RECORD_COLUMNS}, quarantined_at) "
+                                    f"SELECT id, {RECORD_COLUMNS}, datetime('now', 'localtime') FROM records "
+                                    "WHERE id IN (SELECT id FROM temp.dup_ids)")
+                self.cursor.execute("DELETE FROM records WHERE id IN (SELECT id FROM temp.dup_ids)")
+            self.cursor.execute("DROP TABLE temp.dup_ids")
+            self.cursor.execute("CREATE UNIQUE INDEX idx_records_sn_unique ON records (sn)")
+            self.cursor.execute("DROP INDEX IF EXISTS idx_records_sn")
+            self.cursor.execute("COMMIT")
+            if n: print(f"Quarantined {n} duplicate SN records")
+        except Exception:
+            self.cursor.execute("ROLLBACK")
+            raise
+
     def _check_and_add_column(self, table_name, column_name, column_type):
         try:
             self.cursor.execute(f"PRAGMA table_info({table_name})")
@@ -106,16 +497,47 @@ class Database:
         except: pass
 
     def get_setting(self, key):
-        self.cursor.execute("SELECT value FROM settings WHERE key=?", (key,))
-        r = self.cursor.fetchone()
-        if r and key == 'field_mapping':
-            try: return json.loads(r[0])
-            except: return DEFAULT_MAPPING
-        return r[0] if r else None
+        if key == 'field_mapping': return self.get_field_mapping()
+        return self.settings_cache.get(self.conn, key)
+
+    # --- 带类型的设置读取 (均走内存缓存) ---
+    def get_field_mapping(self):
+        return self.settings_cache.get_parsed(self.conn, 'field_mapping', parse_mapping)
+
+    def get_template_root(self):
+        return self.settings_cache.get(self.conn, 'template_root') or ""
+
+    def get_backup_path(self):
+        return self.settings_cache.get(self.conn, 'backup_path') or ""
+
+    def get_default_printer(self):
+        """返回默认打印机名称，使用系统默认时返回 None"""
+        return self.settings_cache.get_parsed(self.conn, 'default_printer', parse_printer)
+
+    def apply_slow_query_setting(self):
+        """设置项 slow_query_ms 优先于环境变量"""
+        try:
+            v = self.get_setting('slow_query_ms')
+            if v: query_stats.slow_ms = float(v)
+        except ValueError: pass
+
+    def get_catalog(self):
+        """返回已同步的产品目录 (只在产品有变更时才查询数据库)"""
+        return self.catalog.sync(self.conn)
 
     def set_setting(self, key, value):
         self.cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
-        self.conn.commit()
+        self.commit('settings')
+
+    def commit(self, *tables, ids=None):
+        """
+        提交事务，并向事件总线发布变更的表。
+        ids: 变更行的 id (可选)，为空表示整表可能变化
+        """
+        if self.conn.in_transaction:
+            commit_local(self.conn)
+        if tables:
+            event_bus.publish({t: (set(ids) if ids else None) for t in tables})
 
     def backup_db(self, custom_path=None, manual=True):
         try:
@@ -142,33 +564,165 @@ class Database:
             try: shutil.move(self.db_name, self.db_name+".old")
             except: pass
             shutil.copy2(path, self.db_name)
-            self.conn = sqlite3.connect(self.db_name)
+            self.conn = sqlite3.connect(self.db_name, factory=ProfiledConnection)
             
             # 恢复后重新开启 WAL
             try: self.conn.execute("PRAGMA journal_mode=WAL;")
             except: pass
             
             self.cursor = self.conn.cursor()
+            event_bus.publish({e: None for e in ENTITIES})
             return True, "恢复成功，请重启"
         except Exception as e: return False, str(e)
 
+    # ================= 热点读写 (服务模式下走数据库服务) =================
     def check_sn_exists(self, sn):
+        if self.remote: return self.remote.call('check_sn_exists', sn=sn)
         self.cursor.execute("SELECT 1 FROM records WHERE sn=? LIMIT 1", (sn,))
         return self.cursor.fetchone() is not None
 
+    def find_existing_sns(self, sns):
+        if self.remote: return set(self.remote.call('find_existing_sns', sns=list(sns)))
+        return op_find_existing_sns(self.conn.cursor(), sns)
+
     def get_box_counter(self, product_id, rule_id, year, month, repair_level=0):
-        key = f"P{product_id}_R{rule_id}_{year}_{month}_{repair_level}"
-        self.cursor.execute("SELECT current_val FROM box_counters WHERE key=?", (key,))
-        res = self.cursor.fetchone()
-        return res[0] if res else repair_level * 10000
+        if self.remote:
+            return self.remote.call('get_box_counter', product_id=product_id, rule_id=rule_id,
+                                    year=year, month=month, repair_level=repair_level)
+        return op_get_box_counter(self.cursor, product_id, rule_id, year, month, repair_level)
 
     def increment_box_counter(self, product_id, rule_id, year, month, repair_level=0):
-        key = f"P{product_id}_R{rule_id}_{year}_{month}_{repair_level}"
-        current = self.get_box_counter(product_id, rule_id, year, month, repair_level)
-        new_val = current + 1
-        self.cursor.execute("INSERT OR REPLACE INTO box_counters (key, current_val) VALUES (?, ?)", (key, new_val))
-        self.conn.commit()
-        return new_val
+        return self.reserve_box_counter(product_id, rule_id, year, month, repair_level, 1)
+
+    def list_box_counters(self, product_id=None, year=None, month=None):
+        if self.remote:
+            return [tuple(r) for r in self.remote.call('list_box_counters', product_id=product_id, year=year, month=month)]
+        return op_list_box_counters(self.conn.cursor(), product_id, year, month)
+
+    def reset_box_counters(self, keys):
+        keys = [tuple(k) for k in keys]
+        if self.remote:
+            n = self.remote.call('reset_box_counters', keys=keys)
+            event_bus.publish({'box_counters': None})
+            return n
+        n = op_reset_box_counters(self.cursor, keys)
+        self.commit('box_counters')
+        return n
+
+    def reserve_box_counter(self, product_id, rule_id, year, month, repair_level=0, count=1):
+        """
+        原子地将计数推进 count，返回预留的第一个流水号。
+        使用 BEGIN IMMEDIATE 加写锁，多工位同时预留也不会拿到重复的号段。
+        服务模式下计数在服务端共享，按本地的 产品ID/箱规ID 区分，各工位的产品表需一致 (见 db_server)。
+        """
+        if self.remote:
+            first = self.remote.call('reserve_box_counter', product_id=product_id, rule_id=rule_id,
+                                     year=year, month=month, repair_level=repair_level, count=count)
+            event_bus.publish({'box_counters': None})
+            return first
+        self.commit()
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            first = op_reserve_box_counter(self.cursor, product_id, rule_id, year, month, repair_level, count)
+            self.commit('box_counters')
+        except:
+            self.conn.rollback()
+            raise
+        return first
+
+    def release_box_counter(self, product_id, rule_id, year, month, repair_level, seq):
+        """打印失败时归还 reserve_box_counter 预留的单个流水号 (已被后续预留越过时不归还，留空号)"""
+        if self.remote:
+            ok = self.remote.call('release_box_counter', product_id=product_id, rule_id=rule_id,
+                                  year=year, month=month, repair_level=repair_level, seq=seq)
+            event_bus.publish({'box_counters': None})
+            return ok
+        self.commit()
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            ok = op_release_box_counter(self.cursor, product_id, rule_id, year, month, repair_level, seq)
+            self.commit('box_counters')
+        except:
+            self.conn.rollback()
+            raise
+        return ok
+
+    def insert_box_records(self, box_no, product, sns, batch, prod_date, print_date=None):
+        """写入一整箱的打印记录；有 SN 已打印过时整箱不写入，抛出 DuplicateSNError"""
+        now = print_date or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        p = product
+        rows = [(box_no, i+1, p.get('name'), p.get('spec'), p.get('model'), p.get('color'), p.get('code69'),
+                 sn, prod_date, now, batch) for i, sn in enumerate(sns)]
+        if self.remote:
+            try: n = self.remote.call('insert_records', rows=rows)
+            except Exception as e:
+                if getattr(e, 'sns', None): raise DuplicateSNError(e.sns)
+                raise
+            event_bus.publish({'records': None})
+            return n
+        # 先开写事务：否则 op_insert_records 的 SAVEPOINT 会自行开启并在 RELEASE 时直接提交，绕过 commit_local
+        self.commit()
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            op_insert_records(self.cursor, rows)
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.commit('records')
+        return len(rows)
+
+    def delete_box_records(self, box_no, sns):
+        if self.remote:
+            n = self.remote.call('delete_box_records', box_no=box_no, sns=list(sns))
+            event_bus.publish({'records': None})
+            return n
+        n = op_delete_box_records(self.cursor, box_no, sns)
+        self.commit('records')
+        return n
+
+    def search_records(self, keyword="", start=None, end=None, limit=1000, conn=None):
+        """历史记录查询；conn 可传入后台线程自己的只读连接"""
+        if self.remote:
+            return [tuple(r) for r in self.remote.call('search_records', keyword=keyword, start=start, end=end, limit=limit)]
+        return op_search_records((conn or self.conn).cursor(), keyword, start, end, limit)
+
+    def fetch_box_records(self, box_nos, conn=None):
+        if self.remote:
+            res = self.remote.call('fetch_box_records', box_nos=list(box_nos))
+            return {k: [tuple(r) for r in v] for k, v in res.items()}
+        return op_fetch_box_records((conn or self.conn).cursor(), box_nos)
+
+    def count_daily_boxes(self, params, conn=None):
+        if self.remote: return self.remote.call('count_daily_boxes', params=list(params))
+        return op_count_daily_boxes((conn or self.conn).cursor(), params)
+
+    def run_summary(self, conn=None, **kwargs):
+        if self.remote:
+            headers, rows = self.remote.call('run_summary', **kwargs)
+            return headers, [tuple(r) for r in rows]
+        return op_run_summary((conn or self.conn).cursor(), **kwargs)
+
+    def delete_records(self, ids, conn=None):
+        """按 id 删除记录；conn 为后台线程的写连接 (由调用方提交并发布 records 变更)"""
+        if self.remote: return self.remote.call('delete_records', ids=list(ids))
+        return op_delete_records((conn or self.conn).cursor(), ids)
+
+    def count_purge(self, filters, conn=None):
+        if self.remote: return self.remote.call('count_purge', filters=filters)
+        return op_count_purge((conn or self.conn).cursor(), filters)
+
+    def purge_records(self, filters, conn=None, progress=None, cancelled=None, pause=0.01):
+        """按条件分块清理；服务模式下每块一个请求，由服务端的写线程执行"""
+        if not self.remote: return purge_records(conn or self.conn, filters, progress=progress, cancelled=cancelled, pause=pause)
+        purge_filter(**filters)
+        total = 0
+        while not (cancelled and cancelled()):
+            n = self.remote.call('purge_chunk', filters=filters, chunk=PURGE_CHUNK)
+            total += n
+            if progress: progress(total)
+            if n < PURGE_CHUNK: break
+            time.sleep(pause)
+        return total
 
     def close(self):
         self.conn.close()
@@ -0,0 +1,73 @@
+import json
+import socket
+import threading
+
+class DbServerError(Exception):
+    """数据库服务返回的业务错误；sns: SN 冲突时服务端返回的冲突 SN"""
+    def __init__(self, msg, sns=None):
+        super().__init__(msg)
+        self.sns = sns
+
+class DbClient:
+    """
+    数据库服务客户端。
+    协议：每行一个 JSON 请求 {"op", "args", "token"}，服务端每行回一个 {"ok", "result"/"error"}。
+    同一连接上的请求串行发送 (加锁)；只读请求在连接断开时自动重连重试一次，
+    写请求不重试 (无法确定服务端是否已执行)，直接把错误抛给调用方。
+    """
+    RETRY_OPS = {"check_sn_exists", "find_existing_sns", "get_box_counter", "list_box_counters", "search_records",
+                 "fetch_box_records", "count_daily_boxes", "run_summary", "count_purge"}
+
+    def __init__(self, host="127.0.0.1", port=8766, timeout=10, token=None):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.token = token or ""
+        self._sock = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_address(cls, addr, token=None):
+        """addr 形如 "host:port" 或 "port\""""
+        host, _, port = addr.strip().rpartition(":")
+        return cls(host or "127.0.0.1", int(port), token=token)
+
+    def _connect(self):
+        self.close()
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rwb")
+
+    def _roundtrip(self, data):
+        if not self._file: self._connect()
+        self._file.write(data)
+        self._file.flush()
+        line = self._file.readline()
+        if not line: raise ConnectionError("数据库服务已断开")
+        return line
+
+    def call(self, op, **args):
+        data = (json.dumps({"op": op, "args": args, "token": self.token}, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            try:
+                line = self._roundtrip(data)
+            except (OSError, ConnectionError):
+                if op not in self.RETRY_OPS:
+                    self.close()
+                    raise
+                # 服务重启等情况：重连后再试一次
+                self._connect()
+                line = self._roundtrip(data)
+        resp = json.loads(line.decode("utf-8"))
+        if not resp.get("ok"):
+            raise DbServerError(resp.get("error", "未知错误"), resp.get("sns"))
+        return resp.get("result")
+
+    def close(self):
+        for f in (self._file, self._sock):
+            try:
+                if f: f.close()
+            except: pass
+        self._file = None
+        self._sock = None
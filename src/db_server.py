@@ -0,0 +1,206 @@
+"""
+数据库服务进程 (多工位部署时可选)。
+
+由一个进程独占 label_printer.db：所有写操作进入单一写线程并批量提交，
+读操作使用只读连接池并发执行。各工位通过 TCP (每行一个 JSON) 调用，
+避免多台电脑经共享文件夹同时锁 SQLite 文件。
+
+启动: python -m src.db_server --db label_printer.db --host 0.0.0.0 --port 8766 --token 共享口令
+工位端设置环境变量 LABEL_DB_SERVER=服务器IP:8766 (或在设置中填写 db_server)，
+口令填 LABEL_DB_TOKEN (或设置中的 db_token)。
+协议本身不加密，口令只用来挡住局域网内未配置的电脑：每个请求都带口令，服务端核对不一致即拒绝。
+监听本机以外的地址时必须设置口令 (也可用环境变量 LABEL_DB_TOKEN)，否则拒绝启动。
+
+打印记录和箱号计数在服务端共享，产品、箱号规则仍在各工位本地库中，
+计数按 (产品ID, 箱规ID, 年, 月, 返修等级) 区分：各工位的产品表、箱号规则表必须一致 (ID 相同)，
+通常在一台电脑上配置好后把 label_printer.db 复制到其他工位；之后增删产品也要同步到所有工位。
+"""
+import argparse
+import hmac
+import json
+import os
+import queue
+import socketserver
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+from src.database import (Database, op_get_box_counter, op_reserve_box_counter, op_release_box_counter, op_find_existing_sns,
+                          op_insert_records, op_search_records, op_list_box_counters, op_reset_box_counters,
+                          op_delete_box_records, op_fetch_box_records, op_count_daily_boxes, op_run_summary,
+                          op_count_purge, op_delete_records, op_purge_chunk, DuplicateSNError)
+from src.query_log import ProfiledConnection, query_stats
+from src.maintenance import MaintenanceScheduler
+
+def _check_sn_exists(cur, sn):
+    cur.execute("SELECT 1 FROM records WHERE sn=? LIMIT 1", (sn,))
+    return cur.fetchone() is not None
+
+def _find_existing_sns(cur, sns):
+    return sorted(op_find_existing_sns(cur, sns))
+
+READ_OPS = {
+    "check_sn_exists": _check_sn_exists,
+    "find_existing_sns": _find_existing_sns,
+    "get_box_counter": op_get_box_counter,
+    "list_box_counters": op_list_box_counters,
+    "search_records": op_search_records,
+    "fetch_box_records": op_fetch_box_records,
+    "count_daily_boxes": op_count_daily_boxes,
+    "run_summary": op_run_summary,
+    "count_purge": op_count_purge,
+}
+WRITE_OPS = {
+    "reserve_box_counter": op_reserve_box_counter,
+    "release_box_counter": op_release_box_counter,
+    "reset_box_counters": op_reset_box_counters,
+    "insert_records": op_insert_records,
+    "delete_box_records": op_delete_box_records,
+    "delete_records": op_delete_records,
+    "purge_chunk": op_purge_chunk,
+}
+
+class ReadPool:
+    """只读连接池"""
+    def __init__(self, db_path, size=4):
+        self._pool = queue.Queue()
+        for _ in range(size):
+            conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False, factory=ProfiledConnection)
+            self._pool.put(conn)
+
+    def run(self, fn, args):
+        conn = self._pool.get()
+        try:
+            return fn(conn.cursor(), **args)
+        finally:
+            self._pool.put(conn)
+
+class SingleWriter:
+    """
+    单一写线程：把队列中积压的写请求放进同一个事务 (组提交)，
+    每个请求用 SAVEPOINT 隔离，某一请求失败只回滚它自己。
+    """
+    MAX_BATCH = 200
+    BATCH_WAIT = 0.002
+    IDLE_MAINTENANCE = 10 # 写队列空闲这么久 (秒) 后执行一个维护时间片
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="DbWriter", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, args):
+        fut = Future()
+        self._queue.put((fn, args, fut))
+        return fut
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None, factory=ProfiledConnection)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        cur = conn.cursor()
+        maintenance = MaintenanceScheduler(self.db_path)
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.IDLE_MAINTENANCE)]
+            except queue.Empty:
+                try: maintenance.run_slice(conn)
+                except Exception as e: print(f"Maintenance Error: {e}")
+                continue
+            try:
+                while len(batch) < self.MAX_BATCH:
+                    batch.append(self._queue.get(timeout=self.BATCH_WAIT))
+            except queue.Empty:
+                pass
+
+            results = []
+            try:
+                cur.execute("BEGIN IMMEDIATE")
+                for fn, args, fut in batch:
+                    cur.execute("SAVEPOINT op")
+                    try:
+                        results.append((fut, fn(cur, **args), None))
+                        cur.execute("RELEASE op")
+                    except Exception as e:
+                        cur.execute("ROLLBACK TO op")
+                        cur.execute("RELEASE op")
+                        results.append((fut, None, e))
+                cur.execute("COMMIT")
+            except Exception as e:
+                # 整批提交失败：所有请求都报错
+                try: cur.execute("ROLLBACK")
+                except: pass
+                results = [(fut, None, e) for _, _, fut in batch]
+
+            for fut, res, err in results:
+                if err is None: fut.set_result(res)
+                else: fut.set_exception(err)
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        for line in self.rfile:
+            try:
+                req = json.loads(line.decode("utf-8"))
+                op, args = req.get("op"), req.get("args") or {}
+                if server.token and not hmac.compare_digest(str(req.get("token") or ""), server.token):
+                    raise PermissionError("数据库服务口令错误")
+                if op in WRITE_OPS:
+                    result = server.writer.submit(WRITE_OPS[op], args).result()
+                elif op in READ_OPS:
+                    result = server.readers.run(READ_OPS[op], args)
+                else:
+                    raise ValueError(f"unknown op: {op}")
+                resp = {"ok": True, "result": result}
+            except DuplicateSNError as e:
+                resp = {"ok": False, "error": str(e), "sns": e.sns}
+            except Exception as e:
+                resp = {"ok": False, "error": str(e)}
+            self.wfile.write((json.dumps(resp, ensure_ascii=False) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+class DbServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    LOOPBACK = ("127.0.0.1", "localhost", "::1")
+
+    def __init__(self, db_path, host="127.0.0.1", port=8766, readers=4, token=None):
+        # 没有口令时只允许本机访问：协议没有其他认证，局域网内任何电脑都能调用删除/清理等写操作
+        if not token and host not in self.LOOPBACK:
+            raise ValueError(f"监听 {host} 需要设置口令 (--token 或环境变量 LABEL_DB_TOKEN)")
+        self.token = token or ""
+        # 用 Database 建表/补字段，保证表结构与工位端一致
+        db = Database(db_path)
+        self.db_path = db.db_name
+        db.close()
+        self.writer = SingleWriter(self.db_path)
+        self.readers = ReadPool(self.db_path, readers)
+        super().__init__((host, port), _Handler)
+
+def main():
+    ap = argparse.ArgumentParser(description="LabelPrinter 数据库服务")
+    ap.add_argument("--db", default="label_printer.db")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8766)
+    ap.add_argument("--readers", type=int, default=4)
+    ap.add_argument("--token", default=os.environ.get("LABEL_DB_TOKEN"), help="工位访问口令 (监听本机以外的地址时必填)")
+    ap.add_argument("--slow-ms", type=float, default=None, help="慢查询阈值 (毫秒)")
+    args = ap.parse_args()
+    if args.slow_ms: query_stats.slow_ms = args.slow_ms
+    try:
+        srv = DbServer(args.db, args.host, args.port, args.readers, args.token)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(f"DB server: {srv.db_path} on {args.host}:{srv.server_address[1]}")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+        print(f"SQL stats: {query_stats.dump()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# 可被订阅的数据实体 (与表名一致)
+ENTITIES = ('products', 'box_rules', 'sn_rules', 'settings', 'records', 'box_counters')
+
+class EventBus:
+    """
+    进程内数据变更总线。
+    Database 每次提交写操作时发布变更的实体，页面据此只刷新真正改变的部分。
+    事件格式: {表名: 变更的 id 集合 或 None(整表)}
+    """
+    def __init__(self):
+        self._subs = []
+        self._commit_hooks = []
+        self.local_commits = 0
+
+    def subscribe(self, callback, entities=None):
+        """entities 为空表示订阅全部实体"""
+        self._subs.append((callback, set(entities) if entities else None))
+
+    def unsubscribe(self, callback):
+        self._subs = [s for s in self._subs if s[0] != callback]
+
+    def watch_local_commits(self, before, after):
+        """before()/after() 在本进程的连接提交写事务前后调用 (可能来自工作线程)"""
+        self._commit_hooks.append((before, after))
+
+    def unwatch_local_commits(self, before):
+        self._commit_hooks = [h for h in self._commit_hooks if h[0] != before]
+
+    def before_local_commit(self):
+        for before, _ in list(self._commit_hooks): before()
+
+    def note_local_commit(self):
+        self.local_commits += 1
+        for _, after in list(self._commit_hooks): after()
+
+    def publish(self, changes, external=False):
+        if not changes: return
+        for cb, wanted in list(self._subs):
+            hit = changes if wanted is None else {k: v for k, v in changes.items() if k in wanted}
+            if not hit: continue
+            try: cb(hit)
+            except Exception as e: print(f"Event Callback Error: {e}")
+
+# 全进程共享一个总线
+event_bus = EventBus()
+
+@contextmanager
+def local_write(bus=event_bus):
+    """包住本进程连接上的提交 (或自动提交的写操作)，让 DataVersionWatcher 不把它当作外部修改"""
+    bus.before_local_commit()
+    try: yield
+    finally: bus.note_local_commit()
+
+def commit_local(conn, bus=event_bus):
+    with local_write(bus): conn.commit()
+
+class ChangeTracker:
+    """
+    页面侧的脏标记收集器：订阅关心的实体，切换到页面时一次性取出累计的变更。
+    """
+    def __init__(self, entities, bus=event_bus):
+        self.changes = {}
+        bus.subscribe(self._on_change, entities)
+
+    def _on_change(self, changes):
+        for k, ids in changes.items():
+            if k in self.changes and self.changes[k] is None: continue
+            if ids is None: self.changes[k] = None
+            else: self.changes.setdefault(k, set()).update(ids)
+
+    def take(self):
+        c = self.changes
+        self.changes = {}
+        return c
+
+class DataVersionWatcher:
+    """
+    通过 PRAGMA data_version 轮询检测其他进程 (其他工位) 对数据库的修改，发现后发布全部实体的变更。
+    data_version 在监视连接以外的任何连接提交后都会变化 (包括本进程的其他连接)，
+    所以本进程每次提交前后 (local_write) 各读一次：提交前已经变了说明期间有外部修改，记为待发布；
+    提交后的值作为新的基准。轮询时与基准不同或有待发布的外部修改即发布。
+    """
+    def __init__(self, db_path, bus=event_bus):
+        self.bus = bus
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock() # 提交钩子可能来自工作线程
+        self._version = self._read_version()
+        self._pending = False
+        bus.watch_local_commits(self._before_local, self._after_local)
+
+    def _read_version(self):
+        try: return self.conn.execute("PRAGMA data_version").fetchone()[0]
+        except: return None
+
+    def _before_local(self):
+        with self._lock:
+            v = self._read_version()
+            if v is not None and v != self._version: self._pending = True
+
+    def _after_local(self):
+        with self._lock:
+            v = self._read_version()
+            if v is not None: self._version = v
+
+    def poll(self):
+        with self._lock:
+            v = self._read_version()
+            changed = self._pending or (v is not None and v != self._version)
+            if v is not None: self._version = v
+            self._pending = False
+        if changed:
+            self.bus.publish({e: None for e in ENTITIES}, external=True)
+            return True
+        return False
+
+    def close(self):
+        self.bus.unwatch_local_commits(self._before_local)
+        try: self.conn.close()
+        except: pass
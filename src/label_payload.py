@@ -0,0 +1,74 @@
+import os
+from collections import OrderedDict
+
+# 产品的静态字段 (同一产品每箱都一样)
+STATIC_FIELDS = ('name', 'spec', 'model', 'color', 'sn4', 'sku', 'code69', 'weight')
+# 每箱变化的字段
+BOX_FIELDS = ('box_no', 'qty', 'prod_date')
+
+def resolve_template_path(root, tmpl):
+    """模板在数据库中只存文件名，打印时拼接模板根目录"""
+    return os.path.join(root, tmpl) if root and tmpl else (tmpl or "")
+
+class LabelPayload:
+    """
+    编译好的标签数据模板。
+    产品静态字段按字段映射预先换算成模板变量名，SN 槽位键 ("1".."qty") 也预先生成，
+    打印每一箱时只需填入箱号、SN、日期、数量。
+    """
+    __slots__ = ('static', 'box_keys', 'slot_keys', 'template_path')
+
+    def __init__(self, product, mapping, template_path=""):
+        src = {f: product.get(f) for f in STATIC_FIELDS}
+        code69 = str(product.get('code69') or '').strip()
+        src['code69'] = code69
+
+        self.static = {}
+        self.box_keys = []
+        for k, v in mapping.items():
+            if k in BOX_FIELDS: self.box_keys.append((k, v))
+            elif k in src: self.static[v] = src[k]
+
+        # 兼容旧模板：总是提供 Code69 / 69码 两个变量
+        self.static.setdefault("Code69", code69)
+        self.static.setdefault("69码", code69)
+
+        try: qty = int(product.get('qty') or 0)
+        except (TypeError, ValueError): qty = 0
+        self.slot_keys = [str(i + 1) for i in range(qty)]
+        self.template_path = template_path
+
+    def build(self, box_no, sns, prod_date, qty=None):
+        """
+        生成 BarTender 数据字典。
+        sns: 本箱 SN 列表；qty 为空时取 SN 个数；空余槽位填空字符串
+        """
+        dat = dict(self.static)
+        if self.box_keys:
+            vals = {'box_no': box_no, 'qty': len(sns) if qty is None else qty, 'prod_date': prod_date}
+            for k, v in self.box_keys: dat[v] = vals[k]
+
+        keys = self.slot_keys
+        n = len(sns)
+        if n > len(keys):
+            keys = keys + [str(i + 1) for i in range(len(keys), n)]
+        for i, key in enumerate(keys):
+            dat[key] = sns[i] if i < n else ""
+        return dat
+
+_cache = OrderedDict()
+_CACHE_SIZE = 256
+
+def get_label_payload(product, mapping, template_root=""):
+    """按 (产品, 字段映射, 模板) 缓存编译结果，相同组合只编译一次"""
+    tmpl = product.get('template_path') or ""
+    key = (product.get('id'), product.get('qty'), tuple(product.get(f) for f in STATIC_FIELDS),
+           tuple(mapping.items()), template_root, tmpl)
+    payload = _cache.get(key)
+    if payload is None:
+        payload = LabelPayload(product, mapping, resolve_template_path(template_root, tmpl))
+        _cache[key] = payload
+        if len(_cache) > _CACHE_SIZE: _cache.popitem(last=False)
+    else:
+        _cache.move_to_end(key)
+    return payload
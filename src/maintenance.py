@@ -0,0 +1,66 @@
+import os
+import time
+from src.metrics import metrics
+from src.events import local_write
+
+class MaintenanceScheduler:
+    """
+    数据库空闲维护 (在两箱之间的空闲时段调用)。
+    每次 run_slice() 最多执行一项任务，且每项任务都有时间/规模上限，不会拖慢打印：
+      1. WAL 检查点：-wal 文件超过阈值时 PASSIVE 检查点，已全部回写则 TRUNCATE 把文件截断为 0
+      2. PRAGMA optimize：按间隔刷新统计信息 (analysis_limit 限制 ANALYZE 的扫描量)
+      3. 增量回收：auto_vacuum=INCREMENTAL 的库，每次只回收少量空闲页
+    conn 由调用方提供 (后台线程的写连接)，调用方可用 conn.interrupt() 随时中断。
+    """
+    WAL_CHECKPOINT_BYTES = 4 * 1024 * 1024
+    OPTIMIZE_INTERVAL = 4 * 3600 # 秒
+    ANALYSIS_LIMIT = 400
+    VACUUM_STEP_PAGES = 64
+    SLICE_SECONDS = 0.2
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.last_optimize = 0.0
+
+    def wal_size(self):
+        try: return os.path.getsize(self.db_path + "-wal")
+        except OSError: return 0
+
+    def run_slice(self, conn, budget=None):
+        """执行一个维护时间片，返回执行的任务名；无事可做时返回 None"""
+        budget = self.SLICE_SECONDS if budget is None else budget
+
+        if self.wal_size() >= self.WAL_CHECKPOINT_BYTES:
+            with metrics.span("maint.checkpoint"):
+                busy, log, done = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+                # 所有帧都已回写 (没有读者卡住) 时才截断，截断本身几乎不耗时
+                if busy == 0 and log == done:
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            return "checkpoint"
+
+        if time.time() - self.last_optimize >= self.OPTIMIZE_INTERVAL:
+            with metrics.span("maint.optimize"), local_write():
+                conn.execute(f"PRAGMA analysis_limit={self.ANALYSIS_LIMIT}")
+                conn.execute("PRAGMA optimize")
+            self.last_optimize = time.time()
+            return "optimize"
+
+        # 2 = INCREMENTAL
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2 and conn.execute("PRAGMA freelist_count").fetchone()[0]:
+            deadline = time.perf_counter() + budget
+            with metrics.span("maint.incremental_vacuum"), local_write():
+                while time.perf_counter() < deadline:
+                    conn.execute(f"PRAGMA incremental_vacuum({self.VACUUM_STEP_PAGES})").fetchall()
+                    if not conn.execute("PRAGMA freelist_count").fetchone()[0]: break
+            return "vacuum"
+        return None
+
+def enable_incremental_vacuum(conn):
+    """
+    把已有数据库切换为 auto_vacuum=INCREMENTAL (需要一次完整 VACUUM，耗时与库大小成正比)。
+    之后删除记录留下的空间由 MaintenanceScheduler 在空闲时逐步回收。
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2: return False
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
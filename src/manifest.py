@@ -0,0 +1,195 @@
+"""
+装箱清单模式：客户预先提供 SN -> 箱 的对应表 (Excel / CSV)。
+整份文件一次写入暂存表 manifest_items，SN 规则校验在导入时完成，与打印记录的查重用一条集合查询；
+之后要么按箱自动打印，要么把清单载入内存 (ManifestSession)，扫描时只做哈希查找、不再逐个查库。
+"""
+import csv
+import datetime
+import os
+
+from src.sn_rules import clean_sn
+
+MANIFEST_STATUS = {'ok': "待装箱", 'bad': "不符合SN规则", 'printed': "已打印过", 'done': "已装箱"}
+
+# 表头识别 (小写后包含即可)
+_SN_HEADERS = ('sn', '序列号', '串号', 'serial', 'imei')
+_CARTON_HEADERS = ('箱号', '外箱', '箱', 'carton', 'ctn', 'box', 'case', 'pallet')
+
+def _find_col(header, keys, skip=None):
+    """表头列号；SN 数据本身几乎都带数字，带数字的单元格不当作表头"""
+    for i, cell in enumerate(header):
+        if i == skip or any(ch.isdigit() for ch in cell): continue
+        if any(k in cell.lower() for k in keys): return i
+    return None
+
+def read_manifest_file(path, qty=0):
+    """
+    读取清单文件，返回 [(清单箱号, SN)] (文件顺序)。
+    有表头时按列名识别 箱号列/SN列；没有表头时第一列为箱号、第二列为 SN。
+    只有 SN 一列时按整箱数 qty 依次分箱
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.xlsx', '.xls'):
+        import pandas as pd
+        df = pd.read_excel(path, header=None, dtype=str).fillna("")
+        rows = df.values.tolist()
+    else:
+        with open(path, encoding="utf-8-sig", errors="replace", newline="") as f:
+            text = f.read()
+        delim = "\t" if "\t" in text.split("\n", 1)[0] else ","
+        rows = list(csv.reader(text.splitlines(), delimiter=delim))
+    rows = [[str(c).strip() for c in r] for r in rows if any(str(c).strip() for c in r)]
+    if not rows: return []
+
+    sn_col = _find_col(rows[0], _SN_HEADERS)
+    if sn_col is not None:
+        carton_col = _find_col(rows[0], _CARTON_HEADERS, skip=sn_col)
+        rows = rows[1:]
+    elif len(rows[0]) >= 2:
+        carton_col, sn_col = 0, 1
+    else:
+        carton_col, sn_col = None, 0
+
+    if carton_col is None:
+        if not qty or qty <= 0: raise ValueError("清单中没有箱号列，且产品未设置整箱数")
+        sns = [r[sn_col] for r in rows if len(r) > sn_col and r[sn_col]]
+        return [(str(i // qty + 1), sn) for i, sn in enumerate(sns)]
+    return [(r[carton_col], r[sn_col]) for r in rows if len(r) > max(carton_col, sn_col)]
+
+def load_manifest(conn, name, product_id, batch, rows, validate):
+    """
+    清单写入暂存表 (不提交，由调用方提交)，返回 (manifest_id, 文件内重复的SN)。
+    validate(sn) -> (ok, msg) 为当前产品的 SN 规则校验；同一 SN 在文件中出现多次时只保留第一次
+    """
+    items, seen, dups, cartons = [], set(), [], set()
+    for carton, sn in rows:
+        sn = clean_sn(sn).upper()
+        carton = carton.strip()
+        if not sn or not carton: continue
+        if sn in seen:
+            dups.append(sn)
+            continue
+        seen.add(sn)
+        cartons.add(carton)
+        items.append((sn, carton, len(items), 'ok' if validate(sn)[0] else 'bad'))
+
+    cur = conn.cursor()
+    cur.execute("INSERT INTO manifests (file, product_id, batch, created_at, cartons, units) VALUES (?,?,?,?,?,?)",
+                (name, product_id, batch, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), len(cartons), len(items)))
+    mid = cur.lastrowid
+    cur.executemany("INSERT INTO manifest_items (manifest_id, sn, carton, line, status) VALUES (?,?,?,?,?)",
+                    [(mid,) + i for i in items])
+    return mid, dups
+
+def manifest_sns(conn, manifest_id, status='ok'):
+    return [r[0] for r in conn.execute("SELECT sn FROM manifest_items WHERE manifest_id=? AND status=?",
+                                       (manifest_id, status))]
+
+def mark_printed(conn, manifest_id, existing=None):
+    """
+    把已有打印记录的 SN 标为 printed，返回条数。
+    本地库一条 UPDATE ... EXISTS 完成 (走 records.sn 唯一索引)；
+    服务模式下打印记录不在本地，由调用方传入已存在的 SN 集合 (Database.find_existing_sns)
+    """
+    cur = conn.cursor()
+    if existing is None:
+        cur.execute("UPDATE manifest_items SET status='printed' WHERE manifest_id=? AND status='ok' "
+                    "AND EXISTS (SELECT 1 FROM records r WHERE r.sn = manifest_items.sn)", (manifest_id,))
+        return cur.rowcount
+    cur.executemany("UPDATE manifest_items SET status='printed' WHERE manifest_id=? AND sn=? AND status='ok'",
+                    [(manifest_id, sn) for sn in existing])
+    return len(existing)
+
+class ManifestSession:
+    """
+    内存中的清单：SN -> 清单箱号 的哈希表。扫描核对与自动打印都只查这里，
+    装箱完成后 mark_done 把实际箱号写回暂存表
+    """
+    def __init__(self, manifest_id, name, product_id, batch, items, dups=()):
+        self.id = manifest_id
+        self.name = name
+        self.product_id = product_id
+        self.batch = batch
+        self.dups = list(dups) # 文件内重复的 SN (导入时丢弃)
+        self.cartons = {} # {清单箱号: [SN, ...]} (文件顺序)
+        self.carton_of = {}
+        self.status = {}
+        self.box_no = {} # {清单箱号: 实际打印的箱号}
+        for sn, carton, status, box_no in items:
+            self.cartons.setdefault(carton, []).append(sn)
+            self.carton_of[sn] = carton
+            self.status[sn] = status
+            if box_no: self.box_no[carton] = box_no
+
+    @classmethod
+    def load(cls, conn, manifest_id, dups=()):
+        row = conn.execute("SELECT file, product_id, batch FROM manifests WHERE id=?", (manifest_id,)).fetchone()
+        if not row: return None
+        items = conn.execute("SELECT sn, carton, status, box_no FROM manifest_items WHERE manifest_id=? ORDER BY line",
+                             (manifest_id,)).fetchall()
+        return cls(manifest_id, row[0], row[1], row[2], items, dups)
+
+    def carton_state(self, carton):
+        """ready 可装箱 / done 已完成 / blocked 含有不可用的SN"""
+        states = {self.status[sn] for sn in self.cartons[carton]}
+        if states == {'ok'}: return 'ready'
+        if states == {'done'}: return 'done'
+        return 'blocked'
+
+    def ready_cartons(self):
+        return [c for c in self.cartons if self.carton_state(c) == 'ready']
+
+    def summary(self):
+        units = {}
+        for st in self.status.values(): units[st] = units.get(st, 0) + 1
+        cartons = {}
+        for c in self.cartons:
+            st = self.carton_state(c)
+            cartons[st] = cartons.get(st, 0) + 1
+        return {"cartons": len(self.cartons), "units": len(self.status), "unit_status": units,
+                "carton_status": cartons, "dups": len(self.dups)}
+
+    def format_summary(self):
+        s = self.summary()
+        cs = s['carton_status']
+        lines = [f"清单: {self.name}",
+                 f"共 {s['cartons']} 箱 / {s['units']} 个SN",
+                 f"可装箱 {cs.get('ready', 0)} 箱，已完成 {cs.get('done', 0)} 箱，有问题 {cs.get('blocked', 0)} 箱"]
+        for st in ('bad', 'printed'):
+            if s['unit_status'].get(st): lines.append(f"    {MANIFEST_STATUS[st]}: {s['unit_status'][st]} 个SN")
+        if s['dups']: lines.append(f"    清单内重复: {s['dups']} 个SN (已忽略)")
+        return "\n".join(lines)
+
+    def blocked_detail(self, limit=20):
+        """有问题的箱及原因，用于提示"""
+        out = []
+        for c in self.cartons:
+            if self.carton_state(c) != 'blocked': continue
+            bad = [f"{sn} {MANIFEST_STATUS[self.status[sn]]}" for sn in self.cartons[c] if self.status[sn] not in ('ok', 'done')]
+            out.append(f"{c}: " + "，".join(bad[:3]) + (" ..." if len(bad) > 3 else ""))
+            if len(out) >= limit: break
+        return out
+
+    def check(self, sn, current_carton=None):
+        """扫描核对 (纯内存)，返回 (ok, msg)；current_carton 为当前箱已扫入SN所属的清单箱号"""
+        carton = self.carton_of.get(sn)
+        if carton is None: return False, "不在装箱清单中"
+        st = self.status[sn]
+        if st != 'ok': return False, MANIFEST_STATUS[st]
+        if current_carton and carton != current_carton:
+            return False, f"属于清单箱 {carton}，当前箱为 {current_carton}"
+        return True, ""
+
+    def mark_done(self, conn, carton, box_no):
+        """一箱打印完成后记录实际箱号 (不提交)"""
+        conn.execute("UPDATE manifest_items SET status='done', box_no=? WHERE manifest_id=? AND carton=? AND status='ok'",
+                     (box_no, self.id, carton))
+        for sn in self.cartons[carton]:
+            if self.status[sn] == 'ok': self.status[sn] = 'done'
+        self.box_no[carton] = box_no
+
+    def mark_printed(self, conn, sns):
+        """封箱写入时发现已打印过的 SN (其他工位刚打印)，整箱改为有问题 (不提交)"""
+        mark_printed(conn, self.id, sns)
+        for sn in sns:
+            if self.status.get(sn) == 'ok': self.status[sn] = 'printed'
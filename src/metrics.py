@@ -0,0 +1,104 @@
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from src.config import DIAG_DIR, get_station_id
+
+class LatencyHistogram:
+    """
+    单个阶段的耗时统计。
+    保留最近 SAMPLES 个样本计算 p50/p95/p99 (反映当前状况，不被几天前的数据稀释)，
+    同时累计总次数、总耗时和最大值。
+    """
+    SAMPLES = 4096
+    __slots__ = ('samples', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.samples = deque(maxlen=self.SAMPLES)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max: self.max = seconds
+
+    def summary(self):
+        s = sorted(self.samples)
+        pick = lambda q: s[min(len(s) - 1, int(q * len(s)))] * 1000 if s else 0.0
+        return {
+            "count": self.count,
+            "avg_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99),
+            "max_ms": self.max * 1000,
+        }
+
+class Metrics:
+    """
+    进程内耗时统计 (扫码 -> 出标签 各阶段)。
+    用法:
+        with metrics.span("bt.print"): ...
+        metrics.record("scan_to_label", seconds)
+    """
+    def __init__(self, station=None):
+        self.station = station or get_station_id()
+        self._hists = {}
+        self._lock = threading.Lock() # 打印/查询可能在工作线程中计时
+        self._logger = None
+
+    def record(self, name, seconds):
+        with self._lock:
+            h = self._hists.get(name)
+            if h is None: h = self._hists[name] = LatencyHistogram()
+            h.add(seconds)
+
+    @contextmanager
+    def span(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t0)
+
+    def snapshot(self):
+        """返回 [(阶段名, 统计字典)]，按名称排序"""
+        with self._lock:
+            return [(k, self._hists[k].summary()) for k in sorted(self._hists)]
+
+    def reset(self):
+        with self._lock:
+            self._hists = {}
+
+    def export(self, path=None, max_bytes=1024 * 1024, backups=5):
+        """
+        追加一行 JSON 到本地指标文件 (按大小滚动)。
+        默认文件: 诊断目录 (DIAG_DIR) 下的 metrics_<工位>.jsonl
+        """
+        snap = self.snapshot()
+        if not snap: return
+        try:
+            if self._logger is None:
+                path = path or os.path.join(DIAG_DIR, f"metrics_{self.station}.jsonl")
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger = logging.getLogger(f"label_metrics.{self.station}")
+                logger.propagate = False
+                logger.setLevel(logging.INFO)
+                logger.addHandler(handler)
+                self._logger = logger
+            line = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "station": self.station,
+                    "stages": {k: {n: round(v, 2) for n, v in s.items()} for k, s in snap}}
+            self._logger.info(json.dumps(line, ensure_ascii=False))
+        except Exception as e:
+            print(f"Metrics Export Error: {e}")
+
+# 全进程共享
+metrics = Metrics()
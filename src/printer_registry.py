@@ -0,0 +1,100 @@
+import threading
+import time
+
+# win32print 的 PRINTER_STATUS_* / PRINTER_ATTRIBUTE_* 取值
+_STATUS_TEXT = [
+    (0x00000080, "脱机"), (0x00001000, "不可用"), (0x00000002, "错误"), (0x00000001, "已暂停"),
+    (0x00000010, "缺纸"), (0x00000008, "卡纸"), (0x00400000, "门已打开"), (0x00000400, "需要人工处理"),
+    (0x00040000, "缺碳带/墨粉"),
+]
+# 出现这些状态时直接判定无法打印
+_FATAL_STATUS = 0x00000080 | 0x00001000 | 0x00000002 | 0x00000010 | 0x00000008 | 0x00400000
+_ATTR_WORK_OFFLINE = 0x00000400
+
+class PrinterInfo:
+    __slots__ = ('name', 'status', 'online', 'is_default')
+
+    def __init__(self, name, status="就绪", online=True, is_default=False):
+        self.name = name
+        self.status = status
+        self.online = online
+        self.is_default = is_default
+
+def _enum_win32():
+    import win32print
+    flags = win32print.PRINTER_ENUM_LOCAL | win32print.PRINTER_ENUM_CONNECTIONS
+    try: default = win32print.GetDefaultPrinter()
+    except Exception: default = None
+    out = []
+    for p in win32print.EnumPrinters(flags, None, 2):
+        code = p.get('Status') or 0
+        offline = bool((p.get('Attributes') or 0) & _ATTR_WORK_OFFLINE)
+        texts = [t for bit, t in _STATUS_TEXT if code & bit]
+        if offline and "脱机" not in texts: texts.insert(0, "脱机")
+        out.append(PrinterInfo(p['pPrinterName'], "、".join(texts) or "就绪",
+                               not offline and not (code & _FATAL_STATUS), p['pPrinterName'] == default))
+    return out
+
+def _enum_qt():
+    from PyQt5.QtPrintSupport import QPrinterInfo, QPrinter
+    default = QPrinterInfo.defaultPrinterName()
+    out = []
+    for info in QPrinterInfo.availablePrinters():
+        error = info.state() == QPrinter.Error
+        out.append(PrinterInfo(info.printerName(), "错误" if error else "就绪", not error,
+                               info.printerName() == default))
+    return out
+
+class PrinterRegistry:
+    """
+    打印机列表缓存 (全进程共享)。
+    枚举打印机 (尤其是网络打印队列) 可能阻塞数秒，refresh() 只在后台线程调用；
+    界面与打印前检查只读缓存。优先用 win32print (能拿到脱机/缺纸等状态)，失败时回退 QPrinterInfo。
+    """
+    TTL = 60 # 秒
+
+    def __init__(self):
+        self.printers = {} # {名称: PrinterInfo}
+        self.default = None
+        self.updated = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.updated > 0
+
+    def stale(self, ttl=None):
+        return time.time() - self.updated >= (self.TTL if ttl is None else ttl)
+
+    def refresh(self):
+        """重新枚举 (阻塞，在工作线程调用)，返回打印机数量"""
+        with self._lock:
+            try: found = _enum_win32()
+            except Exception as e:
+                if not isinstance(e, ImportError): print(f"Printer Enum Error: {e}")
+                found = _enum_qt()
+            self.printers = {p.name: p for p in found}
+            self.default = next((p.name for p in found if p.is_default), None)
+            self.updated = time.time()
+        return len(found)
+
+    def names(self):
+        return sorted(self.printers)
+
+    def get(self, name):
+        return self.printers.get(name or self.default)
+
+    def check(self, name):
+        """
+        打印前检查 (只查缓存)，返回 (ok, msg)。name 为空表示系统默认打印机。
+        尚未枚举完成或缓存已过期时不拦截，交给 BarTender 自己处理
+        """
+        if not self.ready or self.stale(self.TTL * 2): return True, ""
+        info = self.get(name)
+        if info is None:
+            return False, f"找不到打印机: {name}" if name else "系统没有默认打印机"
+        if not info.online:
+            return False, f"打印机 {info.name} 不可用 ({info.status})"
+        return True, ""
+
+printer_registry = PrinterRegistry()
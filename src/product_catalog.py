@@ -0,0 +1,135 @@
+from src.events import event_bus
+
+# 产品记录的字段 (与 products 表一致，另加联表带出的箱规名称)
+PRODUCT_FIELDS = ('id', 'name', 'spec', 'model', 'color', 'sn4', 'sku', 'code69',
+                  'qty', 'weight', 'template_path', 'rule_id', 'sn_rule_id', 'rule_name')
+
+CATALOG_QUERY = f"""
+    SELECT {', '.join('p.' + f for f in PRODUCT_FIELDS[:-1])}, COALESCE(r.name, '无') AS rule_name
+    FROM products p LEFT JOIN box_rules r ON r.id = p.rule_id
+"""
+
+class ProductRecord:
+    """
+    产品记录 (__slots__，比 dict 省内存)。
+    保留 p['name'] / p.get('qty') 的用法，原来按 dict 使用产品的代码无需改动；
+    记录在目录中共享，需要修改时先 to_dict() 复制一份。
+    """
+    __slots__ = PRODUCT_FIELDS
+
+    def __init__(self, row):
+        for f, v in zip(PRODUCT_FIELDS, row):
+            setattr(self, f, v)
+
+    def get(self, key, default=None):
+        v = getattr(self, key, None) if key in PRODUCT_FIELDS else None
+        return default if v is None else v
+
+    def __getitem__(self, key):
+        if key not in PRODUCT_FIELDS: raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in PRODUCT_FIELDS
+
+    def keys(self):
+        return PRODUCT_FIELDS
+
+    def to_dict(self):
+        return {f: getattr(self, f) for f in PRODUCT_FIELDS}
+
+class ProductCatalog:
+    """
+    全进程共享的产品目录 (按数据库文件区分)。
+    按 id / SN前缀 / 69码 / 名称 建立哈希索引，查询不走 SQL。
+    通过事件总线记录变更的产品 id，sync() 时只重新读取这些行；
+    箱规变化或外部修改 (id 未知) 时才整表重载。
+    """
+    def __init__(self, bus=event_bus):
+        self.records = [] # 按名称排序
+        self.version = 0 # 每次内容变化加一，界面据此判断是否需要刷新
+        self.by_id = {}
+        self.by_sn4 = {}
+        self.by_code69 = {}
+        self.by_name = {}
+        self._prefix_lens = []
+        self._loaded = False
+        self._dirty = set() # 待刷新的产品 id；None 表示整表
+        bus.subscribe(self._on_change, ('products', 'box_rules'))
+
+    def _on_change(self, changes):
+        ids = changes.get('products')
+        if 'box_rules' in changes or ids is None or self._dirty is None:
+            self._dirty = None
+        else:
+            self._dirty.update(ids)
+
+    def sync(self, conn):
+        """应用累计的变更，没有变更时不访问数据库"""
+        if not self._loaded or self._dirty is None:
+            rows = conn.execute(CATALOG_QUERY).fetchall()
+            self.by_id = {r[0]: ProductRecord(r) for r in rows}
+            self._loaded = True
+        elif self._dirty:
+            ids = list(self._dirty)
+            for pid in ids: self.by_id.pop(pid, None)
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                rows = conn.execute(CATALOG_QUERY + f" WHERE p.id IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+                for r in rows: self.by_id[r[0]] = ProductRecord(r)
+        else:
+            return self
+        self._dirty = set()
+        self._reindex()
+        return self
+
+    def _reindex(self):
+        self.records = sorted(self.by_id.values(), key=lambda p: p.name or "")
+        self.by_sn4, self.by_code69, self.by_name = {}, {}, {}
+        for p in self.records:
+            sn4 = str(p.sn4 or '').strip().upper()
+            if sn4: self.by_sn4[sn4] = p
+            code = str(p.code69 or '').strip()
+            if code: self.by_code69.setdefault(code, []).append(p)
+            self.by_name.setdefault(p.name, []).append(p)
+        self._prefix_lens = sorted({len(k) for k in self.by_sn4}, reverse=True)
+        self.version += 1
+
+    # --- 查询 (纯内存) ---
+    def get(self, pid):
+        return self.by_id.get(pid)
+
+    def find_by_code69(self, code69):
+        return self.by_code69.get(str(code69 or '').strip(), [])
+
+    def find_by_name(self, name):
+        return self.by_name.get(name, [])
+
+    def match_sn(self, sn):
+        """按 SN 前缀识别产品 (最长前缀优先)，识别不到返回 None"""
+        sn = (sn or '').strip().upper()
+        for n in self._prefix_lens:
+            if n > len(sn): continue
+            p = self.by_sn4.get(sn[:n])
+            if p: return p
+        return None
+
+    def resolve(self, name, sn=None):
+        """
+        按名称找产品；重名时用 SN 前缀区分。
+        找不到或无法区分时返回 None
+        """
+        cands = self.find_by_name(name)
+        if len(cands) == 1: return cands[0]
+        if sn:
+            p = self.match_sn(sn)
+            if p and (not cands or p in cands): return p
+        return None
+
+_catalogs = {}
+
+def get_product_catalog(db_path):
+    catalog = _catalogs.get(db_path)
+    if catalog is None:
+        catalog = _catalogs[db_path] = ProductCatalog()
+    return catalog
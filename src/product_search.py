@@ -0,0 +1,59 @@
+class ProductSearchIndex:
+    """
+    产品搜索索引。
+    对 名称 / 69码 / SN前缀 / SKU 预先建立 1~3 字符的 n-gram 倒排表，
+    输入关键字时只需查表求交集，不再逐行扫描整个产品列表。
+    """
+    FIELDS = ('name', 'code69', 'sn4', 'sku')
+    GRAM = 3
+
+    def __init__(self, rows=None):
+        self.build(rows or [])
+
+    def build(self, rows):
+        self._haystack = []
+        self._grams = {}
+        for i, p in enumerate(rows):
+            # 用 \x00 分隔各字段，避免跨字段拼接出虚假匹配
+            text = "\x00".join(str(p.get(f) or '').lower() for f in self.FIELDS)
+            self._haystack.append(text)
+            seen = set()
+            for j in range(len(text)):
+                for n in range(1, self.GRAM + 1):
+                    g = text[j:j + n]
+                    if len(g) == n and '\x00' not in g:
+                        seen.add(g)
+            for g in seen:
+                # 行号按顺序追加，倒排表天然有序
+                self._grams.setdefault(g, []).append(i)
+        self._last_key = ""
+        self._last_result = list(range(len(rows)))
+
+    def __len__(self):
+        return len(self._haystack)
+
+    def search(self, keyword):
+        """返回匹配的行号列表 (保持原始顺序)"""
+        k = (keyword or "").strip().lower()
+        if not k:
+            result = list(range(len(self._haystack)))
+        elif self._last_key and self._last_key in k:
+            # 增量输入：新关键字包含上次关键字，只需在上次结果中继续筛选
+            result = [i for i in self._last_result if k in self._haystack[i]]
+        elif len(k) <= self.GRAM:
+            result = list(self._grams.get(k, []))
+        else:
+            grams = {k[j:j + self.GRAM] for j in range(len(k) - self.GRAM + 1)}
+            postings = sorted((self._grams.get(g, []) for g in grams), key=len)
+            if not postings[0]:
+                result = []
+            else:
+                cand = set(postings[0])
+                for p in postings[1:]:
+                    cand.intersection_update(p)
+                    if not cand: break
+                result = [i for i in sorted(cand) if k in self._haystack[i]]
+
+        self._last_key = k
+        self._last_result = result
+        return result
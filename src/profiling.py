@@ -0,0 +1,81 @@
+"""
+现场性能分析 (默认关闭)。
+
+开启方式: 环境变量 LABEL_PROFILE=1，或设置项 profile_mode=1 (主窗口 Ctrl+Shift+P 切换)。
+开启后被 @profiled 包装的入口每执行一次，就在诊断目录的 profiles 子目录下生成:
+    <动作>_<时间>.prof      cProfile 结果 (可用 snakeviz / pstats 离线分析)
+    <动作>_<时间>_mem.txt   执行前后 tracemalloc 快照的差异 (前 30 项)
+"""
+import cProfile
+import functools
+import inspect
+import os
+import threading
+import time
+import tracemalloc
+
+from src.config import DIAG_DIR
+
+PROFILE_DIR = os.path.join(DIAG_DIR, "profiles")
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self._local = threading.local() # 同一线程内嵌套的入口只分析最外层
+        self._seq = 0
+        if os.environ.get("LABEL_PROFILE") == "1": self.enable()
+
+    def enable(self):
+        if self.enabled: return
+        self.enabled = True
+        if not tracemalloc.is_tracing(): tracemalloc.start(10)
+        print(f"Profiling enabled -> {os.path.abspath(PROFILE_DIR)}")
+
+    def disable(self):
+        self.enabled = False
+        if tracemalloc.is_tracing(): tracemalloc.stop()
+
+    def run(self, action, fn, *args, **kwargs):
+        if not self.enabled or getattr(self._local, 'active', False):
+            return fn(*args, **kwargs)
+
+        self._local.active = True
+        prof = cProfile.Profile()
+        before = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        try:
+            return prof.runcall(fn, *args, **kwargs)
+        finally:
+            self._local.active = False
+            self._save(action, prof, before)
+
+    def _save(self, action, prof, before):
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            self._seq += 1
+            base = os.path.join(PROFILE_DIR, f"{action}_{time.strftime('%Y%m%d_%H%M%S')}_{self._seq}")
+            prof.dump_stats(base + ".prof")
+            if before is not None and tracemalloc.is_tracing():
+                diff = tracemalloc.take_snapshot().compare_to(before, 'lineno')
+                with open(base + "_mem.txt", "w", encoding="utf-8") as f:
+                    for stat in diff[:30]: f.write(f"{stat}\n")
+        except Exception as e:
+            print(f"Profile Save Error: {e}")
+
+profiler = Profiler()
+
+def profiled(action):
+    """
+    包装入口函数。关闭时直接调用原函数。
+    多余的位置参数会被丢弃 (与 Qt 槽函数一致)，因此可直接连接 clicked 等带参数的信号。
+    """
+    def deco(fn):
+        params = list(inspect.signature(fn).parameters.values())
+        if any(p.kind == p.VAR_POSITIONAL for p in params): n = None
+        else: n = sum(1 for p in params if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD))
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if n is not None: args = args[:n]
+            return profiler.run(action, fn, *args, **kwargs)
+        return wrapper
+    return deco
@@ -0,0 +1,159 @@
+import logging
+import logging.handlers
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from src.config import DIAG_DIR
+
+# 超过该耗时 (毫秒) 的语句记入慢查询日志；可用环境变量 LABEL_SLOW_QUERY_MS 或设置项 slow_query_ms 调整
+DEFAULT_SLOW_MS = 200
+
+_WS = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+def normalize_sql(sql):
+    """统计用的语句键：合并空白，IN (?,?,...) 不论长度视为同一条"""
+    return _IN_LIST.sub("(?...)", _WS.sub(" ", sql).strip())
+
+def redact_params(params):
+    """日志中不写参数值 (可能含 SN 等业务数据)，只保留类型和长度"""
+    if not params: return []
+    vals = params.values() if isinstance(params, dict) else params
+    out = []
+    for v in vals:
+        if isinstance(v, (str, bytes)): out.append(f"<{type(v).__name__}:{len(v)}>")
+        else: out.append(f"<{type(v).__name__}>")
+    return out
+
+class QueryStats:
+    """
+    全进程的 SQL 执行统计。
+    每条语句 (按 normalize_sql 归并) 记录次数、总耗时、最大耗时、慢查询次数；
+    慢查询连同 EXPLAIN QUERY PLAN 写入诊断目录 (DIAG_DIR) 下的 slow_queries.log。
+    """
+    def __init__(self):
+        self.slow_ms = float(os.environ.get("LABEL_SLOW_QUERY_MS") or DEFAULT_SLOW_MS)
+        self._stats = {} # {语句: [次数, 总耗时, 最大耗时, 慢次数]}
+        self._explained = set()
+        self._lock = threading.Lock()
+        self._logger = None
+
+    def record(self, sql, params, seconds, conn=None, count=1):
+        key = normalize_sql(sql)
+        with self._lock:
+            st = self._stats.get(key)
+            if st is None: st = self._stats[key] = [0, 0.0, 0.0, 0]
+            st[0] += count
+            st[1] += seconds
+            if seconds > st[2]: st[2] = seconds
+            slow = seconds * 1000 >= self.slow_ms
+            if slow: st[3] += 1
+        if slow: self._log_slow(key, sql, params, seconds, conn)
+
+    def _log_slow(self, key, sql, params, seconds, conn):
+        plan = ""
+        # 同一语句只做一次 EXPLAIN，避免慢查询本身被放大
+        if conn is not None and key not in self._explained and key.upper().startswith(_EXPLAINABLE):
+            self._explained.add(key)
+            try:
+                rows = sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()
+                plan = "\n".join(f"    {r[-1]}" for r in rows)
+            except Exception as e:
+                plan = f"    (EXPLAIN 失败: {e})"
+        msg = f"{seconds * 1000:.1f}ms  {key}  params={redact_params(params)}"
+        if plan: msg += "\n" + plan
+        try:
+            self._get_logger().warning(msg)
+        except Exception as e:
+            print(f"Slow Query Log Error: {e}")
+
+    def _get_logger(self):
+        if self._logger is None:
+            os.makedirs(DIAG_DIR, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(os.path.join(DIAG_DIR, "slow_queries.log"),
+                                                           maxBytes=1024 * 1024, backupCount=3, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            logger = logging.getLogger("label_slow_sql")
+            logger.propagate = False
+            logger.addHandler(handler)
+            self._logger = logger
+        return self._logger
+
+    def snapshot(self):
+        """返回 [(语句, 次数, 总耗时ms, 平均ms, 最大ms, 慢次数)]，按总耗时倒序"""
+        with self._lock:
+            items = list(self._stats.items())
+        rows = [(k, n, t * 1000, t * 1000 / n if n else 0.0, m * 1000, s) for k, (n, t, m, s) in items]
+        return sorted(rows, key=lambda r: r[2], reverse=True)
+
+    def dump(self, path=None):
+        """把统计写成文本文件，返回文件路径"""
+        path = path or os.path.join(DIAG_DIR, f"sql_stats_{time.strftime('%Y%m%d_%H%M%S')}.txt")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"# 慢查询阈值 {self.slow_ms:.0f}ms\n# 次数\t总耗时ms\t平均ms\t最大ms\t慢次数\t语句\n")
+            for k, n, total, avg, mx, slow in self.snapshot():
+                f.write(f"{n}\t{total:.1f}\t{avg:.2f}\t{mx:.1f}\t{slow}\t{k}\n")
+        return path
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self._explained = set()
+
+query_stats = QueryStats()
+
+class ProfiledCursor(sqlite3.Cursor):
+    """
+    计时游标。execute 计入语句执行 (写操作、排序/聚合查询的主要耗时都在这一步)，
+    fetchall / fetchmany 的耗时再补记到同一语句上；逐行迭代的后续读取不计时。
+    """
+    _last = None
+
+    def execute(self, sql, params=()):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            dt = time.perf_counter() - t0
+            self._last = (sql, params)
+            query_stats.record(sql, params, dt, self.connection)
+
+    def executemany(self, sql, seq):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq)
+        finally:
+            query_stats.record(sql, None, time.perf_counter() - t0, None)
+
+    def _fetch(self, fn, *args):
+        t0 = time.perf_counter()
+        rows = fn(*args)
+        dt = time.perf_counter() - t0
+        if self._last and dt > 0.0005:
+            query_stats.record(self._last[0], self._last[1], dt, self.connection, count=0)
+        return rows
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, size or self.arraysize)
+
+class ProfiledConnection(sqlite3.Connection):
+    """
+    计时连接：cursor() 与 conn.execute() 都走 ProfiledCursor。
+    用法: sqlite3.connect(path, factory=ProfiledConnection)
+    """
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
@@ -0,0 +1,27 @@
+# 统计报表 (基于 box_summary 汇总表)
+
+# 时间粒度: 名称 -> 从 hour ('YYYY-MM-DD HH') 截取的长度
+GRANULARITY = {"小时": 13, "天": 10, "月": 7}
+# 可选分组维度: 名称 -> 汇总表字段
+DIMENSIONS = {"产品": "name", "69码": "code69", "批次": "batch"}
+
+def summary_query(granularity="天", dims=("name",), start=None, end=None, keyword=""):
+    """
+    生成汇总查询，返回 (sql, params, 表头)。
+    start / end: 'YYYY-MM-DD' (含)；keyword: 按产品名称模糊过滤
+    """
+    n = GRANULARITY.get(granularity, 10)
+    cols = [f"substr(hour, 1, {n})"] + list(dims)
+    sql = f"SELECT {', '.join(cols)}, SUM(boxes), SUM(units) FROM box_summary WHERE 1=1"
+    params = []
+    # hour 以日期开头，直接按字符串范围过滤即可走主键
+    if start:
+        sql += " AND hour >= ?"; params.append(start)
+    if end:
+        sql += " AND hour < ?"; params.append(end + "~") # '~' 大于任何 ' HH'
+    if keyword:
+        sql += " AND name LIKE ?"; params.append(f"%{keyword}%")
+    sql += f" GROUP BY {', '.join(str(i + 1) for i in range(len(cols)))} ORDER BY 1, {len(cols) + 1} DESC"
+    names = {v: k for k, v in DIMENSIONS.items()}
+    headers = ["时间"] + [names[d] for d in dims] + ["箱数", "数量"]
+    return sql, params, headers
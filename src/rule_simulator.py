@@ -0,0 +1,124 @@
+"""
+规则模拟：不连数据库、不改计数，离线检查箱号规则和 SN 规则。
+  simulate_box_rule: 按日期范围批量生成箱号 (与打印时同一个格式化器)，报告重号、流水号超出位宽、无法反解
+  validate_sn_samples: 用 SN 样本文件批量校验 SN 规则 (与打印页扫描同一个校验函数)
+"""
+import csv
+import datetime
+import os
+import time
+from collections import Counter
+
+from src.box_rules import RULE_TOKEN
+from src.sn_rules import check_sn_rule, clean_sn
+
+def simulate_box_rule(engine, rule_fmt, product_info, start, end, per_day=100, repair_level=0, limit=50):
+    """
+    engine: BoxRuleEngine (只用到格式化器，不访问数据库)；start / end: datetime.date (含)
+    每天生成 per_day 箱，流水号按月重置并从 返修等级*10000 起算，与真实计数规则一致
+    """
+    t0 = time.perf_counter()
+    fmt = engine.compile_formatter(rule_fmt, product_info)
+    parser = engine.compile_rule(rule_fmt, product_info)
+    widths = [int(m.group(2)) for m in RULE_TOKEN.finditer(rule_fmt) if m.group(2)]
+    max_seq = 10 ** min(widths) - 1 if widths else None
+
+    seen = {} # 箱号 -> (日期, 流水号)
+    collisions, overflows, unparsable, samples = [], [], [], []
+    n_collide = n_overflow = n_unparsable = total = 0
+    counters = {}
+    day = start
+    while day <= end:
+        now = datetime.datetime(day.year, day.month, day.day)
+        ym = (day.year, day.month)
+        seq = counters.get(ym, repair_level * 10000)
+        for _ in range(per_day):
+            seq += 1
+            box = fmt(now, seq)
+            total += 1
+            if len(samples) < limit: samples.append((day.isoformat(), seq, box))
+            first = seen.get(box)
+            if first:
+                n_collide += 1
+                if len(collisions) < limit: collisions.append((box, first[0], first[1], day.isoformat(), seq))
+            else:
+                seen[box] = (day.isoformat(), seq)
+            if max_seq is not None and seq > max_seq:
+                n_overflow += 1
+                if len(overflows) < limit: overflows.append((day.isoformat(), seq, box))
+            m = parser.fullmatch(box)
+            if not m or ('seq' in parser.groupindex and int(m.group('seq')) != seq):
+                n_unparsable += 1
+                if len(unparsable) < limit: unparsable.append((day.isoformat(), seq, box))
+        counters[ym] = seq
+        day += datetime.timedelta(days=1)
+
+    return {
+        "total": total, "unique": len(seen), "months": len(counters),
+        "max_seq": max(counters.values()) if counters else 0, "seq_limit": max_seq,
+        "collisions": collisions, "collision_count": n_collide,
+        "overflows": overflows, "overflow_count": n_overflow,
+        "unparsable": unparsable, "unparsable_count": n_unparsable,
+        "samples": samples, "elapsed_ms": (time.perf_counter() - t0) * 1000,
+    }
+
+def validate_sn_samples(sns, prefix, fmt=None, length=0, batch="", limit=50):
+    """批量校验 SN 样本，返回 {total, ok, errors: Counter(原因), examples, duplicates, elapsed_ms}"""
+    t0 = time.perf_counter()
+    counts = Counter()
+    errors, examples = Counter(), []
+    ok = 0
+    for raw in sns:
+        sn = clean_sn(raw).upper()
+        if not sn: continue
+        counts[sn] += 1
+        good, msg = check_sn_rule(sn, prefix, fmt, length, batch)
+        if good:
+            ok += 1
+            continue
+        reason = msg.split("\n")[0].rstrip("！")
+        errors[reason] += 1
+        if len(examples) < limit: examples.append((sn, msg.replace("\n", " ")))
+    dups = [(sn, n) for sn, n in counts.most_common() if n > 1]
+    return {"total": sum(counts.values()), "ok": ok, "errors": errors, "examples": examples,
+            "duplicates": dups, "elapsed_ms": (time.perf_counter() - t0) * 1000}
+
+def load_sn_file(path):
+    """读取 SN 样本：txt/csv 取每行第一列，Excel 取第一列"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.xlsx', '.xls'):
+        import pandas as pd
+        df = pd.read_excel(path, header=None, dtype=str)
+        return [str(v) for v in df.iloc[:, 0].dropna()]
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as f:
+        return [row[0] for row in csv.reader(f, delimiter="\t" if ext == ".tsv" else ",") if row]
+
+def format_box_report(r):
+    lines = [f"共生成 {r['total']} 个箱号 ({r['months']} 个月)，不重复 {r['unique']} 个，耗时 {r['elapsed_ms']:.1f} ms",
+             f"单月最大流水号 {r['max_seq']}" + (f"，位宽上限 {r['seq_limit']}" if r['seq_limit'] is not None else "，规则中没有 {SEQn}")]
+    if r['collision_count']:
+        lines.append(f"\n! 重号 {r['collision_count']} 个 (规则缺少区分年/月的编码时会跨月重号):")
+        lines += [f"    {b}: {d1} #{s1} 与 {d2} #{s2}" for b, d1, s1, d2, s2 in r['collisions']]
+    if r['overflow_count']:
+        lines.append(f"\n! 流水号超出位宽 {r['overflow_count']} 个 (箱号会变长):")
+        lines += [f"    {d} #{s}: {b}" for d, s, b in r['overflows']]
+    if r['unparsable_count']:
+        lines.append(f"\n! 无法从箱号反解流水号 {r['unparsable_count']} 个 (箱号核对会漏掉这些箱):")
+        lines += [f"    {d} #{s}: {b}" for d, s, b in r['unparsable']]
+    if not (r['collision_count'] or r['overflow_count'] or r['unparsable_count']):
+        lines.append("\n未发现问题")
+    lines.append("\n示例:")
+    lines += [f"    {d} #{s}: {b}" for d, s, b in r['samples'][:20]]
+    return "\n".join(lines)
+
+def format_sn_report(r):
+    lines = [f"共 {r['total']} 个SN，通过 {r['ok']} 个，不通过 {r['total'] - r['ok']} 个，耗时 {r['elapsed_ms']:.1f} ms"]
+    for reason, n in r['errors'].most_common():
+        lines.append(f"    {reason}: {n}")
+    if r['duplicates']:
+        lines.append(f"\n! 样本内重复 {len(r['duplicates'])} 个:")
+        lines += [f"    {sn} x{n}" for sn, n in r['duplicates'][:50]]
+    if r['examples']:
+        lines.append("\n不通过示例:")
+        lines += [f"    {sn}: {msg}" for sn, msg in r['examples']]
+    return "\n".join(lines)
@@ -0,0 +1,89 @@
+import sqlite3
+import threading
+import queue
+from src.events import local_write
+
+class ScanJournal:
+    """
+    当前装箱的预写日志 (crash-safe)。
+    每个被接受的 SN 都追加到 scan_journal 表，程序崩溃或断电重启后可恢复未封箱的 SN。
+    写入由独立的后台线程完成，并做"组提交"：一次提交队列中积压的全部操作，
+    扫描线程只需入队，不会被磁盘同步拖慢。
+    """
+    BATCH_WAIT = 0.05 # 组提交的最大等待时间 (秒)
+
+    def __init__(self, db_path, station):
+        self.db_path = db_path
+        self.station = station
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="ScanJournal", daemon=True)
+        self._thread.start()
+
+    # --- 扫描线程调用 (只入队，立即返回) ---
+    def append(self, product_id, batch, sn, scan_time):
+        self._queue.put(("INSERT INTO scan_journal (station, product_id, batch, sn, scan_time) VALUES (?,?,?,?,?)",
+                         (self.station, product_id, batch, sn, scan_time)))
+
+    def remove(self, product_id, sns):
+        for sn in sns:
+            self._queue.put(("DELETE FROM scan_journal WHERE station=? AND product_id=? AND sn=?",
+                             (self.station, product_id, sn)))
+
+    def clear(self):
+        """封箱完成或切换产品后清空本工位的日志"""
+        self._queue.put(("DELETE FROM scan_journal WHERE station=?", (self.station,)))
+
+    def flush(self):
+        """等待已入队的操作全部落盘"""
+        self._queue.join()
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._thread.join(timeout=2)
+
+    def load_open(self):
+        """
+        读取本工位未封箱的记录。
+        返回 (product_id, batch, [(sn, scan_time), ...])，没有时返回 None
+        """
+        self.flush()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute("SELECT product_id, batch, sn, scan_time FROM scan_journal WHERE station=? ORDER BY id",
+                                (self.station,)).fetchall()
+        finally:
+            conn.close()
+        if not rows: return None
+        # 只恢复最后一个产品的记录
+        pid, batch = rows[-1][0], rows[-1][1]
+        return pid, batch, [(r[2], r[3]) for r in rows if r[0] == pid]
+
+    # --- 后台写线程 ---
+    def _run(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            # 日志要抗断电，单独使用 FULL 同步；组提交把 fsync 开销摊到多条记录上
+            conn.execute("PRAGMA synchronous=FULL;")
+        except: pass
+
+        while True:
+            ops = [self._queue.get()]
+            # 收集短时间内积压的其余操作，一起提交
+            try:
+                while ops[-1] is not None and len(ops) < 500:
+                    ops.append(self._queue.get(timeout=self.BATCH_WAIT))
+            except queue.Empty:
+                pass
+
+            stop = None in ops
+            try:
+                # 本进程的提交，不能让 DataVersionWatcher 当成其他工位的修改
+                with local_write(), conn:
+                    for op in ops:
+                        if op is not None: conn.execute(*op)
+            except Exception as e:
+                print(f"Scan Journal Error: {e}")
+            for _ in ops: self._queue.task_done()
+            if stop: break
+        conn.close()
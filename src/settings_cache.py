@@ -0,0 +1,56 @@
+import json
+from src.config import DEFAULT_MAPPING
+from src.events import event_bus
+
+class SettingsCache:
+    """
+    设置项内存缓存 (按数据库文件全进程共享)。
+    首次读取时一次性加载整张 settings 表，解析后的值 (如 field_mapping 的 JSON)
+    也会缓存；set_setting 或其他工位修改数据库后经事件总线失效，下次读取再重新加载。
+    """
+    def __init__(self, bus=event_bus):
+        self._values = None
+        self._parsed = {}
+        bus.subscribe(self._on_change, ('settings',))
+
+    def _on_change(self, changes):
+        self.invalidate()
+
+    def invalidate(self):
+        self._values = None
+        self._parsed = {}
+
+    def get(self, conn, key):
+        values = self._values
+        if values is None:
+            values = dict(conn.execute("SELECT key, value FROM settings").fetchall())
+            self._values = values
+        return values.get(key)
+
+    def get_parsed(self, conn, key, parser):
+        """返回经 parser 转换后的值；返回的对象被共享，调用方不要修改"""
+        try: return self._parsed[key]
+        except KeyError: pass
+        val = parser(self.get(conn, key))
+        self._parsed[key] = val
+        return val
+
+_caches = {}
+
+def get_settings_cache(db_path):
+    cache = _caches.get(db_path)
+    if cache is None:
+        cache = _caches[db_path] = SettingsCache()
+    return cache
+
+# --- 解析器 ---
+def parse_mapping(raw):
+    try:
+        m = json.loads(raw) if raw else None
+    except Exception:
+        m = None
+    return m if isinstance(m, dict) else DEFAULT_MAPPING
+
+def parse_printer(raw):
+    if not raw or raw == "使用系统默认打印机": return None
+    return raw
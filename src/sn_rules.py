@@ -0,0 +1,39 @@
+import re
+from functools import lru_cache
+
+SN_TOKEN_SPLIT = re.compile(r'(\{SN4\}|\{BATCH\}|\{SEQ\d+\})')
+_TRAILING_JUNK = re.compile(r'[\s\W\u200b\ufeff]+$')
+
+@lru_cache(maxsize=256)
+def compile_sn_rule(fmt, prefix, batch):
+    """
+    SN 规则 -> 正则 (按 规则/前缀/批次 缓存)。
+    {SN4}: 产品 SN 前缀，{BATCH}: 当前批次，{SEQn}: n 位数字；规则有误时抛出 ValueError
+    """
+    regex_parts = []
+    for part in SN_TOKEN_SPLIT.split(fmt):
+        if part == "{SN4}": regex_parts.append(re.escape(prefix))
+        elif part == "{BATCH}": regex_parts.append(re.escape(batch))
+        elif part.startswith("{SEQ") and part.endswith("}"):
+            regex_parts.append(f"\\d{{{int(part[4:-1])}}}")
+        elif part:
+            regex_parts.append(re.escape(part))
+    try:
+        return re.compile("".join(regex_parts))
+    except re.error as e:
+        raise ValueError(f"正则错误: {e}")
+
+def clean_sn(sn):
+    """去掉扫码枪带出的结尾空白/不可见字符"""
+    return _TRAILING_JUNK.sub('', sn).strip()
+
+def check_sn_rule(sn, prefix, fmt=None, length=0, batch=""):
+    """按产品前缀和 SN 规则校验，返回 (ok, msg)；打印页扫描和规则模拟共用"""
+    sn = clean_sn(sn)
+    if not sn.startswith(prefix): return False, f"前缀不符！\n要求: {prefix}"
+    if fmt is not None:
+        if length > 0 and len(sn) != length: return False, f"长度错误！\n要求: {length}位"
+        try: rx = compile_sn_rule(fmt, prefix, batch)
+        except ValueError: return False, "规则错误"
+        if not rx.fullmatch(sn): return False, f"格式不符！\nSN: {sn}"
+    return True, ""
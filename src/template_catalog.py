@@ -0,0 +1,164 @@
+import hashlib
+import os
+import threading
+from src.label_payload import resolve_template_path
+
+TEMPLATE_EXTS = ('.btw',)
+
+class TemplateInfo:
+    """模板文件索引项。fields: 模板中的命名数据源 (打印时由 BarTender 读出后回填)，未知为 None"""
+    __slots__ = ('name', 'path', 'size', 'mtime', 'hash', 'fields')
+
+    def __init__(self, name, path, size, mtime, digest, fields=None):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.hash = digest
+        self.fields = fields
+
+def _file_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""): h.update(chunk)
+    return h.hexdigest()
+
+class TemplateCatalog:
+    """
+    模板目录索引 (全进程共享)。
+    scan() 完整扫描一次模板根目录；之后由文件监视 (TemplateWatcher) 调用 refresh_dir 增量更新，
+    大小和修改时间没变的文件不重新计算哈希。模板选择、缺失检查、打印前的存在性检查都只查内存。
+    产品中存的模板名是相对模板根目录的路径 (通常就是文件名)。
+    """
+    def __init__(self):
+        self.root = ""
+        self.entries = {} # {规范化的相对路径: TemplateInfo}
+        self.dirs = set()
+        self.ready = False
+        self.version = 0
+        self._lock = threading.RLock() # 扫描/增量更新串行执行；查询不加锁
+
+    @staticmethod
+    def _key(name):
+        return os.path.normcase(os.path.normpath(name))
+
+    def _rel(self, path):
+        """完整路径 -> 相对模板根目录的索引键；不在根目录下时返回 None"""
+        try: rel = os.path.relpath(path, self.root)
+        except ValueError: return None # Windows 下不同盘符
+        key = self._key(rel)
+        return None if key == os.pardir or key.startswith(os.pardir + os.sep) else key
+
+    def _stat_entry(self, root, path, old=None):
+        st = os.stat(path)
+        if old and old.size == st.st_size and old.mtime == st.st_mtime: return old
+        info = TemplateInfo(os.path.relpath(path, root), path, st.st_size, st.st_mtime, _file_hash(path))
+        # 内容没变 (只是被重新保存) 时保留已读出的字段
+        if old and old.hash == info.hash: info.fields = old.fields
+        return info
+
+    def scan(self, root):
+        """完整扫描 (可在工作线程执行)，返回模板数量"""
+        root = os.path.abspath(root) if root else ""
+        with self._lock:
+            return self._scan(root)
+
+    def _scan(self, root):
+        old = self.entries if root == self.root else {}
+        entries, dirs = {}, set()
+        if root and os.path.isdir(root):
+            for d, _, files in os.walk(root):
+                dirs.add(d)
+                for fn in files:
+                    if not fn.lower().endswith(TEMPLATE_EXTS): continue
+                    path = os.path.join(d, fn)
+                    key = self._key(os.path.relpath(path, root))
+                    try: entries[key] = self._stat_entry(root, path, old.get(key))
+                    except OSError: pass
+        self.root, self.entries, self.dirs = root, entries, dirs
+        self.ready = True
+        self.version += 1
+        return len(entries)
+
+    def refresh_dir(self, d):
+        """重新扫描一个目录 (文件监视回调)，返回是否有变化"""
+        with self._lock:
+            return self._refresh_dir(d)
+
+    def _refresh_dir(self, d):
+        if not self.root: return False
+        d = os.path.abspath(d)
+        prefix = self._rel(d)
+        if prefix is None: return False
+        prefix = "" if prefix == os.curdir else prefix + os.sep
+        found, subdirs = {}, set()
+        if os.path.isdir(d):
+            try: names = os.listdir(d)
+            except OSError: names = []
+            for fn in names:
+                path = os.path.join(d, fn)
+                if os.path.isdir(path):
+                    subdirs.add(path)
+                elif fn.lower().endswith(TEMPLATE_EXTS):
+                    key = self._key(os.path.relpath(path, self.root))
+                    try: found[key] = self._stat_entry(self.root, path, self.entries.get(key))
+                    except OSError: pass
+        entries = dict(self.entries)
+        # 本目录下 (不含子目录) 的旧条目
+        mine = [k for k in entries if k.startswith(prefix) and os.sep not in k[len(prefix):]]
+        changed = set(mine) != set(found) or any(entries[k] is not found.get(k) for k in mine)
+        for k in mine: del entries[k]
+        entries.update(found)
+        new_dirs = subdirs - self.dirs
+        if not os.path.isdir(d):
+            # 目录被删除：连同子目录的条目一起去掉
+            gone = [k for k in entries if k.startswith(prefix)]
+            for k in gone: del entries[k]
+            changed = changed or bool(gone)
+            self.dirs = {x for x in self.dirs if not (x == d or x.startswith(d + os.sep))}
+        else:
+            self.dirs |= subdirs
+        if changed:
+            # 整体替换，查询方 (界面线程) 不会看到改了一半的字典
+            self.entries = entries
+            self.version += 1
+        # 新出现的子目录 (如整个文件夹复制进来) 逐级扫描
+        for sub in new_dirs:
+            changed = self._refresh_dir(sub) or changed
+        return changed
+
+    # --- 查询 (纯内存) ---
+    def resolve(self, tmpl):
+        """模板名或完整路径 -> TemplateInfo；不在模板根目录下或不存在时返回 None"""
+        if not tmpl or not self.root: return None
+        key = self._rel(tmpl) if os.path.isabs(tmpl) else self._key(tmpl)
+        return self.entries.get(key) if key else None
+
+    def exists(self, tmpl):
+        """
+        模板是否存在。索引尚未建立，或路径不在模板根目录下时回退为检查文件系统
+        """
+        if not tmpl: return False
+        if self.ready and self.root:
+            key = self._rel(tmpl if os.path.isabs(tmpl) else os.path.join(self.root, tmpl))
+            if key is not None: return key in self.entries
+        return os.path.exists(tmpl)
+
+    def names(self):
+        return sorted(i.name for i in self.entries.values())
+
+    def missing(self, products, root):
+        """模板文件缺失的产品列表；未设置模板的产品不算"""
+        return [p for p in products if p.get('template_path')
+                and not self.exists(resolve_template_path(root, p.get('template_path')))]
+
+    def get_fields(self, path):
+        info = self.resolve(path)
+        return info.fields if info else None
+
+    def set_fields(self, path, fields):
+        info = self.resolve(path)
+        if info: info.fields = fields
+
+# 全进程共享 (模板根目录只有一个)
+template_catalog = TemplateCatalog()
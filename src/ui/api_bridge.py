@@ -0,0 +1,61 @@
+from PyQt5.QtCore import QObject, Qt, pyqtSignal
+from concurrent.futures import Future
+
+class PrintPageApi(QObject):
+    """
+    本地接口与打印页之间的桥：接口线程发出请求，经 Qt 排队连接转到界面线程执行，
+    与扫码枪输入走完全相同的 check_sn / accept_sn / do_print 逻辑。
+    """
+    _request = pyqtSignal(object)
+
+    def __init__(self, page):
+        super().__init__(page)
+        self.page = page
+        self._request.connect(self._handle, Qt.QueuedConnection)
+
+    def dispatch(self, action, payload):
+        """可在任意线程调用，返回 Future"""
+        fut = Future()
+        self._request.emit((action, payload, fut))
+        return fut
+
+    def _handle(self, req):
+        action, payload, fut = req
+        if not fut.set_running_or_notify_cancel(): return
+        try:
+            fut.set_result(getattr(self, "do_" + action)(payload))
+        except Exception as e:
+            fut.set_exception(e)
+
+    # --- 动作 ---
+    def do_scan(self, payload):
+        ok, msg = self.page.accept_sn(str(payload.get("sn", "")))
+        res = self.do_carton(payload)
+        res.update(ok=ok, msg=msg)
+        return res
+
+    def do_validate(self, payload):
+        ok, msg = self.page.check_sn(str(payload.get("sn", "")).strip().upper())
+        return {"ok": ok, "msg": msg}
+
+    def do_carton(self, payload):
+        p = self.page.current_product
+        return {
+            "ok": True,
+            "product_id": p.get("id") if p else None,
+            "product": p.get("name") if p else None,
+            "batch": self.page.combo_repair.currentText(),
+            "box_no": self.page.current_box_no,
+            "qty": p.get("qty") if p else 0,
+            "count": len(self.page.current_sn_list),
+            "sns": [x[0] for x in self.page.current_sn_list],
+        }
+
+    def do_print(self, payload):
+        box_no = self.page.current_box_no
+        ok, msg = self.page.do_print()
+        return {"ok": ok, "msg": msg or "当前箱没有可打印的SN", "box_no": box_no if ok else None}
+
+    def do_preview(self, payload):
+        self.page.update_box_preview()
+        return {"ok": bool(self.page.current_product), "box_no": self.page.current_box_no}
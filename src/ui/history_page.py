@@ -1,41 +1,64 @@
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QTableWidget, QPushButton, QHBoxLayout, 
                              QTableWidgetItem, QLineEdit, QHeaderView, QAbstractItemView, 
-                             QMessageBox, QDateEdit, QCheckBox, QFileDialog, QLabel, QProgressBar)
-from PyQt5.QtCore import Qt, QDate, QThread, pyqtSignal
-from src.database import Database
+                             QMessageBox, QDateEdit, QCheckBox, QFileDialog, QLabel, QProgressBar,
+                             QDialog, QFormLayout, QComboBox, QProgressDialog)
+from PyQt5.QtCore import Qt, QDate, pyqtSignal
+from src.database import Database, purge_filter
+from src.events import event_bus
+from src.ui.worker_pool import get_query_pool
 from src.bartender import BartenderPrinter
+from src.label_payload import get_label_payload
+from src.profiling import profiled
 import pandas as pd
 import datetime
-import os
+import threading
 import traceback
 
-# --- 数据库查询线程，防止界面卡顿 ---
-class SearchWorker(QThread):
-    finished = pyqtSignal(list, str) # result_rows, error_msg
+@profiled("history_query")
+def run_search(db, filters, conn):
+    """在工作线程执行历史查询 (服务模式下由数据库服务执行)"""
+    return db.search_records(conn=conn, **filters)
 
-    def __init__(self, db_path, sql, params):
-        super().__init__()
-        self.db_path = db_path
-        self.sql = sql
-        self.params = params
+class PurgeDialog(QDialog):
+    """按条件清理：日期范围 / 箱号 / 产品"""
+    def __init__(self, parent, start, end, names):
+        super().__init__(parent)
+        self.setWindowTitle("按条件清理记录")
+        form = QFormLayout(self)
 
-    def run(self):
-        try:
-            import sqlite3
-            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
-            cursor = conn.cursor()
-            cursor.execute(self.sql, self.params)
-            rows = cursor.fetchall()
-            conn.close()
-            self.finished.emit(rows, "")
-        except Exception as e:
-            self.finished.emit([], str(e))
+        self.chk_date = QCheckBox("按打印日期")
+        self.chk_date.setChecked(True)
+        self.date_start = QDateEdit(start); self.date_start.setCalendarPopup(True); self.date_start.setDisplayFormat("yyyy-MM-dd")
+        self.date_end = QDateEdit(end); self.date_end.setCalendarPopup(True); self.date_end.setDisplayFormat("yyyy-MM-dd")
+        h = QHBoxLayout(); h.addWidget(self.chk_date); h.addWidget(self.date_start); h.addWidget(QLabel("至")); h.addWidget(self.date_end)
+        form.addRow("日期", h)
+
+        self.box_edit = QLineEdit(); self.box_edit.setPlaceholderText("留空表示不限")
+        form.addRow("箱号", self.box_edit)
+
+        self.combo_name = QComboBox(); self.combo_name.addItem("全部", "")
+        for n in names: self.combo_name.addItem(n, n)
+        form.addRow("产品", self.combo_name)
+
+        btn = QPushButton("下一步"); btn.clicked.connect(self.accept)
+        form.addRow(btn)
+
+    def get_filters(self):
+        f = {"box_no": self.box_edit.text().strip() or None, "name": self.combo_name.currentData() or None}
+        if self.chk_date.isChecked():
+            f["start"] = self.date_start.date().toString("yyyy-MM-dd")
+            f["end"] = self.date_end.date().toString("yyyy-MM-dd")
+        return f
 
 class HistoryPage(QWidget):
+    # 清理进度 (工作线程发出，排队回到界面线程)
+    purge_progress = pyqtSignal(int)
+
     def __init__(self):
         super().__init__()
         try:
             self.db = Database()
+            self.pool = get_query_pool(self.db.db_name)
             self.printer = BartenderPrinter()
             self.init_ui()
             self.load()
@@ -80,9 +103,17 @@ class HistoryPage(QWidget):
         self.btn_reprint.setStyleSheet("background-color: #2980b9; color: white; font-weight: bold;")
         self.btn_reprint.clicked.connect(self.reprint_box)
 
+        self.btn_reprint_batch = QPushButton("批量补打")
+        self.btn_reprint_batch.setStyleSheet("background-color: #2980b9; color: white; font-weight: bold;")
+        self.btn_reprint_batch.clicked.connect(self.reprint_selected)
+
         self.btn_del = QPushButton("删除选中")
         self.btn_del.setStyleSheet("color: red;")
         self.btn_del.clicked.connect(self.delete_records)
+
+        self.btn_purge = QPushButton("按条件清理")
+        self.btn_purge.setStyleSheet("color: red;")
+        self.btn_purge.clicked.connect(self.purge_by_filter)
         
         h_layout.addWidget(self.search_input, 2)
         h_layout.addWidget(self.chk_date)
@@ -92,7 +123,9 @@ class HistoryPage(QWidget):
         h_layout.addWidget(self.btn_search)
         h_layout.addWidget(self.btn_exp)
         h_layout.addWidget(self.btn_reprint)
+        h_layout.addWidget(self.btn_reprint_batch)
         h_layout.addWidget(self.btn_del)
+        h_layout.addWidget(self.btn_purge)
         
         layout.addLayout(h_layout)
 
@@ -127,48 +160,32 @@ class HistoryPage(QWidget):
     def refresh_data(self):
         pass
 
+    @profiled("history_load")
     def load(self):
         self.btn_search.setEnabled(False)
         self.progress_bar.show()
         self.lbl_status.setText("正在查询数据库，请稍候...")
         self.table.setRowCount(0)
 
-        keyword = self.search_input.text().strip()
-        sql = """
-            SELECT id, box_no, box_sn_seq, name, spec, model, color, sn, code69, print_date 
-            FROM records 
-            WHERE 1=1
-        """
-        params = []
-
+        filters = {"keyword": self.search_input.text().strip(), "limit": 1000}
         if self.chk_date.isChecked():
-            s_date = self.date_start.date().toString("yyyy-MM-dd")
-            e_date = self.date_end.date().toString("yyyy-MM-dd")
-            start_time = f"{s_date} 00:00:00"
-            end_time = f"{e_date} 23:59:59"
-            sql += " AND print_date >= ? AND print_date <= ?"
-            params.append(start_time)
-            params.append(end_time)
-
-        if keyword:
-            sql += " AND (sn LIKE ? OR box_no LIKE ?)"
-            params.append(f"%{keyword}%")
-            params.append(f"%{keyword}%")
-        
-        sql += " ORDER BY id DESC LIMIT 1000"
+            filters["start"] = self.date_start.date().toString("yyyy-MM-dd")
+            filters["end"] = self.date_end.date().toString("yyyy-MM-dd")
 
-        self.worker = SearchWorker(self.db.db_name, sql, params)
-        self.worker.finished.connect(self.on_search_finished)
-        self.worker.start()
+        # 新的查询会取消仍在执行的旧查询
+        db = self.db
+        self.pool.submit(lambda conn: run_search(db, filters, conn), self.on_search_finished,
+                         self.on_search_error, key="history_search")
 
-    def on_search_finished(self, rows, error):
+    def on_search_error(self, error):
+        self.btn_search.setEnabled(True)
+        self.progress_bar.hide()
+        self.lbl_status.setText(f"查询出错: {error}")
+        QMessageBox.critical(self, "错误", str(error))
+
+    def on_search_finished(self, rows):
         self.btn_search.setEnabled(True)
         self.progress_bar.hide()
-        
-        if error:
-            self.lbl_status.setText(f"查询出错: {error}")
-            QMessageBox.critical(self, "错误", error)
-            return
 
         self.table.setRowCount(0)
         self.table.setSortingEnabled(False) 
@@ -185,6 +202,28 @@ class HistoryPage(QWidget):
         self.table.setSortingEnabled(True)
         self.lbl_status.setText(f"查询完成，共找到 {len(rows)} 条记录 (仅显示前 1000 条)")
 
+    def build_reprint_data(self, box_no, prod_name, records):
+        """
+        根据历史记录还原某一箱的标签数据，返回 (模板路径, 数据字典)；找不到时抛出 ValueError
+        records: fetch_box_records 读出的本箱记录
+        """
+        if not records:
+            raise ValueError(f"未找到箱号 [{box_no}] 的记录")
+
+        # 从产品目录查找 (不查库)；重名产品按本箱 SN 前缀区分
+        first_rec = records[0]
+        found = self.db.get_catalog().resolve(prod_name, first_rec[0])
+        if not found:
+            raise ValueError(f"找不到产品 [{prod_name}] 的信息")
+
+        # 以打印时记录下来的规格/型号/颜色/69码为准，保证补打内容与原标签一致
+        product = found.to_dict()
+        product.update(spec=first_rec[1], model=first_rec[2], color=first_rec[3], code69=first_rec[4])
+        prod_date = first_rec[5] or (first_rec[6] or "")[:10]
+
+        payload = get_label_payload(product, self.db.get_field_mapping(), self.db.get_template_root())
+        return payload.template_path, payload.build(box_no, [r[0] for r in records], prod_date)
+
     def reprint_box(self):
         row = self.table.currentRow()
         if row < 0:
@@ -197,103 +236,178 @@ class HistoryPage(QWidget):
                                 QMessageBox.Yes|QMessageBox.No) != QMessageBox.Yes:
             return
 
+        # 记录在后台读取，打印 (BarTender COM) 仍在界面线程
+        self.lbl_status.setText("正在读取箱记录...")
+        db = self.db
+        self.pool.submit(lambda conn: db.fetch_box_records([box_no], conn),
+                         lambda recs: self.on_reprint_loaded(box_no, prod_name, recs), self.on_task_error)
+
+    def on_reprint_loaded(self, box_no, prod_name, recs):
+        self.lbl_status.setText("")
         try:
-            c = self.db.conn.cursor()
-            c.execute("SELECT template_path, qty, weight, sku FROM products WHERE name=?", (prod_name,))
-            prod_info = c.fetchone()
-            if not prod_info:
-                return QMessageBox.critical(self, "错误", f"找不到产品 [{prod_name}] 的信息")
-            
-            tmpl_path, qty, weight, sku = prod_info
-            
-            c.execute("SELECT sn, box_sn_seq, spec, model, color, code69, print_date FROM records WHERE box_no=? ORDER BY box_sn_seq", (box_no,))
-            records = c.fetchall()
-            
-            if not records:
-                return QMessageBox.warning(self, "错误", "未找到该箱号的记录")
-
-            first_rec = records[0]
-            data_map = {
-                "name": prod_name,
-                "spec": first_rec[2],
-                "model": first_rec[3],
-                "color": first_rec[4],
-                "code69": first_rec[5],
-                "sn4": first_rec[0][:4] if len(first_rec[0])>=4 else "", 
-                "sku": sku,
-                "qty": len(records), 
-                "weight": weight,
-                "box_no": box_no,
-                "prod_date": first_rec[6][:10] if len(first_rec[6])>=10 else ""
-            }
-            
-            full_box_qty = int(qty) if qty else len(records)
-            for i in range(1, full_box_qty + 1):
-                data_map[str(i)] = ""
-            
-            for i, rec in enumerate(records):
-                data_map[str(i+1)] = rec[0]
-
-            mapping = self.db.get_setting('field_mapping')
-            from src.config import DEFAULT_MAPPING
-            if not isinstance(mapping, dict): mapping = DEFAULT_MAPPING
-            
-            final_dat = {}
-            for k, v in mapping.items():
-                if k in data_map: final_dat[v] = data_map[k]
-            for k, v in data_map.items():
-                if k.isdigit(): final_dat[k] = v
-
-            root = self.db.get_setting('template_root')
-            full_path = os.path.join(root, tmpl_path) if root and tmpl_path else tmpl_path
-            
-            ok, msg = self.printer.print_label(full_path, final_dat)
+            path, final_dat = self.build_reprint_data(box_no, prod_name, recs.get(box_no))
+            ok, msg = self.printer.print_label(path, final_dat)
             if ok:
                 QMessageBox.information(self, "成功", "补打指令已发送")
             else:
                 QMessageBox.critical(self, "打印失败", msg)
+        except ValueError as e:
+            QMessageBox.critical(self, "错误", str(e))
+        except Exception as e:
+            traceback.print_exc()
+            QMessageBox.critical(self, "系统错误", str(e))
 
+    def reprint_selected(self):
+        """批量补打：选中行涉及的所有箱号，按模板分组，每个模板只打开一次"""
+        boxes = {}
+        for r in sorted(set(i.row() for i in self.table.selectedIndexes())):
+            boxes.setdefault(self.table.item(r, 1).text(), self.table.item(r, 3).text())
+        if not boxes:
+            return QMessageBox.warning(self, "提示", "请先选择打印记录")
+        if QMessageBox.question(self, "确认", f"确定要重新打印选中的 {len(boxes)} 箱吗？", 
+                                QMessageBox.Yes|QMessageBox.No) != QMessageBox.Yes:
+            return
+
+        self.lbl_status.setText("正在读取箱记录...")
+        db = self.db
+        self.pool.submit(lambda conn: db.fetch_box_records(boxes, conn),
+                         lambda recs: self.on_reprint_batch_loaded(boxes, recs), self.on_task_error)
+
+    def on_reprint_batch_loaded(self, boxes, recs):
+        self.lbl_status.setText("")
+        try:
+            jobs = {}
+            for box_no, prod_name in boxes.items():
+                path, dat = self.build_reprint_data(box_no, prod_name, recs.get(box_no))
+                jobs.setdefault(path, []).append(dat)
+
+            total, errors = 0, []
+            for path, data_maps in jobs.items():
+                printed, msg = self.printer.print_batch(path, data_maps)
+                total += printed
+                if printed < len(data_maps): errors.append(msg)
+            if errors:
+                QMessageBox.critical(self, "打印失败", f"已发送 {total}/{len(boxes)} 箱\n" + "\n".join(errors))
+            else:
+                QMessageBox.information(self, "成功", f"已发送 {total} 箱补打指令")
+        except ValueError as e:
+            QMessageBox.critical(self, "错误", str(e))
         except Exception as e:
             traceback.print_exc()
             QMessageBox.critical(self, "系统错误", str(e))
 
+    def on_task_error(self, error):
+        self.lbl_status.setText("")
+        QMessageBox.critical(self, "错误", str(error))
+
+    @profiled("history_export")
     def export_data(self):
         path, _ = QFileDialog.getSaveFileName(self, "导出", "print_history.xlsx", "Excel (*.xlsx)")
         if not path: return
-        try:
-            rows = []; headers = [self.table.horizontalHeaderItem(i).text() for i in range(self.table.columnCount())]
-            for r in range(self.table.rowCount()):
-                row_data = []
-                for c in range(self.table.columnCount()):
-                    item = self.table.item(r, c)
-                    row_data.append(item.text() if item else "")
-                rows.append(row_data)
-            if not rows: return QMessageBox.warning(self, "提示", "无数据")
-            
-            self.lbl_status.setText("正在导出 Excel，请稍候...")
+        rows = []; headers = [self.table.horizontalHeaderItem(i).text() for i in range(self.table.columnCount())]
+        for r in range(self.table.rowCount()):
+            row_data = []
+            for c in range(self.table.columnCount()):
+                item = self.table.item(r, c)
+                row_data.append(item.text() if item else "")
+            rows.append(row_data)
+        if not rows: return QMessageBox.warning(self, "提示", "无数据")
+
+        def write_excel(conn):
             df = pd.DataFrame(rows, columns=headers)
             if "ID" in df.columns: df = df.drop(columns=["ID"])
             df.to_excel(path, index=False)
-            self.lbl_status.setText("导出成功")
-            QMessageBox.information(self, "成功", "导出成功")
-        except Exception as e: QMessageBox.critical(self, "错误", str(e))
+
+        # 写 Excel 较慢，放到后台线程
+        self.lbl_status.setText("正在导出 Excel，请稍候...")
+        self.btn_exp.setEnabled(False)
+        self.pool.submit(write_excel, self.on_export_done, self.on_export_error)
+
+    def on_export_done(self, _):
+        self.btn_exp.setEnabled(True)
+        self.lbl_status.setText("导出成功")
+        QMessageBox.information(self, "成功", "导出成功")
+
+    def on_export_error(self, error):
+        self.btn_exp.setEnabled(True)
+        self.lbl_status.setText("")
+        QMessageBox.critical(self, "错误", str(error))
 
     def delete_records(self):
-        try:
-            # 获取所有选中行的行号（去重）
-            rows = set(i.row() for i in self.table.selectedIndexes())
-            if not rows: return QMessageBox.warning(self, "提示", "未选中任何记录")
-            
-            # 获取 ID 列表
-            ids = [self.table.item(r, 0).text() for r in rows]
-            
-            if QMessageBox.question(self, "确认", f"确定删除选中的 {len(ids)} 条记录吗?", 
-                                    QMessageBox.Yes|QMessageBox.No) == QMessageBox.Yes:
-                p = ",".join("?" * len(ids))
-                self.db.cursor.execute(f"DELETE FROM records WHERE id IN ({p})", ids)
-                self.db.conn.commit()
-                
-                # 删除后重新加载数据
-                self.load()
-                QMessageBox.information(self, "成功", "删除成功")
-        except Exception as e: QMessageBox.critical(self, "错误", str(e))
+        # 获取所有选中行的行号（去重）
+        rows = set(i.row() for i in self.table.selectedIndexes())
+        if not rows: return QMessageBox.warning(self, "提示", "未选中任何记录")
+        
+        # 获取 ID 列表
+        ids = [self.table.item(r, 0).text() for r in rows]
+        
+        if QMessageBox.question(self, "确认", f"确定删除选中的 {len(ids)} 条记录吗?", 
+                                QMessageBox.Yes|QMessageBox.No) != QMessageBox.Yes:
+            return
+
+        db = self.db
+        self.pool.submit(lambda conn: db.delete_records(ids, conn), self.on_delete_done, self.on_task_error, write=True)
+
+    def purge_by_filter(self):
+        names = sorted({p.name for p in self.db.get_catalog().records if p.name})
+        dlg = PurgeDialog(self, self.date_start.date(), self.date_end.date(), names)
+        if not dlg.exec_(): return
+        filters = dlg.get_filters()
+        try: purge_filter(**filters)
+        except ValueError as e: return QMessageBox.warning(self, "提示", str(e))
+        # 计数要扫描符合条件的记录，同样放到后台
+        self.btn_purge.setEnabled(False)
+        self.lbl_status.setText("正在统计要清理的记录...")
+        db = self.db
+        self.pool.submit(lambda conn: db.count_purge(filters, conn), lambda n: self.confirm_purge(filters, n),
+                         self.on_purge_count_error, key="purge_count")
+
+    def on_purge_count_error(self, error):
+        self.btn_purge.setEnabled(True)
+        self.on_task_error(error)
+
+    def confirm_purge(self, filters, n):
+        self.btn_purge.setEnabled(True)
+        self.lbl_status.setText("")
+        if not n: return QMessageBox.information(self, "提示", "没有符合条件的记录")
+        if QMessageBox.warning(self, "确认", f"将永久删除 {n} 条打印记录，确定？",
+                               QMessageBox.Yes|QMessageBox.No) != QMessageBox.Yes:
+            return
+
+        cancel = threading.Event()
+        dlg_prog = QProgressDialog("正在清理记录...", "取消", 0, n, self)
+        dlg_prog.setWindowTitle("清理")
+        dlg_prog.setWindowModality(Qt.WindowModal)
+        dlg_prog.setMinimumDuration(0)
+        dlg_prog.canceled.connect(cancel.set)
+        self.purge_progress.connect(dlg_prog.setValue)
+        self.btn_purge.setEnabled(False)
+
+        def done(deleted):
+            self.purge_progress.disconnect(dlg_prog.setValue)
+            dlg_prog.close()
+            self.btn_purge.setEnabled(True)
+            event_bus.publish({'records': None})
+            self.load()
+            tip = "已取消，" if cancel.is_set() else ""
+            QMessageBox.information(self, "完成", f"{tip}共删除 {deleted} 条记录")
+
+        def failed(error):
+            self.purge_progress.disconnect(dlg_prog.setValue)
+            dlg_prog.close()
+            self.btn_purge.setEnabled(True)
+            # 已提交的分块不会回滚
+            event_bus.publish({'records': None})
+            self.load()
+            self.on_task_error(error)
+
+        db = self.db
+        self.pool.submit(lambda conn: db.purge_records(filters, conn, progress=self.purge_progress.emit,
+                                                       cancelled=cancel.is_set),
+                         done, failed, key="purge", write=True)
+
+    def on_delete_done(self, _):
+        event_bus.publish({'records': None})
+        # 删除后重新加载数据
+        self.load()
+        QMessageBox.information(self, "成功", "删除成功")
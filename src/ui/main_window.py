@@ -1,15 +1,25 @@
 import sys
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                             QPushButton, QStackedWidget, QLabel, QFrame)
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QIcon
+                             QPushButton, QStackedWidget, QLabel, QFrame, QShortcut, QMessageBox)
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QIcon, QKeySequence
 from src.config import get_resource_path
 from src.version import APP_VERSION
 from src.database import Database
+from src.events import DataVersionWatcher
+from src.metrics import metrics
+from src.profiling import profiler, profiled, PROFILE_DIR
+from src.maintenance import MaintenanceScheduler
+from src.api_server import LocalApiServer
+from src.ui.api_bridge import PrintPageApi
+from src.ui.worker_pool import get_query_pool
+from src.ui.template_watcher import TemplateWatcher
+from src.printer_registry import printer_registry
 
 # 导入各个页面
 from src.ui.product_page import ProductPage
 from src.ui.print_page import PrintPage
+from src.ui.report_page import ReportPage
 # 兼容导入 RecordPage/HistoryPage
 try:
     from src.ui.record_page import RecordPage as HistoryPage
@@ -95,10 +105,11 @@ class MainWindow(QMainWindow):
         self.btn_product = QPushButton("📦  产品管理")
         self.btn_print = QPushButton("🔖  打印标签") 
         self.btn_history = QPushButton("📜  打印记录")
+        self.btn_report = QPushButton("📊  统计报表")
         self.btn_settings = QPushButton("⚙️  设    置")
         
         # 应用样式并添加到布局
-        for btn in [self.btn_product, self.btn_print, self.btn_history, self.btn_settings]:
+        for btn in [self.btn_product, self.btn_print, self.btn_history, self.btn_report, self.btn_settings]:
             btn.setCheckable(True)
             btn.setAutoExclusive(True)
             btn.setStyleSheet(btn_style)
@@ -123,30 +134,140 @@ class MainWindow(QMainWindow):
         self.product_page = ProductPage()
         self.print_page = PrintPage()
         self.history_page = HistoryPage() 
+        self.report_page = ReportPage()
         self.settings_page = SettingsPage()
 
         self.stack.addWidget(self.product_page)
         self.stack.addWidget(self.print_page)
         self.stack.addWidget(self.history_page)
+        self.stack.addWidget(self.report_page)
         self.stack.addWidget(self.settings_page)
 
         # 绑定点击事件
         self.btn_product.clicked.connect(lambda: self.switch_page(0))
         self.btn_print.clicked.connect(lambda: self.switch_page(1))
         self.btn_history.clicked.connect(lambda: self.switch_page(2))
-        self.btn_settings.clicked.connect(lambda: self.switch_page(3))
+        self.btn_report.clicked.connect(lambda: self.switch_page(3))
+        self.btn_settings.clicked.connect(lambda: self.switch_page(4))
 
         # 默认选中“打印标签”
         self.btn_print.click()
 
+        # 轮询 data_version，发现其他工位修改了数据库时刷新当前页面
+        self.db_watcher = DataVersionWatcher(self.db.db_name)
+        self.watch_timer = QTimer(self)
+        self.watch_timer.timeout.connect(self.check_external_changes)
+        self.watch_timer.start(2000)
+
+        # 定期把各阶段耗时统计写入本地指标文件
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(metrics.export)
+        self.metrics_timer.start(60000)
+
+        # 空闲时段做数据库维护 (WAL 检查点 / optimize / 增量回收)，每次只执行一个时间片
+        self.maintenance = MaintenanceScheduler(self.db.db_name)
+        self.maint_timer = QTimer(self)
+        self.maint_timer.timeout.connect(self.run_maintenance)
+        self.maint_timer.start(5000)
+
+        # 模板目录索引：后台扫描一次，之后按文件变化增量更新
+        self.template_watcher = TemplateWatcher(self.db, self)
+        self.template_watcher.start()
+
+        # 打印机列表在后台枚举并按 TTL 刷新，打印前只查缓存
+        self.printer_timer = QTimer(self)
+        self.printer_timer.timeout.connect(self.refresh_printers)
+        self.printer_timer.start(printer_registry.TTL * 1000)
+        self.refresh_printers()
+
+        self.api_server = None
+        self.start_api_server()
+
+        # 性能分析模式：隐藏开关 Ctrl+Shift+P (也可用环境变量 LABEL_PROFILE=1)
+        if self.db.get_setting('profile_mode') == '1': profiler.enable()
+        QShortcut(QKeySequence("Ctrl+Shift+P"), self, self.toggle_profiling)
+
+    def toggle_profiling(self):
+        on = not profiler.enabled
+        if on: profiler.enable()
+        else: profiler.disable()
+        self.db.set_setting('profile_mode', '1' if on else '0')
+        QMessageBox.information(self, "性能分析", f"已开启，结果保存在 {PROFILE_DIR}" if on else "已关闭")
+
+    def start_api_server(self):
+        """本地 HTTP 接口默认关闭，需在 设置 > 系统维护 中开启"""
+        if self.db.get_setting('api_enabled') != '1': return
+        try:
+            host = self.db.get_setting('api_host') or "127.0.0.1"
+            port = int(self.db.get_setting('api_port') or 8765)
+            self.api_bridge = PrintPageApi(self.print_page)
+            self.api_server = LocalApiServer(self.api_bridge.dispatch, host, port)
+            if self.api_server.start():
+                print(f"Local API listening on {host}:{self.api_server.port}")
+            else:
+                self.api_server = None
+        except Exception as e:
+            print(f"API Start Error: {e}")
+            self.api_server = None
+
+    def run_maintenance(self):
+        if self.db.remote: return # 服务模式下由数据库服务所在电脑负责
+        pool = get_query_pool(self.db.db_name)
+        if pool.running("maintenance") or not self.print_page.is_idle(10): return
+        pool.submit(self.maintenance.run_slice, key="maintenance", write=True,
+                    on_error=lambda e: print(f"Maintenance Error: {e}") if "interrupt" not in str(e) else None)
+
+    def refresh_printers(self):
+        pool = get_query_pool(self.db.db_name)
+        if pool.running("printer_refresh"): return
+        pool.submit(lambda conn: printer_registry.refresh(), key="printer_refresh",
+                    on_error=lambda e: print(f"Printer Refresh Error: {e}"))
+
+    @profiled("switch_page")
     def switch_page(self, index):
         self.stack.setCurrentIndex(index)
-        # 切换页面时刷新数据
+        # 切换页面时只刷新发生过变化的数据
         current_widget = self.stack.widget(index)
-        if hasattr(current_widget, 'refresh_data'):
+        if hasattr(current_widget, 'refresh_changed'):
+            current_widget.refresh_changed()
+        elif hasattr(current_widget, 'refresh_data'):
             current_widget.refresh_data()
 
+    def check_external_changes(self):
+        try:
+            if self.db_watcher.poll():
+                current_widget = self.stack.currentWidget()
+                if hasattr(current_widget, 'refresh_changed'):
+                    current_widget.refresh_changed()
+        except Exception as e:
+            print(f"Watch Error: {e}")
+
     def closeEvent(self, event):
+        if hasattr(self, 'watch_timer'):
+            self.watch_timer.stop()
+            self.db_watcher.close()
+        if hasattr(self, 'maint_timer'):
+            self.maint_timer.stop()
+        if hasattr(self, 'printer_timer'):
+            self.printer_timer.stop()
+        try:
+            get_query_pool(self.db.db_name).shutdown()
+        except:
+            pass
+        if hasattr(self, 'metrics_timer'):
+            self.metrics_timer.stop()
+            metrics.export()
+        if getattr(self, 'api_server', None):
+            try:
+                self.api_server.stop()
+            except:
+                pass
+        # 关闭前把扫描日志落盘
+        if hasattr(self, 'print_page') and hasattr(self.print_page, 'journal'):
+            try:
+                self.print_page.journal.close()
+            except:
+                pass
         # 关闭时释放打印机资源
         if hasattr(self, 'print_page') and hasattr(self.print_page, 'printer'):
             try:
@@ -1,12 +1,22 @@
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, 
                              QListWidget, QPushButton, QComboBox, QDateEdit, QGroupBox,
-                             QMessageBox, QTableWidget, QTableWidgetItem, QHeaderView,
-                             QAbstractItemView, QGridLayout)
+                             QMessageBox, QTableView, QHeaderView,
+                             QAbstractItemView, QGridLayout, QInputDialog, QFileDialog, QProgressDialog)
 from PyQt5.QtCore import QDate, Qt, QTimer
-from src.database import Database
+from src.database import Database, DuplicateSNError
+from src.template_catalog import template_catalog
+from src.sn_rules import check_sn_rule
+from src.manifest import ManifestSession, read_manifest_file, load_manifest, manifest_sns, mark_printed
 from src.box_rules import BoxRuleEngine
 from src.bartender import BartenderPrinter
-from src.config import DEFAULT_MAPPING
+from src.events import ChangeTracker
+from src.label_payload import get_label_payload, resolve_template_path
+from src.scan_journal import ScanJournal
+from src.config import get_station_id
+from src.metrics import metrics
+from src.profiling import profiled
+from src.ui.product_model import ProductTableModel, ProductFilterProxy
+from src.ui.worker_pool import get_query_pool
 try:
     from src.utils.updater import AppUpdater
 except ImportError:
@@ -14,21 +24,44 @@ except ImportError:
 
 import datetime
 import os
-import re
+import time
 import traceback
+from collections import deque
+
+# 打印状态标签：样式只解析一次，切换状态时只改动态属性 (避免每次扫描重新解析样式表)
+PRINT_STATUS_STYLE = """
+QLabel { font-size: 40px; font-weight: bold; border: 2px solid #ddd; border-radius: 8px; padding: 10px; min-height: 100px; }
+QLabel[state="pending"] { color: red; background-color: #f9f9f9; }
+QLabel[state="done"] { color: green; background-color: #e8f8f5; }
+"""
+PRINT_STATUS_TEXT = {"pending": "未打印", "done": "打印完成"}
+
+# 清单自动打印：每次预留/写入/送打的箱数 (两批之间处理界面事件，可随时停止)
+MANIFEST_PRINT_CHUNK = 20
 
 class PrintPage(QWidget):
     def __init__(self):
         super().__init__()
         self.db = Database()
+        self.pool = get_query_pool(self.db.db_name)
         self.rule_engine = BoxRuleEngine(self.db)
         self.printer = BartenderPrinter()
         self.current_product = None
         self.current_sn_list = [] 
+        # 扫码枪连续输入时先入队，每个事件循环批量处理一次
+        self.scan_queue = deque()
+        self._scan_scheduled = False
+        self._print_pending = False # 已安排自动封箱
+        self.last_activity = time.monotonic()
         self.current_box_no = ""
+        self.manifest = None # 装箱清单 (ManifestSession)，只对清单所属产品生效
+        self.changes = ChangeTracker(('products', 'box_rules', 'sn_rules', 'records', 'box_counters', 'templates'))
+        
+        self.journal = ScanJournal(self.db.db_name, get_station_id())
         
         self.init_ui()
         self.refresh_data()
+        self.restore_open_carton()
         
         if AppUpdater:
             QTimer.singleShot(2000, lambda: AppUpdater.check_update(self))
@@ -49,13 +82,21 @@ class PrintPage(QWidget):
         self.input_search = QLineEdit()
         self.input_search.setPlaceholderText("🔍 搜索产品...")
         self.input_search.setStyleSheet("font-size: 14px; padding: 6px; margin-bottom: 10px;")
-        self.input_search.textChanged.connect(self.filter_products)
+        # 防抖：停止输入 150ms 后再过滤，连续敲键不会反复刷新列表
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.filter_products)
+        self.input_search.textChanged.connect(lambda _: self.search_timer.start())
         v_left.addWidget(self.input_search)
 
-        # 产品列表
-        self.table_product = QTableWidget()
-        self.table_product.setColumnCount(6)
-        self.table_product.setHorizontalHeaderLabels(["名称", "规格", "颜色", "69码", "SN前4", "箱规"])
+        # 产品列表 (模型 + 过滤代理，数据只加载一次)
+        self.product_model = ProductTableModel(self)
+        self.product_proxy = ProductFilterProxy(self)
+        self.product_proxy.setSourceModel(self.product_model)
+
+        self.table_product = QTableView()
+        self.table_product.setModel(self.product_proxy)
         
         header = self.table_product.horizontalHeader()
         header.setFixedHeight(25) 
@@ -67,7 +108,7 @@ class PrintPage(QWidget):
         self.table_product.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.table_product.setMaximumHeight(150)
         self.table_product.setStyleSheet("margin-bottom: 0px;") 
-        self.table_product.itemClicked.connect(self.on_product_select)
+        self.table_product.clicked.connect(self.on_product_select)
         v_left.addWidget(self.table_product)
 
         v_left.addSpacing(15)
@@ -158,9 +199,10 @@ class PrintPage(QWidget):
         v_left.addLayout(h_ctrl)
 
         # 打印状态
-        self.lbl_print_status = QLabel("未打印")
+        self.lbl_print_status = QLabel()
         self.lbl_print_status.setAlignment(Qt.AlignCenter)
-        self.lbl_print_status.setStyleSheet("font-size: 40px; font-weight: bold; color: red; border: 2px solid #ddd; border-radius: 8px; background-color: #f9f9f9; padding: 10px; min-height: 100px;")
+        self.lbl_print_status.setStyleSheet(PRINT_STATUS_STYLE)
+        self.set_print_status("pending")
         
         h_box_and_status = QHBoxLayout()
         self.lbl_box_title = QLabel("当前箱号:")
@@ -217,44 +259,123 @@ class PrintPage(QWidget):
         self.btn_print.setStyleSheet("background:#e67e22; color:white; font-size:24px; font-weight:bold; border-radius: 5px;")
         self.btn_print.setCursor(Qt.PointingHandCursor)
         self.btn_print.clicked.connect(self.print_label)
-        main_layout.addWidget(self.btn_print)
+
+        # 批量打印：预印外箱标签，一次预留 N 个箱号后一起发送
+        self.btn_batch = QPushButton("批量打印N箱")
+        self.btn_batch.setMinimumHeight(90)
+        self.btn_batch.setStyleSheet("background:#7f8c8d; color:white; font-size:18px; font-weight:bold; border-radius: 5px;")
+        self.btn_batch.setCursor(Qt.PointingHandCursor)
+        self.btn_batch.clicked.connect(self.print_batch)
+
+        # 装箱清单：导入客户提供的 SN -> 箱 对应表，自动打印或扫描核对
+        self.btn_manifest = QPushButton("装箱清单")
+        self.btn_manifest.setMinimumHeight(90)
+        self.btn_manifest.setStyleSheet("background:#16a085; color:white; font-size:18px; font-weight:bold; border-radius: 5px;")
+        self.btn_manifest.setCursor(Qt.PointingHandCursor)
+        self.btn_manifest.clicked.connect(self.on_manifest_clicked)
+
+        h_print = QHBoxLayout()
+        h_print.addWidget(self.btn_print, 5)
+        h_print.addWidget(self.btn_batch, 1)
+        h_print.addWidget(self.btn_manifest, 1)
+        main_layout.addLayout(h_print)
 
     # --- 逻辑功能 ---
 
+    def refresh_changed(self):
+        """切换到本页 / 检测到外部修改时调用：只刷新发生变化的部分"""
+        changes = self.changes.take()
+        if not changes: return
+        if 'products' in changes or 'box_rules' in changes:
+            self.refresh_data()
+            self.resync_current_product()
+        elif ('sn_rules' in changes or 'templates' in changes) and self.current_product:
+            self.show_product_details(self.current_product)
+        if self.current_product and ('records' in changes or 'box_counters' in changes):
+            self.update_box_preview()
+            self.update_daily()
+
+    def resync_current_product(self):
+        """产品表重新加载后，用最新数据替换当前产品 (保留已扫描的SN)"""
+        if not self.current_product: return
+        p = self.db.catalog.get(self.current_product.get('id'))
+        if p:
+            self.current_product = p
+            self.show_product_details(p)
+            self.update_box_preview()
+
     def refresh_data(self):
-        self.p_cache = []
+        self.changes.take()
         try:
-            c = self.db.conn.cursor()
-            c.execute("SELECT * FROM products ORDER BY name")
-            cols = [d[0] for d in c.description]
-            for r in c.fetchall(): self.p_cache.append(dict(zip(cols,r)))
-            self.filter_products()
-        except: pass
+            # 产品目录只重新读取变更过的产品；目录未变化时模型不重置
+            if self.product_model.load(self.db.get_catalog()):
+                self.p_cache = self.product_model.rows
+                self.filter_products()
+        except Exception as e: print(f"Refresh Products Error: {e}")
 
     def filter_products(self):
-        k = self.input_search.text().lower()
-        self.table_product.setRowCount(0)
-        for p in self.p_cache:
-            if k in p['name'].lower() or k in p['code69'].lower():
-                r = self.table_product.rowCount(); self.table_product.insertRow(r)
-                it = QTableWidgetItem(p['name']); it.setData(Qt.UserRole, p)
-                self.table_product.setItem(r,0,it)
-                self.table_product.setItem(r,1,QTableWidgetItem(p.get('spec','')))
-                self.table_product.setItem(r,2,QTableWidgetItem(p.get('color','')))
-                self.table_product.setItem(r,3,QTableWidgetItem(p['code69']))
-                self.table_product.setItem(r,4,QTableWidgetItem(p['sn4']))
-                rn = "无"
-                if p.get('rule_id'):
-                    c=self.db.conn.cursor(); c.execute("SELECT name FROM box_rules WHERE id=?",(p['rule_id'],))
-                    res=c.fetchone(); rn=res[0] if res else "无"
-                self.table_product.setItem(r,5,QTableWidgetItem(rn))
-
-    def on_product_select(self, item):
-        if not item: return
-        p = self.table_product.item(item.row(),0).data(Qt.UserRole)
-        if not p: return
+        self.search_timer.stop()
+        self.product_proxy.set_keyword(self.input_search.text())
 
+    def on_product_select(self, index):
+        if not index or not index.isValid(): return
+        p = self.product_proxy.data(index, Qt.UserRole)
+        if p: self.select_product(p)
+
+    def select_product(self, p):
         self.current_product = p
+        self.show_product_details(p)
+
+        # 切换产品即开始新的一箱，丢弃上一箱的日志
+        self.journal.clear()
+        self.scan_queue.clear()
+        self.current_sn_list=[]; 
+        self.update_sn_list_ui() 
+        self.update_box_preview(); self.update_daily(); self.input_sn.setFocus()
+        
+        self.set_print_status("pending")
+
+    def set_print_status(self, state):
+        if self.lbl_print_status.property("state") == state: return
+        self.lbl_print_status.setText(PRINT_STATUS_TEXT[state])
+        self.lbl_print_status.setProperty("state", state)
+        st = self.lbl_print_status.style()
+        st.unpolish(self.lbl_print_status)
+        st.polish(self.lbl_print_status)
+
+    def restore_open_carton(self):
+        """启动时从扫描日志恢复上次未封箱的 SN (已写入打印记录的会被剔除)"""
+        try:
+            opened = self.journal.load_open()
+            if not opened: return
+            pid, batch, scans = opened
+            p = self.db.get_catalog().get(pid)
+            if not p:
+                self.journal.clear()
+                return
+
+            self.current_product = p
+            self.show_product_details(p)
+            if batch is not None:
+                idx = self.combo_repair.findText(str(batch))
+                if idx >= 0: self.combo_repair.setCurrentIndex(idx)
+
+            restored = []
+            for sn, t in scans:
+                if self.db.check_sn_exists(sn): continue
+                try: t = datetime.datetime.strptime(t, "%Y-%m-%d %H:%M:%S")
+                except: t = datetime.datetime.now()
+                restored.append((sn, t))
+            self.current_sn_list = restored
+            self.update_sn_list_ui()
+            self.update_box_preview(); self.update_daily()
+            if restored:
+                QTimer.singleShot(500, lambda: QMessageBox.information(
+                    self, "恢复", f"已恢复上次未封箱的 {len(restored)} 个SN\n产品: {p.get('name')}"))
+        except Exception as e:
+            print(f"Restore Journal Error: {e}")
+
+    def show_product_details(self, p):
         self.lbl_name.setText(str(p.get('name','')))
         self.lbl_sn4.setText(str(p.get('sn4','')))
         self.lbl_spec.setText(str(p.get('spec','')))
@@ -265,14 +386,14 @@ class PrintPage(QWidget):
         self.lbl_sku.setText(str(p.get('sku','')))
         
         tmpl = p.get('template_path','')
-        self.lbl_tmpl_name.setText(os.path.basename(tmpl) if tmpl else "未设置")
+        if not tmpl: self.lbl_tmpl_name.setText("未设置")
+        elif template_catalog.exists(resolve_template_path(self.db.get_template_root(), tmpl)):
+            self.lbl_tmpl_name.setText(os.path.basename(tmpl))
+        else:
+            self.lbl_tmpl_name.setText(f"{os.path.basename(tmpl)} (文件缺失)")
         
-        rid = p.get('rule_id',0)
-        rname = "无"
-        if rid:
-             c=self.db.conn.cursor(); c.execute("SELECT name FROM box_rules WHERE id=?",(rid,))
-             res=c.fetchone(); rname=res[0] if res else "无"
-        self.lbl_box_rule_name.setText(rname)
+        # 箱规名称已在加载产品时联表查出
+        self.lbl_box_rule_name.setText(p.get('rule_name') or "无")
         
         self.current_sn_rule = None
         sn_rule_name = "无"
@@ -284,13 +405,6 @@ class PrintPage(QWidget):
                  self.current_sn_rule={'fmt':res[1], 'len':res[2]}
         self.lbl_sn_rule.setText(sn_rule_name)
 
-        self.current_sn_list=[]; 
-        self.update_sn_list_ui() 
-        self.update_box_preview(); self.update_daily(); self.input_sn.setFocus()
-        
-        self.lbl_print_status.setText("未打印")
-        self.lbl_print_status.setStyleSheet("font-size: 40px; font-weight: bold; color: red; border: 2px solid #ddd; border-radius: 8px; background-color: #f9f9f9; padding: 10px; min-height: 100px;")
-
     def on_batch_change(self):
         self.update_box_preview()
         self.update_daily()
@@ -309,166 +423,455 @@ class PrintPage(QWidget):
 
     def update_daily(self):
         """
-        更新今日产量。
+        更新今日产量 (后台查询)。
         统计维度：产品 + 规格 + 型号 + 颜色 + 批次 + 69码 + SN前缀
         """
         if not self.current_product: return
         d = datetime.datetime.now().strftime("%Y-%m-%d")+"%"
-        try:
-            current_batch = self.combo_repair.currentText()
-            c = self.db.conn.cursor()
-            
-            # 获取产品配置中的 69码 和 SN前缀
-            code69_val = str(self.current_product.get('code69', '')).strip()
-            # 构造SN前缀匹配字符串，例如 "ABCD%"
-            sn_prefix = str(self.current_product.get('sn4', '')).strip() + '%'
-            
-            # --- 核心修改：增加 69码 和 SN前缀匹配 ---
-            query = """
-                SELECT COUNT(DISTINCT box_no) FROM records 
-                WHERE name=? AND spec=? AND model=? AND color=? AND batch=? 
-                AND code69=? AND sn LIKE ? AND print_date LIKE ?
-            """
-            params = (
-                self.current_product['name'], 
-                self.current_product.get('spec',''), 
-                self.current_product.get('model',''), 
-                self.current_product.get('color',''), 
-                current_batch,
-                code69_val,  # 验证69码
-                sn_prefix,   # 验证SN前缀
-                d
-            )
-            c.execute(query, params)
-            res = c.fetchone()
-            count = res[0] if res else 0
-            self.lbl_daily.setText(f"今日: {count}")
-        except Exception as e:
-            print(f"Update Daily Error: {e}")
-            pass
+        p = self.current_product
+        # 获取产品配置中的 69码 和 SN前缀；SN前缀匹配字符串例如 "ABCD%"
+        params = (
+            p['name'], p.get('spec',''), p.get('model',''), p.get('color',''),
+            self.combo_repair.currentText(),
+            str(p.get('code69', '')).strip(),  # 验证69码
+            str(p.get('sn4', '')).strip() + '%',  # 验证SN前缀
+            d
+        )
+        db = self.db
+        self.pool.submit(lambda conn: db.count_daily_boxes(params, conn),
+                         lambda n: self.lbl_daily.setText(f"今日: {n or 0}"),
+                         lambda e: print(f"Update Daily Error: {e}"), key="daily")
 
     def validate_sn(self, sn):
-        sn = re.sub(r'[\s\W\u200b\ufeff]+$', '', sn); sn = sn.strip() 
         prefix = str(self.current_product.get('sn4', '')).strip()
-        if not sn.startswith(prefix): return False, f"前缀不符！\n要求: {prefix}"
-        
-        if self.current_sn_rule:
-            fmt = self.current_sn_rule['fmt']; mlen = self.current_sn_rule['len']
-            if mlen > 0 and len(sn) != mlen: return False, f"长度错误！\n要求: {mlen}位"
-            
-            parts = re.split(r'(\{SN4\}|\{BATCH\}|\{SEQ\d+\})', fmt)
-            regex_parts = []
-            current_batch = self.combo_repair.currentText()
-            
-            for part in parts:
-                if part == "{SN4}": regex_parts.append(re.escape(prefix))
-                elif part == "{BATCH}": regex_parts.append(re.escape(current_batch))
-                elif part.startswith("{SEQ") and part.endswith("}"):
-                    match = re.search(r'\{SEQ(\d+)\}', part)
-                    if match: regex_parts.append(f"\\d{{{int(match.group(1))}}}")
-                    else: return False, "规则错误"
-                else:
-                    if part: regex_parts.append(re.escape(part))
-            
-            try:
-                if not re.match("^" + "".join(regex_parts) + "$", sn): return False, f"格式不符！\nSN: {sn}"
-            except: return False, "正则错误"
-        return True, ""
+        rule = self.current_sn_rule
+        if not rule: return check_sn_rule(sn, prefix)
+        return check_sn_rule(sn, prefix, rule['fmt'], rule['len'], self.combo_repair.currentText())
 
     def update_sn_list_ui(self):
+        """整表重建 (仅用于切换产品、删除、封箱等场景)"""
         self.list_sn.clear()
-        for i, (sn, _) in enumerate(self.current_sn_list):
-            self.list_sn.addItem(f"{i+1}. {sn}")
+        self.append_sn_rows(0)
+
+    def append_sn_rows(self, start):
+        """只追加 start 之后新加入的 SN 行"""
+        self.list_sn.addItems([f"{i+1}. {sn}" for i, (sn, _) in enumerate(self.current_sn_list[start:], start)])
         self.list_sn.scrollToBottom()
 
+    def check_sn(self, sn):
+        """SN 校验 (不加入列表)，GUI 扫描和本地接口共用，返回 (ok, msg)"""
+        if not self.current_product: return False, "未选择产品"
+        if sn in [x[0] for x in self.current_sn_list]: return False, "重复扫描"
+        if self.db.check_sn_exists(sn): return False, "已打印过"
+        return self.validate_sn(sn)
+
+    def accept_sns(self, sns):
+        """
+        批量校验并加入当前箱 (只查箱内重复和 SN 规则，不访问数据库；已打印过的 SN 在封箱写入时由唯一索引拦截)。
+        满箱后停止接收，返回 (接收数, 错误列表, 未处理的SN)
+        """
+        if not self.current_product: return 0, ["未选择产品"], []
+        self.touch_activity()
+        qty = self.current_product['qty']
+        sns = [s.strip().upper() for s in sns if s.strip()]
+        # 是否已打印过由 records.sn 唯一索引在封箱写入时保证，扫描时不再逐批查库
+        in_box = {x[0] for x in self.current_sn_list}
+        start = len(self.current_sn_list)
+        errors = []
+        batch = self.combo_repair.currentText()
+        pid = self.current_product.get('id')
+        # 清单模式：SN 已在导入时批量校验，扫描只查内存中的清单，整箱数取清单中该箱的数量
+        manifest = self.active_manifest()
+        carton = self.current_manifest_carton()
+        if carton: qty = len(manifest.cartons[carton])
+
+        for idx, sn in enumerate(sns):
+            if len(self.current_sn_list) >= qty:
+                rest = sns[idx:]
+                break
+            if sn in in_box: errors.append(f"{sn}: 重复扫描"); continue
+            if manifest:
+                ok, msg = manifest.check(sn, carton)
+                if ok and not carton:
+                    carton = manifest.carton_of[sn]
+                    qty = len(manifest.cartons[carton])
+            else:
+                with metrics.span("scan.validate"):
+                    ok, msg = self.validate_sn(sn)
+            if not ok: errors.append(f"{sn}: {msg}"); continue
+
+            now = datetime.datetime.now()
+            self.current_sn_list.append((sn, now))
+            in_box.add(sn)
+            self.journal.append(pid, batch, sn, now.strftime("%Y-%m-%d %H:%M:%S"))
+        else:
+            rest = []
+
+        accepted = len(self.current_sn_list) - start
+        if accepted:
+            self.append_sn_rows(start)
+            self.set_print_status("pending")
+        # 只在本次调用把箱装满时安排一次自动封箱 (箱已满时继续到达的扫描不再重复安排)
+        if start < qty <= len(self.current_sn_list) and not self._print_pending:
+            self._print_pending = True
+            QTimer.singleShot(500, self.print_label)
+        return accepted, errors, rest
+
+    def accept_sn(self, sn):
+        """单个 SN 入箱 (本地接口使用)，返回 (ok, msg)"""
+        if not sn.strip(): return False, "SN为空"
+        accepted, errors, rest = self.accept_sns([sn])
+        if accepted: return True, ""
+        return False, errors[0].split(": ", 1)[-1] if errors else "当前箱已满"
+
+    @profiled("on_sn_scan")
     def on_sn_scan(self):
-        if not self.current_product: return
         sn = self.input_sn.text().strip(); self.input_sn.clear() 
         if not sn: return
-        sn = sn.upper()
-
-        if sn in [x[0] for x in self.current_sn_list]: return QMessageBox.warning(self,"错","重复扫描")
-        if self.db.check_sn_exists(sn): return QMessageBox.warning(self,"错","已打印过")
-        
-        ok, msg = self.validate_sn(sn)
-        if not ok: return QMessageBox.warning(self,"校验失败", msg)
-        
-        self.current_sn_list.append((sn, datetime.datetime.now()))
-        self.update_sn_list_ui()
-        
-        self.lbl_print_status.setText("未打印")
-        self.lbl_print_status.setStyleSheet("font-size: 40px; font-weight: bold; color: red; border: 2px solid #ddd; border-radius: 8px; background-color: #f9f9f9; padding: 10px; min-height: 100px;")
-        
-        if len(self.current_sn_list) >= self.current_product['qty']: 
-            QTimer.singleShot(500, self.print_label)
+        self.touch_activity()
+        if not self.current_sn_list and not self.scan_queue: self.detect_product(sn)
+        if not self.current_product: return
+        self.scan_queue.append(sn)
+        if not self._scan_scheduled:
+            self._scan_scheduled = True
+            QTimer.singleShot(0, self.process_scan_queue)
+
+    def touch_activity(self):
+        """有扫描时立即中断正在进行的数据库维护"""
+        self.last_activity = time.monotonic()
+        self.pool.cancel("maintenance")
+
+    def is_idle(self, quiet_seconds):
+        """两箱之间的空闲时段：当前箱为空、没有待处理扫描，且已安静一段时间"""
+        return (not self.current_sn_list and not self.scan_queue
+                and time.monotonic() - self.last_activity >= quiet_seconds)
+
+    def detect_product(self, sn):
+        """
+        空箱时按 SN 前缀自动识别产品 (最长前缀优先)。
+        已选产品与 SN 前缀一致时不切换
+        """
+        cur = self.current_product
+        if cur and sn.upper().startswith(str(cur.get('sn4', '')).strip().upper()): return
+        p = self.db.catalog.match_sn(sn)
+        if not p or p is cur: return
+        self.select_product(p)
+        try:
+            row = self.product_model.rows.index(p)
+            idx = self.product_proxy.mapFromSource(self.product_model.index(row, 0))
+            if idx.isValid(): self.table_product.selectRow(idx.row())
+        except ValueError: pass
+
+    @profiled("scan_batch")
+    def process_scan_queue(self):
+        """一次处理队列中积压的全部扫描"""
+        self._scan_scheduled = False
+        if not self.scan_queue: return
+        sns = list(self.scan_queue); self.scan_queue.clear()
+        with metrics.span("scan.batch"):
+            accepted, errors, rest = self.accept_sns(sns)
+        # 满箱后多出来的 SN 留到封箱后再处理
+        self.scan_queue.extendleft(reversed(rest))
+        if errors:
+            more = f"\n... 另有 {len(errors) - 5} 条" if len(errors) > 5 else ""
+            QMessageBox.warning(self, "校验失败", "\n".join(errors[:5]) + more)
 
     def del_sn(self):
         try:
             rows = sorted([self.list_sn.row(item) for item in self.list_sn.selectedItems()], reverse=True)
             if not rows: return
             
+            removed = []
             for row in rows:
                 if 0 <= row < len(self.current_sn_list):
+                    removed.append(self.current_sn_list[row][0])
                     del self.current_sn_list[row]
+            self.journal.remove(self.current_product.get('id'), removed)
             
             self.update_sn_list_ui()
         except Exception as e:
             print(f"Delete Error: {e}")
 
+    def remove_sns(self, sns):
+        """从当前箱移除指定 SN (封箱写入时发现已打印过的)"""
+        sns = set(sns)
+        self.current_sn_list = [x for x in self.current_sn_list if x[0] not in sns]
+        self.journal.remove(self.current_product.get('id'), list(sns))
+        self.update_sn_list_ui()
+
+    @profiled("print_label")
     def print_label(self):
-        if not self.current_product or not self.current_sn_list: return
+        self._print_pending = False
+        ok, msg = self.do_print()
+        if not ok and msg: QMessageBox.critical(self,"失败", msg)
+
+    def do_print(self):
+        """打印当前箱并写入记录，返回 (ok, msg)；无可打印内容时返回 (False, "")"""
+        if not self.current_product or not self.current_sn_list: return False, ""
         p = self.current_product
-        m = self.db.get_setting('field_mapping')
-        if not isinstance(m, dict): m = DEFAULT_MAPPING
-        
-        code69_val = str(p.get('code69', '')).strip()
         current_batch_val = self.combo_repair.currentText()
+        prod_date = self.date_prod.text()
+        sns = [x[0] for x in self.current_sn_list]
+        last_scan = self.current_sn_list[-1][1]
+        carton = self.current_manifest_carton()
+        if carton and len(sns) < len(self.manifest.cartons[carton]):
+            return False, f"清单箱 {carton} 还差 {len(self.manifest.cartons[carton]) - len(sns)} 个SN"
+        with metrics.span("print.payload"):
+            payload = get_label_payload(p, self.db.get_field_mapping(), self.db.get_template_root())
+        
+        if not template_catalog.exists(payload.template_path):
+            return False, f"找不到模板文件: {payload.template_path}"
+
+        # 预览的箱号只是参考 (其他工位可能同时在装同一产品)，封箱时再原子预留真正的箱号
+        try:
+            box_no, box_key = self.rule_engine.reserve_box_no(p.get('rule_id', 0), p, int(current_batch_val))
+        except Exception as e:
+            return False, f"预留箱号失败: {e}"
+        box_no = box_no or self.current_box_no
+        dat = payload.build(box_no, sns, prod_date)
+
+        # 先写记录再打印：SN 冲突 (已打印过) 时不出标签，打印失败再撤销记录
+        try:
+            with metrics.span("db.insert_records"):
+                self.db.insert_box_records(box_no, p, sns, current_batch_val, prod_date)
+        except DuplicateSNError as e:
+            self.release_box_no(box_key)
+            self.remove_sns(e.sns)
+            if carton:
+                self.manifest.mark_printed(self.db.conn, e.sns)
+                self.db.commit()
+                self.update_manifest_button()
+            return False, "以下SN已打印过，已从当前箱移除，请补扫:\n" + "\n".join(e.sns)
+        except Exception as e:
+            self.release_box_no(box_key)
+            return False, f"写入打印记录失败: {e}"
+
+        with metrics.span("print.label"):
+            ok, msg = self.printer.print_label(payload.template_path, dat)
         
-        src = {"name":p.get('name'), "spec":p.get('spec'), "model":p.get('model'), "color":p.get('color'),
-               "sn4":p.get('sn4'), "sku":p.get('sku'), "code69":code69_val, "qty":len(self.current_sn_list),
-               "weight":p.get('weight'), "box_no":self.current_box_no, "prod_date":self.date_prod.text()}
-        
-        dat = {}
-        for k,v in m.items(): 
-            if k in src: dat[v] = src[k]
-            
-        if "code69" not in dat.values() and "Code69" not in dat.values():
-             dat["Code69"] = code69_val
-             dat["69码"] = code69_val
-        
-        full_box_qty = int(p.get('qty', 0))
-        for i in range(full_box_qty):
-            key = str(i+1)
-            if i < len(self.current_sn_list):
-                dat[key] = self.current_sn_list[i][0]
-            else:
-                dat[key] = "" 
-        
-        root = self.db.get_setting('template_root')
-        tp = p.get('template_path','')
-        path = os.path.join(root, tp) if root and tp else tp
-        
-        ok, msg = self.printer.print_label(path, dat)
-        
-        if ok:
-            now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            # --- 核心修改：在写入记录时增加 batch 字段 ---
-            for i, (sn,_) in enumerate(self.current_sn_list):
-                self.db.cursor.execute("""
-                    INSERT INTO records (box_no, box_sn_seq, name, spec, model, color, code69, sn, print_date, batch) 
-                    VALUES (?,?,?,?,?,?,?,?,?,?)
-                """, (self.current_box_no, i+1, p['name'], p['spec'], p['model'], p['color'], p['code69'], sn, now, current_batch_val))
-            
-            self.db.conn.commit()
-            self.rule_engine.commit_sequence(p['rule_id'], p['id'], int(current_batch_val))
+        if not ok:
+            try: self.db.delete_box_records(box_no, sns)
+            except Exception as e: print(f"Rollback Records Error: {e}")
+            self.release_box_no(box_key)
+            self.update_box_preview()
+        else:
+            self.journal.clear()
+            if carton: self.finish_manifest_cartons([(carton, box_no)])
+            # 最后一个 SN 扫入到标签打印完成 (含自动打印的等待)
+            metrics.record("scan_to_label", (datetime.datetime.now() - last_scan).total_seconds())
             
-            self.lbl_print_status.setText("打印完成")
-            self.lbl_print_status.setStyleSheet("font-size: 40px; font-weight: bold; color: green; border: 2px solid #ddd; border-radius: 8px; background-color: #e8f8f5; padding: 10px; min-height: 100px;")
+            self.set_print_status("done")
             
             self.current_sn_list=[]; 
             self.update_sn_list_ui()
             self.update_box_preview()
             self.update_daily()
-            
-        else: 
-            QMessageBox.critical(self,"失败", msg)
+            # 处理封箱期间继续扫入的 SN
+            if self.scan_queue: QTimer.singleShot(0, self.process_scan_queue)
+        return ok, msg
+
+    def release_box_no(self, key):
+        """封箱失败时归还预留的箱号"""
+        try: self.rule_engine.release_box_no(key)
+        except Exception as e: print(f"Release Box No Error: {e}")
+
+    def print_batch(self):
+        """预印模式：预留 N 个连续箱号并一次性批量打印 (不含SN，不写入打印记录)"""
+        if not self.current_product: return QMessageBox.warning(self, "提示", "请先选择产品")
+        p = self.current_product
+        n, ok = QInputDialog.getInt(self, "批量打印", "打印箱数:", 10, 1, 9999)
+        if not ok: return
+        if QMessageBox.question(self, "确认", f"将预留并打印 {n} 个箱号，确定？",
+                                QMessageBox.Yes|QMessageBox.No) != QMessageBox.Yes:
+            return
+
+        rl = int(self.combo_repair.currentText())
+        boxes = self.rule_engine.reserve_box_numbers(p.get('rule_id', 0), p, n, rl)
+        if not boxes: return QMessageBox.warning(self, "错误", "该产品没有箱号规则")
+
+        payload = get_label_payload(p, self.db.get_field_mapping(), self.db.get_template_root())
+        prod_date = self.date_prod.text()
+        qty = p.get('qty', 0)
+        data_maps = [payload.build(box_no, [], prod_date, qty=qty) for box_no, _ in boxes]
+
+        printed, msg = self.printer.print_batch(payload.template_path, data_maps)
+        self.update_box_preview()
+        if printed == len(boxes):
+            QMessageBox.information(self, "完成", f"已打印 {printed} 箱: {boxes[0][0]} ~ {boxes[-1][0]}")
+        else:
+            QMessageBox.critical(self, "失败", f"{msg}\n已预留箱号: {boxes[0][0]} ~ {boxes[-1][0]}")
+
+    # --- 装箱清单 ---
+
+    def active_manifest(self):
+        """当前产品对应的装箱清单 (选了其他产品时清单暂不生效)"""
+        m = self.manifest
+        if m and self.current_product and m.product_id == self.current_product.get('id'): return m
+        return None
+
+    def current_manifest_carton(self):
+        """当前箱对应的清单箱号 (由第一个扫入的 SN 决定)"""
+        m = self.active_manifest()
+        return m.carton_of.get(self.current_sn_list[0][0]) if m and self.current_sn_list else None
+
+    def update_manifest_button(self):
+        m = self.manifest
+        if not m: return self.btn_manifest.setText("装箱清单")
+        s = m.summary()
+        self.btn_manifest.setText(f"清单 {s['carton_status'].get('done', 0)}/{s['cartons']}箱")
+
+    def on_manifest_clicked(self):
+        if not self.manifest: return self.import_manifest()
+        box = QMessageBox(QMessageBox.Question, "装箱清单", self.manifest.format_summary(), parent=self)
+        btn_auto = box.addButton("自动打印剩余", QMessageBox.AcceptRole)
+        btn_new = box.addButton("导入新清单", QMessageBox.ActionRole)
+        btn_quit = box.addButton("退出清单模式", QMessageBox.DestructiveRole)
+        box.addButton("取消", QMessageBox.RejectRole)
+        box.exec_()
+        if box.clickedButton() is btn_auto: self.auto_print_manifest()
+        elif box.clickedButton() is btn_new: self.import_manifest()
+        elif box.clickedButton() is btn_quit:
+            self.manifest = None
+            self.update_manifest_button()
+
+    def import_manifest(self):
+        """导入清单 (后台)：读文件、写暂存表、批量校验 SN 规则、与打印记录查重"""
+        p = self.current_product
+        if not p: return QMessageBox.warning(self, "提示", "请先选择产品")
+        if self.current_sn_list: return QMessageBox.warning(self, "提示", "当前箱还有未封箱的SN，请先封箱或删除")
+        if self.pool.running("manifest"): return
+        path, _ = QFileDialog.getOpenFileName(self, "选择装箱清单", "", "装箱清单 (*.xlsx *.xls *.csv *.txt)")
+        if not path: return
+
+        prefix = str(p.get('sn4', '')).strip()
+        rule = self.current_sn_rule
+        batch = self.combo_repair.currentText()
+        validate = (lambda sn: check_sn_rule(sn, prefix, rule['fmt'], rule['len'], batch)) if rule else \
+                   (lambda sn: check_sn_rule(sn, prefix))
+        pid, qty, db = p.get('id'), p.get('qty', 0), self.db
+
+        def job(conn):
+            rows = read_manifest_file(path, qty)
+            if not rows: raise ValueError("清单中没有数据")
+            mid, dups = load_manifest(conn, os.path.basename(path), pid, batch, rows, validate)
+            # 服务模式下打印记录在服务端，查出已存在的 SN 后再标记
+            existing = db.find_existing_sns(manifest_sns(conn, mid)) if db.remote else None
+            mark_printed(conn, mid, existing)
+            return ManifestSession.load(conn, mid, dups)
+
+        self.btn_manifest.setEnabled(False)
+        self.btn_manifest.setText("导入中...")
+        self.pool.submit(job, self.on_manifest_loaded, self.on_manifest_error, key="manifest", write=True)
+
+    def on_manifest_error(self, e):
+        self.btn_manifest.setEnabled(True)
+        self.update_manifest_button()
+        QMessageBox.critical(self, "错误", f"导入装箱清单失败: {e}")
+
+    def on_manifest_loaded(self, m):
+        self.btn_manifest.setEnabled(True)
+        self.manifest = m
+        self.update_manifest_button()
+        detail = m.blocked_detail()
+        text = m.format_summary() + ("\n\n有问题的箱 (不会打印):\n" + "\n".join(detail) if detail else "")
+        box = QMessageBox(QMessageBox.Information, "装箱清单", text, parent=self)
+        btn_auto = box.addButton("自动打印", QMessageBox.AcceptRole)
+        box.addButton("扫描核对", QMessageBox.RejectRole)
+        box.exec_()
+        if box.clickedButton() is btn_auto: self.auto_print_manifest()
+        else: self.input_sn.setFocus()
+
+    def finish_manifest_cartons(self, done):
+        """done: [(清单箱号, 实际箱号)]，写回暂存表"""
+        for carton, box_no in done:
+            self.manifest.mark_done(self.db.conn, carton, box_no)
+        self.db.commit()
+        self.update_manifest_button()
+
+    def auto_print_manifest(self):
+        """按清单逐批打印所有可装箱的箱：预留箱号 -> 写入记录 -> 模板只打开一次批量送打"""
+        m = self.active_manifest()
+        if not m: return QMessageBox.warning(self, "提示", "请先选择清单对应的产品")
+        if self.current_sn_list: return QMessageBox.warning(self, "提示", "当前箱还有未封箱的SN，请先封箱或删除")
+        cartons = m.ready_cartons()
+        if not cartons: return QMessageBox.information(self, "提示", "清单中没有可打印的箱")
+        if QMessageBox.question(self, "确认", f"将按清单自动打印 {len(cartons)} 箱，确定？",
+                                QMessageBox.Yes|QMessageBox.No) != QMessageBox.Yes:
+            return
+
+        p = self.current_product
+        payload = get_label_payload(p, self.db.get_field_mapping(), self.db.get_template_root())
+        if not template_catalog.exists(payload.template_path):
+            return QMessageBox.critical(self, "失败", f"找不到模板文件: {payload.template_path}")
+
+        prog = QProgressDialog("正在按清单打印...", "停止", 0, len(cartons), self)
+        prog.setWindowTitle("装箱清单")
+        prog.setWindowModality(Qt.WindowModal)
+        prog.setMinimumDuration(0)
+        prog.setValue(0)
+        self.btn_manifest.setEnabled(False)
+        state = {'queue': deque(cartons), 'printed': 0, 'skipped': [], 'error': ""}
+        QTimer.singleShot(0, lambda: self.print_manifest_chunk(payload, prog, state))
+
+    def print_manifest_chunk(self, payload, prog, state):
+        m, p = self.manifest, self.current_product
+        queue = state['queue']
+        if not queue or prog.wasCanceled() or state['error'] or not self.active_manifest():
+            return self.end_manifest_print(prog, state)
+
+        chunk = [queue.popleft() for _ in range(min(MANIFEST_PRINT_CHUNK, len(queue)))]
+        batch = self.combo_repair.currentText()
+        prod_date = self.date_prod.text()
+        try:
+            boxes = self.rule_engine.reserve_box_numbers(p.get('rule_id', 0), p, len(chunk), int(batch))
+        except Exception as e:
+            boxes, state['error'] = [], f"预留箱号失败: {e}"
+        if not boxes:
+            state['error'] = state['error'] or "该产品没有箱号规则"
+            queue.extendleft(reversed(chunk))
+            return self.end_manifest_print(prog, state)
+
+        jobs, pending = [], []
+        for i, (carton, (box_no, _)) in enumerate(zip(chunk, boxes)):
+            sns = m.cartons[carton]
+            try:
+                with metrics.span("db.insert_records"):
+                    self.db.insert_box_records(box_no, p, sns, batch, prod_date)
+            except DuplicateSNError as e:
+                # 导入后其他工位打印了其中的 SN：跳过这一箱
+                m.mark_printed(self.db.conn, e.sns)
+                state['skipped'].append(carton)
+                continue
+            except Exception as e:
+                state['error'] = f"写入打印记录失败: {e}"
+                pending = chunk[i:]
+                break
+            jobs.append((carton, box_no, sns))
+
+        printed, msg = 0, ""
+        if jobs:
+            data_maps = [payload.build(box_no, sns, prod_date) for _, box_no, sns in jobs]
+            with metrics.span("print.manifest_chunk"):
+                printed, msg = self.printer.print_batch(payload.template_path, data_maps)
+        # 没打出来的箱撤销记录；已预留的箱号作废 (与批量预印一致，不会重号)
+        for _, box_no, sns in jobs[printed:]:
+            try: self.db.delete_box_records(box_no, sns)
+            except Exception as e: print(f"Rollback Records Error: {e}")
+        if printed < len(jobs): state['error'] = msg
+        # 未完成的箱放回队列，用于统计 "未打印"
+        queue.extendleft(reversed([c for c, _, _ in jobs[printed:]] + pending))
+        self.finish_manifest_cartons([(c, b) for c, b, _ in jobs[:printed]])
+        state['printed'] += printed
+        prog.setValue(prog.value() + len(chunk) - len(pending) - (len(jobs) - printed))
+        QTimer.singleShot(0, lambda: self.print_manifest_chunk(payload, prog, state))
+
+    def end_manifest_print(self, prog, state):
+        prog.close()
+        self.btn_manifest.setEnabled(True)
+        self.update_box_preview()
+        self.update_daily()
+        text = f"已打印 {state['printed']} 箱"
+        if state['skipped']: text += f"\n{len(state['skipped'])} 箱含有已打印过的SN，已跳过: " + ", ".join(state['skipped'][:10])
+        if state['queue']: text += f"\n未打印 {len(state['queue'])} 箱"
+        if state['error']: QMessageBox.critical(self, "失败", f"{state['error']}\n{text}")
+        else: QMessageBox.information(self, "完成", text)
@@ -0,0 +1,68 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QSortFilterProxyModel, QModelIndex
+from src.product_search import ProductSearchIndex
+
+# 打印页产品列表的列定义: (表头, 产品字段)
+PRODUCT_COLUMNS = [("名称", "name"), ("规格", "spec"), ("颜色", "color"),
+                   ("69码", "code69"), ("SN前4", "sn4"), ("箱规", "rule_name")]
+
+class ProductTableModel(QAbstractTableModel):
+    """产品数据模型：直接使用共享产品目录中的记录 (已联表带出箱规名称)"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self.search_index = ProductSearchIndex()
+        self._version = None
+
+    def load(self, catalog):
+        """目录内容没有变化时不重置模型；返回是否重新加载"""
+        if catalog.version == self._version: return False
+        self.beginResetModel()
+        self.rows = catalog.records
+        self.search_index.build(self.rows)
+        self._version = catalog.version
+        self.endResetModel()
+        return True
+
+    def product(self, row):
+        if 0 <= row < len(self.rows): return self.rows[row]
+        return None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(PRODUCT_COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid(): return None
+        p = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            val = p.get(PRODUCT_COLUMNS[index.column()][1])
+            return "" if val is None else str(val)
+        if role == Qt.UserRole:
+            return p
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return PRODUCT_COLUMNS[section][0]
+        return super().headerData(section, orientation, role)
+
+class ProductFilterProxy(QSortFilterProxyModel):
+    """根据搜索索引的结果过滤行，本身不做任何字符串比较"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._accepted = None # None 表示不过滤
+
+    def set_keyword(self, keyword):
+        src = self.sourceModel()
+        if not keyword.strip():
+            self._accepted = None
+        else:
+            self._accepted = set(src.search_index.search(keyword))
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        return self._accepted is None or source_row in self._accepted
@@ -3,7 +3,13 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableWidget,
                              QDialog, QFormLayout, QLineEdit, QSpinBox, 
                              QFileDialog, QMessageBox, QComboBox, QAbstractItemView)
 from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QColor
 from src.database import Database
+from src.label_payload import resolve_template_path
+from src.template_catalog import template_catalog
+from src.events import ChangeTracker
+from src.profiling import profiled
+from src.ui.worker_pool import get_query_pool
 import pandas as pd
 import os
 
@@ -11,6 +17,8 @@ class ProductPage(QWidget):
     def __init__(self):
         super().__init__()
         self.db = Database()
+        self.pool = get_query_pool(self.db.db_name)
+        self.changes = ChangeTracker(('products', 'templates'))
         self.layout = QVBoxLayout(self)
         
         # Toolbar
@@ -20,7 +28,8 @@ class ProductPage(QWidget):
         self.btn_del = QPushButton("删除选中"); self.btn_del.clicked.connect(self.delete_product)
         self.btn_imp = QPushButton("导入Excel"); self.btn_imp.clicked.connect(self.import_data)
         self.btn_exp = QPushButton("导出Excel"); self.btn_exp.clicked.connect(self.export_data)
-        for b in [self.btn_add, self.btn_edit, self.btn_del, self.btn_imp, self.btn_exp]: toolbar.addWidget(b)
+        self.btn_tmpl = QPushButton("检查模板"); self.btn_tmpl.clicked.connect(self.check_templates)
+        for b in [self.btn_add, self.btn_edit, self.btn_del, self.btn_imp, self.btn_exp, self.btn_tmpl]: toolbar.addWidget(b)
         toolbar.addStretch()
         self.layout.addLayout(toolbar)
 
@@ -41,21 +50,44 @@ class ProductPage(QWidget):
 
         self.refresh_data()
 
+    def refresh_changed(self):
+        """切换到本页时调用：只有产品表变化过才重新加载"""
+        if self.changes.take(): self.refresh_data()
+
     def refresh_data(self):
+        self.changes.take()
+        # 后台读取；连续刷新时只保留最后一次
+        self.pool.submit(lambda conn: conn.execute("SELECT * FROM products ORDER BY id DESC").fetchall(),
+                         self.fill_table, lambda e: print(f"Refresh error: {e}"), key="product_table")
+
+    def fill_table(self, rows):
         self.table.setRowCount(0)
+        root = self.db.get_template_root()
         try:
-            cursor = self.db.conn.cursor()
-            cursor.execute("SELECT * FROM products ORDER BY id DESC")
-            for r_idx, row in enumerate(cursor.fetchall()):
+            for r_idx, row in enumerate(rows):
                 self.table.insertRow(r_idx)
                 for c_idx, val in enumerate(row):
                     disp = str(val)
                     if c_idx == 10 and val: disp = os.path.basename(val)
                     item = QTableWidgetItem(disp)
                     item.setData(Qt.UserRole, val)
+                    # 模板文件缺失的标红 (查模板目录索引)
+                    if c_idx == 10 and val and not template_catalog.exists(resolve_template_path(root, val)):
+                        item.setForeground(QColor("red")); item.setToolTip("模板文件不存在")
                     self.table.setItem(r_idx, c_idx, item)
         except Exception as e: print(f"Refresh error: {e}")
 
+    def check_templates(self):
+        """列出模板文件缺失的产品"""
+        root = self.db.get_template_root()
+        products = [p for p in self.db.get_catalog().records if p.get('template_path')]
+        missing = template_catalog.missing(products, root)
+        if not missing:
+            return QMessageBox.information(self, "检查模板", f"共 {len(products)} 个产品设置了模板，全部存在")
+        lines = [f"{p.name} ({p.sn4}): {p.template_path}" for p in missing[:30]]
+        more = f"\n... 另有 {len(missing) - 30} 个" if len(missing) > 30 else ""
+        QMessageBox.warning(self, "检查模板", f"以下 {len(missing)} 个产品的模板文件不存在:\n" + "\n".join(lines) + more)
+
     def add_product(self):
         dlg = ProductDialog(self)
         if dlg.exec_():
@@ -64,7 +96,7 @@ class ProductPage(QWidget):
                 sql = '''INSERT INTO products (name, spec, model, color, sn4, sku, code69, qty, weight, template_path, rule_id, sn_rule_id) 
                          VALUES (?,?,?,?,?,?,?,?,?,?,?,?)'''
                 self.db.cursor.execute(sql, d)
-                self.db.conn.commit(); self.refresh_data()
+                self.db.commit('products', ids=[self.db.cursor.lastrowid]); self.refresh_data()
                 QMessageBox.information(self, "成功", "已添加")
             except Exception as e:
                 # 修改：错误提示文案
@@ -86,7 +118,7 @@ class ProductPage(QWidget):
                 sql = '''UPDATE products SET name=?, spec=?, model=?, color=?, sn4=?, sku=?, code69=?, qty=?, weight=?, template_path=?, rule_id=?, sn_rule_id=?
                          WHERE id=?'''
                 self.db.cursor.execute(sql, d)
-                self.db.conn.commit(); self.refresh_data()
+                self.db.commit('products', ids=[int(pid)]); self.refresh_data()
                 QMessageBox.information(self, "成功", "已修改")
             except Exception as e: QMessageBox.critical(self, "错误", str(e))
 
@@ -96,8 +128,9 @@ class ProductPage(QWidget):
             pid = self.table.item(r, 0).text()
             if QMessageBox.question(self,"确认","删除?",QMessageBox.Yes)==QMessageBox.Yes:
                 self.db.cursor.execute("DELETE FROM products WHERE id=?", (pid,))
-                self.db.conn.commit(); self.refresh_data()
+                self.db.commit('products', ids=[int(pid)]); self.refresh_data()
 
+    @profiled("product_import")
     def import_data(self):
         p, _ = QFileDialog.getOpenFileName(self, "导入", "", "Excel (*.xlsx *.xls)")
         if not p: return
@@ -136,47 +169,57 @@ class ProductPage(QWidget):
                         VALUES (?,?,?,?,?,?,?,?,?,?,?,?)''', val)
                     s += 1
                 except: f += 1
-            self.db.conn.commit(); self.refresh_data()
+            self.db.commit('products'); self.refresh_data()
             QMessageBox.information(self, "结果", f"成功: {s}, 失败: {f}")
         except Exception as e: QMessageBox.critical(self, "错", str(e))
 
+    @profiled("product_export")
     def export_data(self):
         """
         导出产品数据到 Excel，并将标题行转换为中文
         """
         p, _ = QFileDialog.getSaveFileName(self, "导出", "products.xlsx", "Excel (*.xlsx)")
         if not p: return
+        # 读库和写 Excel 都在后台线程
+        self.btn_exp.setEnabled(False)
+        self.pool.submit(lambda conn: self.write_excel(conn, p), self.on_export_done, self.on_export_error)
+
+    def on_export_done(self, _):
+        self.btn_exp.setEnabled(True)
+        QMessageBox.information(self, "好", "成功")
+
+    def on_export_error(self, error):
+        self.btn_exp.setEnabled(True)
+        QMessageBox.critical(self, "错误", str(error))
+
+    @staticmethod
+    def write_excel(conn, p):
+        """读取产品表并写入 Excel (工作线程)"""
+        # 1. 读取数据
+        df = pd.read_sql_query("SELECT * FROM products", conn)
         
-        try:
-            # 1. 读取数据
-            df = pd.read_sql_query("SELECT * FROM products", self.db.conn)
-            
-            # 2. 定义中英文字段映射
-            rename_map = {
-                "id": "ID",
-                "name": "名称",
-                "spec": "规格",
-                "model": "型号",
-                "color": "颜色",
-                "sn4": "SN前缀",
-                "sku": "SKU",
-                "code69": "69码",
-                "qty": "数量",
-                "weight": "重量",
-                "template_path": "模板路径",
-                "rule_id": "箱规ID",
-                "sn_rule_id": "SN规ID"
-            }
-            
-            # 3. 重命名列
-            df.rename(columns=rename_map, inplace=True)
-            
-            # 4. 写入文件
-            df.to_excel(p, index=False)
-            QMessageBox.information(self, "好", "成功")
-            
-        except Exception as e:
-            QMessageBox.critical(self, "错误", str(e))
+        # 2. 定义中英文字段映射
+        rename_map = {
+            "id": "ID",
+            "name": "名称",
+            "spec": "规格",
+            "model": "型号",
+            "color": "颜色",
+            "sn4": "SN前缀",
+            "sku": "SKU",
+            "code69": "69码",
+            "qty": "数量",
+            "weight": "重量",
+            "template_path": "模板路径",
+            "rule_id": "箱规ID",
+            "sn_rule_id": "SN规ID"
+        }
+        
+        # 3. 重命名列
+        df.rename(columns=rename_map, inplace=True)
+        
+        # 4. 写入文件
+        df.to_excel(p, index=False)
 
 class ProductDialog(QDialog):
     def __init__(self, parent=None, data=None):
@@ -199,11 +242,12 @@ class ProductDialog(QDialog):
         if data: self.spin_qty.setValue(data[8])
         self.layout.addRow("每箱数量", self.spin_qty)
 
-        self.tmpl_le = QLineEdit(); self.tmpl_le.setReadOnly(True)
-        if data and data[10]: self.tmpl_le.setText(os.path.basename(data[10])); self.full_tmpl = data[10]
-        else: self.full_tmpl = ""
-        b_tmpl = QPushButton("选模板"); b_tmpl.clicked.connect(self.sel_tmpl)
-        h = QHBoxLayout(); h.addWidget(self.tmpl_le); h.addWidget(b_tmpl)
+        # 模板从模板目录索引中选择 (不再每次打开文件对话框)；索引里没有的模板仍可手动浏览
+        self.cb_tmpl = QComboBox(); self.cb_tmpl.addItem("未设置", "")
+        for name in template_catalog.names(): self.cb_tmpl.addItem(name, name)
+        if data and data[10]: self.set_tmpl(data[10])
+        b_tmpl = QPushButton("浏览..."); b_tmpl.clicked.connect(self.sel_tmpl)
+        h = QHBoxLayout(); h.addWidget(self.cb_tmpl, 1); h.addWidget(b_tmpl)
         self.layout.addRow("打印模板", h)
 
         # Box Rule
@@ -228,16 +272,29 @@ class ProductDialog(QDialog):
         btn = QPushButton("保存"); btn.clicked.connect(self.accept)
         self.layout.addRow(btn)
 
+    def set_tmpl(self, tmpl):
+        info = template_catalog.resolve(tmpl)
+        name = info.name if info else tmpl
+        idx = self.cb_tmpl.findData(name)
+        if idx < 0:
+            self.cb_tmpl.addItem(name if template_catalog.exists(resolve_template_path(self.db.get_template_root(), name))
+                                 else f"{name} (文件缺失)", name)
+            idx = self.cb_tmpl.count() - 1
+        self.cb_tmpl.setCurrentIndex(idx)
+
     def sel_tmpl(self):
         root = self.db.get_setting('template_root')
         p, _ = QFileDialog.getOpenFileName(self, "模板", root, "*.btw")
-        if p: self.tmpl_le.setText(os.path.basename(p)); self.full_tmpl = os.path.basename(p)
+        if not p: return
+        # 模板根目录下的按相对路径保存，其余沿用只存文件名
+        info = template_catalog.resolve(os.path.abspath(p))
+        self.set_tmpl(info.name if info else os.path.basename(p))
 
     def get_data(self):
         # 修改：Key 对应上面的 f_map 定义
         return (
             self.inputs["名称"].text(), self.inputs["规格"].text(), self.inputs["型号"].text(), self.inputs["颜色"].text(),
             self.inputs["SN前缀(唯一)"].text(), self.inputs["SKU"].text(), self.inputs["69码"].text(),
-            self.spin_qty.value(), self.inputs["重量"].text(), self.full_tmpl,
+            self.spin_qty.value(), self.inputs["重量"].text(), self.cb_tmpl.currentData() or "",
             self.cb_box.currentData(), self.cb_sn.currentData()
                                                                            )
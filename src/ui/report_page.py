@@ -0,0 +1,123 @@
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
+                             QPushButton, QHeaderView, QAbstractItemView, QMessageBox, QDateEdit,
+                             QComboBox, QCheckBox, QLineEdit, QLabel, QFileDialog)
+from PyQt5.QtCore import QDate
+from src.database import Database
+from src.events import ChangeTracker
+from src.reports import GRANULARITY, DIMENSIONS
+from src.ui.worker_pool import get_query_pool
+import pandas as pd
+
+class ReportPage(QWidget):
+    """统计报表：按 时间 (小时/天/月) × 产品/69码/批次 汇总箱数和数量，数据来自 box_summary 汇总表"""
+
+    def __init__(self):
+        super().__init__()
+        self.db = Database()
+        self.pool = get_query_pool(self.db.db_name)
+        self.changes = ChangeTracker(('records',))
+        self.headers, self.rows = [], []
+        self.init_ui()
+        self.load()
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(10, 10, 10, 10)
+
+        h = QHBoxLayout()
+        self.date_start = QDateEdit(QDate.currentDate().addDays(-7))
+        self.date_start.setCalendarPopup(True)
+        self.date_start.setDisplayFormat("yyyy-MM-dd")
+        self.date_end = QDateEdit(QDate.currentDate())
+        self.date_end.setCalendarPopup(True)
+        self.date_end.setDisplayFormat("yyyy-MM-dd")
+
+        self.combo_gran = QComboBox()
+        self.combo_gran.addItems(list(GRANULARITY))
+        self.combo_gran.setCurrentText("天")
+
+        self.chk_dims = {}
+        for label in DIMENSIONS:
+            chk = QCheckBox(label)
+            chk.setChecked(label == "产品")
+            self.chk_dims[label] = chk
+
+        self.keyword_edit = QLineEdit()
+        self.keyword_edit.setPlaceholderText("产品名称")
+        self.keyword_edit.returnPressed.connect(self.load)
+
+        btn_query = QPushButton("查询")
+        btn_query.clicked.connect(self.load)
+        self.btn_exp = QPushButton("导出Excel")
+        self.btn_exp.clicked.connect(self.export_data)
+
+        h.addWidget(self.date_start); h.addWidget(QLabel("至")); h.addWidget(self.date_end)
+        h.addWidget(QLabel("粒度:")); h.addWidget(self.combo_gran)
+        h.addWidget(QLabel("分组:"))
+        for chk in self.chk_dims.values(): h.addWidget(chk)
+        h.addWidget(self.keyword_edit, 1)
+        h.addWidget(btn_query); h.addWidget(self.btn_exp)
+        layout.addLayout(h)
+
+        self.table = QTableWidget()
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        layout.addWidget(self.table)
+
+        self.lbl_total = QLabel("")
+        self.lbl_total.setStyleSheet("color: gray;")
+        layout.addWidget(self.lbl_total)
+
+    def refresh_changed(self):
+        """切换到本页时：有新的打印记录才重新查询"""
+        if self.changes.take(): self.load()
+
+    def refresh_data(self):
+        self.load()
+
+    def load(self):
+        self.changes.take()
+        args = {
+            "granularity": self.combo_gran.currentText(),
+            "dims": tuple(DIMENSIONS[k] for k, chk in self.chk_dims.items() if chk.isChecked()),
+            "start": self.date_start.date().toString("yyyy-MM-dd"),
+            "end": self.date_end.date().toString("yyyy-MM-dd"),
+            "keyword": self.keyword_edit.text().strip(),
+        }
+        self.lbl_total.setText("正在统计...")
+        db = self.db
+        self.pool.submit(lambda conn: db.run_summary(conn, **args), self.fill_table,
+                         lambda e: self.lbl_total.setText(f"统计出错: {e}"), key="report")
+
+    def fill_table(self, result):
+        self.headers, self.rows = result
+        self.table.setSortingEnabled(False)
+        self.table.clear()
+        self.table.setColumnCount(len(self.headers))
+        self.table.setHorizontalHeaderLabels(self.headers)
+        self.table.setRowCount(len(self.rows))
+        for r, row in enumerate(self.rows):
+            for c, val in enumerate(row):
+                self.table.setItem(r, c, QTableWidgetItem("" if val is None else str(val)))
+        self.table.setSortingEnabled(True)
+        boxes = sum(r[-2] or 0 for r in self.rows)
+        units = sum(r[-1] or 0 for r in self.rows)
+        self.lbl_total.setText(f"共 {len(self.rows)} 行，合计 {boxes} 箱 / {units} 个")
+
+    def export_data(self):
+        if not self.rows: return QMessageBox.warning(self, "提示", "无数据")
+        path, _ = QFileDialog.getSaveFileName(self, "导出", "box_report.xlsx", "Excel (*.xlsx)")
+        if not path: return
+        headers, rows = self.headers, list(self.rows)
+        self.btn_exp.setEnabled(False)
+        self.pool.submit(lambda conn: pd.DataFrame(rows, columns=headers).to_excel(path, index=False),
+                         self.on_export_done, self.on_export_error)
+
+    def on_export_done(self, _):
+        self.btn_exp.setEnabled(True)
+        QMessageBox.information(self, "成功", "导出成功")
+
+    def on_export_error(self, error):
+        self.btn_exp.setEnabled(True)
+        QMessageBox.critical(self, "错误", str(error))
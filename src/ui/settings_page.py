@@ -1,13 +1,20 @@
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QFormLayout, QLineEdit, QPushButton, 
                              QMessageBox, QTextEdit, QGroupBox, QHBoxLayout, 
                              QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView,
-                             QTabWidget, QLabel, QFileDialog, QComboBox, QSpinBox)
-from PyQt5.QtCore import Qt
-# --- 新增导入：用于获取打印机信息 ---
-from PyQt5.QtPrintSupport import QPrinterInfo 
-# -----------------------------------
+                             QTabWidget, QLabel, QFileDialog, QComboBox, QSpinBox, QCheckBox, QDateEdit)
+from PyQt5.QtCore import Qt, QDate
 from src.database import Database
-from src.config import DEFAULT_MAPPING
+from src.events import ChangeTracker, event_bus
+from src.metrics import metrics
+from src.query_log import query_stats
+from src.maintenance import enable_incremental_vacuum
+from src.box_rules import BoxRuleEngine
+from src.box_reconcile import reconcile, repair_counters, format_report, save_report
+from src.rule_simulator import (simulate_box_rule, validate_sn_samples, load_sn_file,
+                                format_box_report, format_sn_report)
+from src.ui.worker_pool import get_query_pool
+from src.printer_registry import printer_registry
+from src.config import DEFAULT_MAPPING, DIAG_DIR
 import json
 import os
 
@@ -15,6 +22,7 @@ class SettingsPage(QWidget):
     def __init__(self):
         super().__init__()
         self.db = Database()
+        self.changes = ChangeTracker(('box_rules', 'sn_rules', 'settings', 'box_counters', 'products'))
         main_layout = QVBoxLayout(self)
         main_layout.setContentsMargins(5, 5, 5, 5)
 
@@ -39,6 +47,22 @@ class SettingsPage(QWidget):
         self.tab_sys = QWidget()
         self.init_sys_tab()
         self.tabs.addTab(self.tab_sys, "4. 系统维护")
+
+        # 5. 诊断
+        self.tab_diag = QWidget()
+        self.init_diag_tab()
+        self.tabs.addTab(self.tab_diag, "5. 诊断")
+
+        # 6. 箱号计数
+        self.tab_counter = QWidget()
+        self.init_counter_tab()
+        self.tabs.addTab(self.tab_counter, "6. 箱号计数")
+
+        # 7. 规则模拟
+        self.tab_sim = QWidget()
+        self.init_sim_tab()
+        self.tabs.addTab(self.tab_sim, "7. 规则模拟")
+        self.tabs.currentChanged.connect(self.on_tab_changed)
         
         main_layout.addWidget(self.tabs)
         
@@ -118,7 +142,7 @@ class SettingsPage(QWidget):
         if not name or not fmt: return
         try:
             self.db.cursor.execute("INSERT INTO box_rules (name, rule_string) VALUES (?,?)", (name, fmt))
-            self.db.conn.commit()
+            self.db.commit('box_rules')
             self.load_box_rules()
             self.box_name_edit.clear()
             self.box_fmt_edit.clear()
@@ -130,7 +154,7 @@ class SettingsPage(QWidget):
         try:
             self.db.cursor.execute("UPDATE box_rules SET name=?, rule_string=? WHERE id=?", 
                                    (self.box_name_edit.text(), self.box_fmt_edit.text(), self.current_box_id))
-            self.db.conn.commit()
+            self.db.commit('box_rules')
             self.load_box_rules()
         except Exception as e:
             QMessageBox.warning(self, "错误", str(e))
@@ -140,7 +164,7 @@ class SettingsPage(QWidget):
         if row >= 0:
             rid = self.table_box.item(row, 0).text()
             self.db.cursor.execute("DELETE FROM box_rules WHERE id=?", (rid,))
-            self.db.conn.commit()
+            self.db.commit('box_rules')
             self.load_box_rules()
 
     def on_box_table_click(self, item):
@@ -223,7 +247,7 @@ class SettingsPage(QWidget):
         if not name or not fmt: return
         try:
             self.db.cursor.execute("INSERT INTO sn_rules (name, rule_string, length) VALUES (?,?,?)", (name, fmt, length))
-            self.db.conn.commit()
+            self.db.commit('sn_rules')
             self.load_sn_rules()
             self.sn_name_edit.clear()
             self.sn_fmt_edit.clear()
@@ -235,7 +259,7 @@ class SettingsPage(QWidget):
         try:
             self.db.cursor.execute("UPDATE sn_rules SET name=?, rule_string=?, length=? WHERE id=?", 
                                    (self.sn_name_edit.text(), self.sn_fmt_edit.text(), self.sn_len_spin.value(), self.current_sn_id))
-            self.db.conn.commit()
+            self.db.commit('sn_rules')
             self.load_sn_rules()
         except Exception as e:
             QMessageBox.warning(self, "错误", str(e))
@@ -245,7 +269,7 @@ class SettingsPage(QWidget):
         if row >= 0:
             rid = self.table_sn.item(row, 0).text()
             self.db.cursor.execute("DELETE FROM sn_rules WHERE id=?", (rid,))
-            self.db.conn.commit()
+            self.db.commit('sn_rules')
             self.load_sn_rules()
 
     def on_sn_table_click(self, item):
@@ -324,13 +348,50 @@ class SettingsPage(QWidget):
 
     # ================= 4. 系统维护 =================
     def get_available_printers(self):
-        """获取系统上所有可用的打印机名称列表。"""
-        # 使用 QPrinterInfo 获取打印机列表
-        printers = [info.printerName() for info in QPrinterInfo.availablePrinters()]
+        """获取系统上所有可用的打印机名称列表 (读打印机缓存，不阻塞界面)。"""
+        printers = printer_registry.names()
         # 确保列表中包含一个“使用系统默认”的选项，并放在第一位
         printers.insert(0, "使用系统默认打印机")
         return printers
 
+    def fill_printers(self, *_):
+        """用打印机缓存重新填充下拉框，保留当前选择"""
+        current = self.combo_printer.currentText()
+        self.combo_printer.blockSignals(True)
+        self.combo_printer.clear()
+        self.combo_printer.addItems(self.get_available_printers())
+        for i in range(1, self.combo_printer.count()):
+            info = printer_registry.get(self.combo_printer.itemText(i))
+            if info: self.combo_printer.setItemData(i, info.status, Qt.ToolTipRole)
+        self.combo_printer.blockSignals(False)
+        if current: self.select_printer(current)
+        self.show_printer_status()
+
+    def refresh_printers(self):
+        """后台重新枚举打印机 (网络打印队列可能很慢)"""
+        self.lbl_printer_status.setText("正在检测打印机...")
+        get_query_pool(self.db.db_name).submit(lambda conn: printer_registry.refresh(), self.fill_printers,
+                                               lambda e: self.lbl_printer_status.setText(f"检测失败: {e}"),
+                                               key="printer_refresh")
+
+    def select_printer(self, name):
+        index = self.combo_printer.findText(name)
+        if index < 0:
+            # 已保存的打印机暂未检测到 (尚未枚举完成或已脱机)，仍保留在列表中
+            self.combo_printer.addItem(name)
+            index = self.combo_printer.count() - 1
+        self.combo_printer.setCurrentIndex(index)
+
+    def show_printer_status(self):
+        if not printer_registry.ready:
+            return self.lbl_printer_status.setText("正在检测打印机...")
+        name = self.combo_printer.currentText()
+        if self.combo_printer.currentIndex() == 0: name = None
+        info = printer_registry.get(name)
+        if info is None: self.lbl_printer_status.setText("未检测到")
+        else: self.lbl_printer_status.setText(f"{info.name}: {info.status}" if not name else info.status)
+        self.lbl_printer_status.setStyleSheet("color: green;" if info and info.online else "color: red;")
+
     def init_sys_tab(self):
         layout = QVBoxLayout(self.tab_sys)
         
@@ -350,11 +411,17 @@ class SettingsPage(QWidget):
         l_printer = QHBoxLayout(g_printer)
         self.combo_printer = QComboBox()
         self.combo_printer.addItems(self.get_available_printers())
+        self.combo_printer.currentIndexChanged.connect(self.show_printer_status)
+        self.lbl_printer_status = QLabel("")
         
+        btn_refresh_printer = QPushButton("刷新")
+        btn_refresh_printer.clicked.connect(self.refresh_printers)
         btn_save_printer = QPushButton("保存设置")
         btn_save_printer.clicked.connect(self.sel_default_printer)
         
         l_printer.addWidget(self.combo_printer)
+        l_printer.addWidget(self.lbl_printer_status)
+        l_printer.addWidget(btn_refresh_printer)
         l_printer.addWidget(btn_save_printer)
         l_printer.setStretchFactor(self.combo_printer, 1)
         layout.addWidget(g_printer)
@@ -378,9 +445,52 @@ class SettingsPage(QWidget):
         b3.clicked.connect(self.do_backup)
         b4 = QPushButton("从文件恢复")
         b4.clicked.connect(self.do_restore)
+        b5 = QPushButton("整理数据库")
+        b5.setToolTip("执行一次 VACUUM 并启用增量回收，之后删除记录释放的空间会在空闲时自动回收")
+        b5.clicked.connect(self.do_vacuum)
+        self.btn_reconcile = QPushButton("箱号核对")
+        self.btn_reconcile.setToolTip("检查流水号缺号、重复箱号，以及箱号计数是否落后于已打印的箱号")
+        self.btn_reconcile.clicked.connect(self.do_reconcile)
         l3.addWidget(b3)
         l3.addWidget(b4)
+        l3.addWidget(b5)
+        l3.addWidget(self.btn_reconcile)
         layout.addWidget(g3)
+
+        # 本地 HTTP 接口 (供 PLC / 手持终端推送扫描)
+        g_api = QGroupBox("本地接口 (HTTP/JSON，重启后生效)")
+        l_api = QHBoxLayout(g_api)
+        self.chk_api = QCheckBox("启用")
+        self.api_host_edit = QLineEdit()
+        self.api_host_edit.setPlaceholderText("127.0.0.1")
+        self.api_port_spin = QSpinBox()
+        self.api_port_spin.setRange(1, 65535)
+        self.api_port_spin.setValue(8765)
+        b_api = QPushButton("保存设置")
+        b_api.clicked.connect(self.save_api_settings)
+        l_api.addWidget(self.chk_api)
+        l_api.addWidget(QLabel("地址:"))
+        l_api.addWidget(self.api_host_edit)
+        l_api.addWidget(QLabel("端口:"))
+        l_api.addWidget(self.api_port_spin)
+        l_api.addWidget(b_api)
+        layout.addWidget(g_api)
+
+        # 数据库服务 (多工位部署)
+        g_srv = QGroupBox("数据库服务地址 (多工位共用，留空为直接访问数据库文件，重启后生效)")
+        l_srv = QHBoxLayout(g_srv)
+        self.db_server_edit = QLineEdit()
+        self.db_server_edit.setPlaceholderText("例如 192.168.1.10:8766")
+        self.db_token_edit = QLineEdit()
+        self.db_token_edit.setEchoMode(QLineEdit.Password)
+        self.db_token_edit.setPlaceholderText("与服务端 --token 一致")
+        b_srv = QPushButton("保存设置")
+        b_srv.clicked.connect(self.save_db_server)
+        l_srv.addWidget(self.db_server_edit)
+        l_srv.addWidget(QLabel("口令:"))
+        l_srv.addWidget(self.db_token_edit)
+        l_srv.addWidget(b_srv)
+        layout.addWidget(g_srv)
         
         layout.addStretch()
 
@@ -391,18 +501,22 @@ class SettingsPage(QWidget):
         p2 = self.db.get_setting('backup_path')
         if p2: self.path_bk_edit.setText(p2)
 
+        self.chk_api.setChecked(self.db.get_setting('api_enabled') == '1')
+        self.api_host_edit.setText(self.db.get_setting('api_host') or "127.0.0.1")
+        try: self.api_port_spin.setValue(int(self.db.get_setting('api_port') or 8765))
+        except ValueError: pass
+        self.db_server_edit.setText(self.db.get_setting('db_server') or "")
+        self.db_token_edit.setText(self.db.get_setting('db_token') or "")
+
     def load_default_printer(self):
         """加载默认打印机设置。"""
         default_printer_name = self.db.get_setting('default_printer')
         if default_printer_name:
-            index = self.combo_printer.findText(default_printer_name)
-            if index >= 0:
-                self.combo_printer.setCurrentIndex(index)
-            else:
-                # 如果数据库中的打印机不在当前列表中，则默认选中第一个
-                self.combo_printer.setCurrentIndex(0)
+            self.select_printer(default_printer_name)
         else:
             self.combo_printer.setCurrentIndex(0)
+        self.show_printer_status()
+        if printer_registry.stale(): self.refresh_printers()
 
     def sel_tmpl_path(self):
         p = QFileDialog.getExistingDirectory(self, "选择模板根目录")
@@ -427,6 +541,17 @@ class SettingsPage(QWidget):
         self.db.conn.commit()
         QMessageBox.information(self, "成功", f"默认打印机已设置为: {selected_printer}")
 
+    def save_api_settings(self):
+        self.db.set_setting('api_enabled', '1' if self.chk_api.isChecked() else '0')
+        self.db.set_setting('api_host', self.api_host_edit.text().strip() or "127.0.0.1")
+        self.db.set_setting('api_port', str(self.api_port_spin.value()))
+        QMessageBox.information(self, "成功", "接口设置已保存，重启程序后生效")
+
+    def save_db_server(self):
+        self.db.set_setting('db_server', self.db_server_edit.text().strip())
+        self.db.set_setting('db_token', self.db_token_edit.text().strip())
+        QMessageBox.information(self, "成功", "数据库服务地址已保存，重启程序后生效")
+
     def do_backup(self):
         # 确保路径已保存并提交
         self.db.conn.commit() 
@@ -466,6 +591,60 @@ class SettingsPage(QWidget):
         except Exception as e:
             print(f"Error cleaning backups: {e}")
 
+    def do_vacuum(self):
+        if QMessageBox.question(self, "确认", "整理数据库可能需要几分钟，期间请勿打印，确定？",
+                                QMessageBox.Yes|QMessageBox.No) != QMessageBox.Yes:
+            return
+        get_query_pool(self.db.db_name).submit(
+            enable_incremental_vacuum,
+            lambda changed: QMessageBox.information(self, "完成", "整理完成，已启用增量回收" if changed else "已是增量回收模式，无需整理"),
+            lambda e: QMessageBox.critical(self, "错误", str(e)), write=True)
+
+    def do_reconcile(self):
+        # 核对要扫描全部打印记录并修改计数，服务模式下两者都在服务端
+        if self.db.remote:
+            return QMessageBox.information(self, "提示", "服务模式下请在数据库服务所在电脑上执行箱号核对")
+        catalog = self.db.get_catalog()
+        engine = BoxRuleEngine(self.db)
+        self.btn_reconcile.setEnabled(False)
+        self.btn_reconcile.setText("核对中...")
+        get_query_pool(self.db.db_name).submit(
+            lambda conn: reconcile(conn, engine, catalog), self.on_reconcile_done,
+            self.on_reconcile_error, key="box_reconcile")
+
+    def on_reconcile_done(self, report):
+        self.btn_reconcile.setEnabled(True)
+        self.btn_reconcile.setText("箱号核对")
+        text = format_report(report, self.db.get_catalog())
+        try: path = save_report(text)
+        except Exception as e:
+            print(f"Save reconcile report error: {e}")
+            path = ""
+        behind = [k for k in report["keys"] if k["tail"] < 0]
+        gaps = sum(1 for k in report["keys"] if k["gaps"])
+        msg = (f"共核对 {report['total_boxes']} 个箱号\n"
+               f"重复箱号: {len(report['duplicates'])}\n"
+               f"有缺号的计数: {gaps}\n"
+               f"计数落后 (会重复发号): {len(behind)}\n"
+               f"无法按规则解析: {report['unmatched']}\n\n详细报告: {path}")
+        if not behind:
+            return QMessageBox.information(self, "核对完成", msg)
+        if QMessageBox.question(self, "核对完成", msg + "\n\n是否把落后的计数推进到已打印的最大流水号？",
+                                QMessageBox.Yes|QMessageBox.No) != QMessageBox.Yes:
+            return
+        get_query_pool(self.db.db_name).submit(
+            lambda conn: repair_counters(conn, report), self.on_repair_done,
+            lambda e: QMessageBox.critical(self, "错误", str(e)), write=True)
+
+    def on_reconcile_error(self, error):
+        self.btn_reconcile.setEnabled(True)
+        self.btn_reconcile.setText("箱号核对")
+        QMessageBox.critical(self, "错误", f"核对失败: {error}")
+
+    def on_repair_done(self, n):
+        event_bus.publish({'box_counters': None})
+        QMessageBox.information(self, "完成", f"已修复 {n} 个计数")
+
     def do_restore(self):
         p, _ = QFileDialog.getOpenFileName(self, "选择数据库", "", "DB (*.db)")
         if p:
@@ -473,10 +652,291 @@ class SettingsPage(QWidget):
                 ok, msg = self.db.restore_db(p)
                 QMessageBox.information(self, "结果", msg)
 
+    # ================= 5. 诊断 =================
+    def init_diag_tab(self):
+        layout = QVBoxLayout(self.tab_diag)
+        layout.addWidget(QLabel(f"工位: {metrics.station}    各阶段耗时 (毫秒，百分位基于最近样本)"))
+
+        self.table_metrics = QTableWidget()
+        self.table_metrics.setColumnCount(7)
+        self.table_metrics.setHorizontalHeaderLabels(["阶段", "次数", "平均", "P50", "P95", "P99", "最大"])
+        self.table_metrics.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table_metrics.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        layout.addWidget(self.table_metrics)
+
+        h = QHBoxLayout()
+        btn_refresh = QPushButton("刷新")
+        btn_refresh.clicked.connect(self.load_metrics)
+        btn_export = QPushButton("立即导出")
+        btn_export.clicked.connect(self.export_metrics)
+        btn_reset = QPushButton("清零")
+        btn_reset.clicked.connect(self.reset_metrics)
+        h.addWidget(btn_refresh); h.addWidget(btn_export); h.addWidget(btn_reset)
+        layout.addLayout(h)
+
+        # 慢查询日志
+        g_sql = QGroupBox("SQL 统计 / 慢查询")
+        h_sql = QHBoxLayout(g_sql)
+        h_sql.addWidget(QLabel("慢查询阈值(ms):"))
+        self.slow_ms_spin = QSpinBox()
+        self.slow_ms_spin.setRange(1, 60000)
+        self.slow_ms_spin.setValue(int(query_stats.slow_ms))
+        h_sql.addWidget(self.slow_ms_spin)
+        btn_slow = QPushButton("保存阈值")
+        btn_slow.clicked.connect(self.save_slow_ms)
+        btn_dump = QPushButton("导出SQL统计")
+        btn_dump.clicked.connect(self.dump_sql_stats)
+        h_sql.addWidget(btn_slow); h_sql.addWidget(btn_dump); h_sql.addStretch()
+        layout.addWidget(g_sql)
+
+    def on_tab_changed(self, index):
+        if self.tabs.widget(index) is self.tab_diag: self.load_metrics()
+        elif self.tabs.widget(index) is self.tab_counter: self.load_counters()
+
+    def load_metrics(self):
+        snap = metrics.snapshot()
+        self.table_metrics.setRowCount(len(snap))
+        for r, (name, s) in enumerate(snap):
+            vals = [name, str(s['count'])] + [f"{s[k]:.1f}" for k in ('avg_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')]
+            for c, v in enumerate(vals):
+                self.table_metrics.setItem(r, c, QTableWidgetItem(v))
+
+    def export_metrics(self):
+        metrics.export()
+        QMessageBox.information(self, "完成", f"已写入 {DIAG_DIR} 目录下的指标文件")
+
+    def reset_metrics(self):
+        metrics.reset()
+        self.load_metrics()
+
+    def save_slow_ms(self):
+        self.db.set_setting('slow_query_ms', str(self.slow_ms_spin.value()))
+        query_stats.slow_ms = float(self.slow_ms_spin.value())
+        QMessageBox.information(self, "成功", "慢查询阈值已保存")
+
+    def dump_sql_stats(self):
+        try:
+            path = query_stats.dump()
+            QMessageBox.information(self, "完成", f"SQL 统计已导出:\n{os.path.abspath(path)}")
+        except Exception as e:
+            QMessageBox.critical(self, "错误", str(e))
+
+    # ================= 6. 箱号计数 =================
+    def init_counter_tab(self):
+        layout = QVBoxLayout(self.tab_counter)
+
+        h = QHBoxLayout()
+        self.counter_product = QComboBox()
+        self.counter_year = QSpinBox()
+        self.counter_year.setRange(0, 2099)
+        self.counter_year.setSpecialValueText("全部")
+        self.counter_month = QSpinBox()
+        self.counter_month.setRange(0, 12)
+        self.counter_month.setSpecialValueText("全部")
+        btn_query = QPushButton("查询")
+        btn_query.clicked.connect(self.load_counters)
+        h.addWidget(QLabel("产品:")); h.addWidget(self.counter_product, 1)
+        h.addWidget(QLabel("年:")); h.addWidget(self.counter_year)
+        h.addWidget(QLabel("月:")); h.addWidget(self.counter_month)
+        h.addWidget(btn_query)
+        layout.addLayout(h)
+
+        self.table_counter = QTableWidget()
+        self.table_counter.setColumnCount(6)
+        self.table_counter.setHorizontalHeaderLabels(["产品", "箱号规则", "年", "月", "返修等级", "当前流水号"])
+        self.table_counter.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table_counter.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table_counter.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table_counter.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        layout.addWidget(self.table_counter)
+
+        h2 = QHBoxLayout()
+        btn_reset_sel = QPushButton("重置选中")
+        btn_reset_sel.clicked.connect(lambda: self.reset_counters(selected_only=True))
+        btn_reset_all = QPushButton("重置当前列表全部")
+        btn_reset_all.clicked.connect(lambda: self.reset_counters(selected_only=False))
+        h2.addWidget(btn_reset_sel); h2.addWidget(btn_reset_all); h2.addStretch()
+        layout.addLayout(h2)
+        self.counter_keys = []
+
+    def load_counter_products(self):
+        pid = self.counter_product.currentData()
+        self.counter_product.blockSignals(True)
+        self.counter_product.clear()
+        self.counter_product.addItem("全部", None)
+        for p in self.db.get_catalog().records:
+            self.counter_product.addItem(f"{p.name} ({p.sn4})", p.id)
+        idx = self.counter_product.findData(pid)
+        self.counter_product.setCurrentIndex(max(idx, 0))
+        self.counter_product.blockSignals(False)
+
+    def load_counters(self):
+        try:
+            rows = self.db.list_box_counters(self.counter_product.currentData(),
+                                             self.counter_year.value() or None, self.counter_month.value() or None)
+        except Exception as e:
+            return QMessageBox.critical(self, "错误", str(e))
+        catalog = self.db.get_catalog()
+        self.db.cursor.execute("SELECT id, name FROM box_rules")
+        rules = dict(self.db.cursor.fetchall())
+        self.counter_keys = [r[:5] for r in rows]
+        self.table_counter.setRowCount(len(rows))
+        for i, (pid, rid, y, m, lvl, val) in enumerate(rows):
+            p = catalog.get(pid)
+            vals = [p.name if p else f"(已删除 {pid})", rules.get(rid, str(rid)), y, m, lvl, val]
+            for c, v in enumerate(vals):
+                self.table_counter.setItem(i, c, QTableWidgetItem(str(v)))
+
+    def reset_counters(self, selected_only):
+        if selected_only:
+            keys = [self.counter_keys[i.row()] for i in self.table_counter.selectionModel().selectedRows()]
+        else:
+            keys = list(self.counter_keys)
+        if not keys: return QMessageBox.warning(self, "提示", "没有可重置的计数")
+        if QMessageBox.warning(self, "警告", f"重置 {len(keys)} 个计数后，流水号将从头开始，可能与已打印的箱号重复。确定？",
+                               QMessageBox.Yes|QMessageBox.No) != QMessageBox.Yes:
+            return
+        try:
+            n = self.db.reset_box_counters(keys)
+            self.load_counters()
+            QMessageBox.information(self, "完成", f"已重置 {n} 个计数")
+        except Exception as e:
+            QMessageBox.critical(self, "错误", str(e))
+
+    # ================= 7. 规则模拟 =================
+    def init_sim_tab(self):
+        layout = QVBoxLayout(self.tab_sim)
+
+        h = QHBoxLayout()
+        self.sim_product = QComboBox()
+        self.sim_product.currentIndexChanged.connect(self.on_sim_product_changed)
+        self.sim_sn4 = QLineEdit()
+        self.sim_sn4.setPlaceholderText("SN前缀")
+        self.sim_batch = QLineEdit("0")
+        self.sim_batch.setMaximumWidth(50)
+        h.addWidget(QLabel("产品:")); h.addWidget(self.sim_product, 1)
+        h.addWidget(QLabel("SN前缀:")); h.addWidget(self.sim_sn4)
+        h.addWidget(QLabel("批次:")); h.addWidget(self.sim_batch)
+        layout.addLayout(h)
+
+        g_box = QGroupBox("箱号规则模拟 (不读写计数)")
+        f = QFormLayout(g_box)
+        self.sim_box_rule = QComboBox()
+        self.sim_box_rule.setEditable(True) # 可直接输入尚未保存的规则
+        f.addRow("箱号规则:", self.sim_box_rule)
+        h_date = QHBoxLayout()
+        self.sim_start = QDateEdit(QDate.currentDate())
+        self.sim_end = QDateEdit(QDate.currentDate().addMonths(12))
+        for w in (self.sim_start, self.sim_end):
+            w.setCalendarPopup(True)
+            w.setDisplayFormat("yyyy-MM-dd")
+        self.sim_per_day = QSpinBox()
+        self.sim_per_day.setRange(1, 100000)
+        self.sim_per_day.setValue(100)
+        self.sim_level = QSpinBox()
+        self.sim_level.setRange(0, 9)
+        h_date.addWidget(self.sim_start); h_date.addWidget(QLabel("至")); h_date.addWidget(self.sim_end)
+        h_date.addWidget(QLabel("每天箱数:")); h_date.addWidget(self.sim_per_day)
+        h_date.addWidget(QLabel("返修等级:")); h_date.addWidget(self.sim_level)
+        f.addRow("日期范围:", h_date)
+        btn_box = QPushButton("生成并检查")
+        btn_box.clicked.connect(self.do_simulate_box)
+        f.addRow(btn_box)
+        layout.addWidget(g_box)
+
+        g_sn = QGroupBox("SN规则批量校验")
+        h_sn = QHBoxLayout(g_sn)
+        self.sim_sn_rule = QComboBox()
+        btn_sn = QPushButton("载入SN样本文件并校验")
+        btn_sn.clicked.connect(self.do_validate_sn_file)
+        h_sn.addWidget(QLabel("SN规则:")); h_sn.addWidget(self.sim_sn_rule, 1); h_sn.addWidget(btn_sn)
+        layout.addWidget(g_sn)
+
+        self.sim_result = QTextEdit()
+        self.sim_result.setReadOnly(True)
+        layout.addWidget(self.sim_result)
+
+    def load_sim_options(self):
+        pid = self.sim_product.currentData()
+        self.sim_product.blockSignals(True)
+        self.sim_product.clear()
+        self.sim_product.addItem("(手动输入SN前缀)", None)
+        for p in self.db.get_catalog().records:
+            self.sim_product.addItem(f"{p.name} ({p.sn4})", p.id)
+        self.sim_product.setCurrentIndex(max(self.sim_product.findData(pid), 0))
+        self.sim_product.blockSignals(False)
+
+        box_text = self.sim_box_rule.currentText()
+        sn_id = self.sim_sn_rule.currentData()
+        self.sim_box_rule.clear()
+        self.sim_sn_rule.clear()
+        self.sim_sn_rule.addItem("(只校验前缀)", None)
+        cursor = self.db.conn.cursor()
+        cursor.execute("SELECT id, name, rule_string FROM box_rules")
+        for rid, name, fmt in cursor.fetchall():
+            self.sim_box_rule.addItem(fmt, rid)
+        cursor.execute("SELECT id, name, rule_string, length FROM sn_rules")
+        for rid, name, fmt, length in cursor.fetchall():
+            self.sim_sn_rule.addItem(f"{name}: {fmt}", (rid, fmt, length or 0))
+        if box_text: self.sim_box_rule.setCurrentText(box_text)
+        for i in range(1, self.sim_sn_rule.count()):
+            if self.sim_sn_rule.itemData(i) == sn_id: self.sim_sn_rule.setCurrentIndex(i)
+
+    def on_sim_product_changed(self):
+        p = self.db.get_catalog().get(self.sim_product.currentData())
+        if not p: return
+        self.sim_sn4.setText(str(p.sn4 or ""))
+        idx = self.sim_box_rule.findData(p.rule_id)
+        if idx >= 0: self.sim_box_rule.setCurrentIndex(idx)
+        for i in range(1, self.sim_sn_rule.count()):
+            if self.sim_sn_rule.itemData(i)[0] == p.sn_rule_id: self.sim_sn_rule.setCurrentIndex(i)
+
+    def do_simulate_box(self):
+        fmt = self.sim_box_rule.currentText().strip()
+        if not fmt: return QMessageBox.warning(self, "提示", "请选择或输入箱号规则")
+        start, end = self.sim_start.date().toPyDate(), self.sim_end.date().toPyDate()
+        if end < start: return QMessageBox.warning(self, "提示", "结束日期早于开始日期")
+        try:
+            report = simulate_box_rule(BoxRuleEngine(self.db), fmt, {'sn4': self.sim_sn4.text().strip() or '0000'},
+                                       start, end, self.sim_per_day.value(), self.sim_level.value())
+            self.sim_result.setPlainText(format_box_report(report))
+        except Exception as e:
+            QMessageBox.critical(self, "错误", str(e))
+
+    def do_validate_sn_file(self):
+        prefix = self.sim_sn4.text().strip()
+        if not prefix: return QMessageBox.warning(self, "提示", "请先选择产品或输入SN前缀")
+        path, _ = QFileDialog.getOpenFileName(self, "选择SN样本", "", "SN样本 (*.txt *.csv *.tsv *.xlsx *.xls)")
+        if not path: return
+        rule = self.sim_sn_rule.currentData()
+        try:
+            sns = load_sn_file(path)
+            report = validate_sn_samples(sns, prefix, rule[1] if rule else None, rule[2] if rule else 0,
+                                         self.sim_batch.text().strip())
+            self.sim_result.setPlainText(f"{os.path.basename(path)}\n" + format_sn_report(report))
+        except Exception as e:
+            QMessageBox.critical(self, "错误", str(e))
+
     # ================= 全局刷新 =================
+    def refresh_changed(self):
+        """切换到本页时调用：只重新加载发生过变化的表"""
+        changes = self.changes.take()
+        if 'box_rules' in changes: self.load_box_rules()
+        if 'sn_rules' in changes: self.load_sn_rules()
+        if 'settings' in changes:
+            self.load_map()
+            self.load_sys_paths()
+            self.load_default_printer()
+        if 'products' in changes: self.load_counter_products()
+        if changes.keys() & {'products', 'box_rules', 'sn_rules'}: self.load_sim_options()
+        if 'box_counters' in changes and self.tabs.currentWidget() is self.tab_counter: self.load_counters()
+
     def refresh_data(self):
+        self.changes.take()
         self.load_box_rules()
         self.load_sn_rules()
         self.load_map()
         self.load_sys_paths()
         self.load_default_printer() # --- 新增调用 ---
+        self.load_counter_products()
+        self.load_sim_options()
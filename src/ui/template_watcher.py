@@ -0,0 +1,59 @@
+import os
+from PyQt5.QtCore import QObject, QFileSystemWatcher, QTimer
+from src.events import event_bus
+from src.template_catalog import template_catalog
+from src.ui.worker_pool import get_query_pool
+
+class TemplateWatcher(QObject):
+    """
+    监视模板根目录：启动时在后台完整扫描一次，之后目录/文件变化时只重新扫描变化的目录，
+    更新 template_catalog 后发布 {'templates': None}。修改模板根目录设置后自动重建索引。
+    """
+    DEBOUNCE_MS = 500 # 复制/保存模板时会连续触发多次，合并处理
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.pool = get_query_pool(db.db_name)
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.on_path_changed)
+        self.watcher.fileChanged.connect(lambda p: self.on_path_changed(os.path.dirname(p)))
+        self._pending = set()
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+        event_bus.subscribe(self.on_settings_changed, ('settings',))
+
+    def start(self):
+        self.rescan()
+
+    def rescan(self):
+        root = self.db.get_template_root()
+        self.pool.submit(lambda conn: template_catalog.scan(root), lambda n: self.on_changed(True),
+                         lambda e: print(f"Template Scan Error: {e}"), key="template_scan")
+
+    def on_settings_changed(self, changes):
+        root = self.db.get_template_root()
+        if (os.path.abspath(root) if root else "") != template_catalog.root: self.rescan()
+
+    def on_path_changed(self, path):
+        self._pending.add(path)
+        self._timer.start(self.DEBOUNCE_MS)
+
+    def flush(self):
+        dirs, self._pending = self._pending, set()
+        self.pool.submit(lambda conn: [template_catalog.refresh_dir(d) for d in dirs],
+                         lambda res: self.on_changed(any(res)),
+                         lambda e: print(f"Template Refresh Error: {e}"))
+
+    def on_changed(self, changed):
+        if not changed: return
+        self.rewatch()
+        event_bus.publish({'templates': None})
+
+    def rewatch(self):
+        """重新登记监视路径 (文件被替换保存后，原监视会失效)"""
+        old = self.watcher.directories() + self.watcher.files()
+        if old: self.watcher.removePaths(old)
+        paths = sorted(template_catalog.dirs) + [i.path for i in template_catalog.entries.values()]
+        if paths: self.watcher.addPaths(paths)
@@ -0,0 +1,146 @@
+import sqlite3
+import threading
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from src.query_log import ProfiledConnection
+from src.events import commit_local
+
+class QueryTask:
+    """
+    一次后台查询。cancel() 后结果被丢弃，正在执行的 SQL 会被 interrupt 中断。
+    conn 只在任务执行期间指向所用连接，读写都加锁：任务结束后连接会被线程的下一个任务复用，不能再被中断
+    """
+    __slots__ = ('fn', 'on_done', 'on_error', 'key', 'write', 'cancelled', 'conn', '_lock')
+
+    def __init__(self, fn, on_done, on_error, key, write):
+        self.fn = fn
+        self.on_done = on_done
+        self.on_error = on_error
+        self.key = key
+        self.write = write
+        self.cancelled = False
+        self.conn = None
+        self._lock = threading.Lock()
+
+    def attach(self, conn):
+        """开始在 conn 上执行；已取消时返回 False"""
+        with self._lock:
+            if self.cancelled: return False
+            self.conn = conn
+            return True
+
+    def detach(self):
+        with self._lock: self.conn = None
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            if self.conn is not None:
+                try: self.conn.interrupt()
+                except Exception: pass
+
+class _Relay(QObject):
+    # 工作线程 -> 界面线程 (排队连接)
+    finished = pyqtSignal(object, object, object) # task, result, error
+
+class _Runnable(QRunnable):
+    def __init__(self, pool, task):
+        super().__init__()
+        self.pool = pool
+        self.task = task
+
+    def run(self):
+        self.pool._execute(self.task)
+
+class QueryPool:
+    """
+    后台查询线程池 (全进程共享)。
+    线程常驻，每个线程持有自己的只读连接 (写任务另用一个写连接)，不再每次查询新建线程和连接。
+    submit(fn) 中 fn(conn) 在工作线程执行，结果通过 on_done / on_error 回到界面线程。
+    相同 key 的新任务会取消旧任务 (例如连续输入搜索条件时，只保留最后一次查询)。
+    """
+    def __init__(self, db_path, max_threads=3):
+        self.db_path = db_path
+        self._pool = QThreadPool()
+        self._pool.setMaxThreadCount(max_threads)
+        self._pool.setExpiryTimeout(-1) # 线程常驻，连接随线程复用
+        self._local = threading.local()
+        self._conns = []
+        self._lock = threading.Lock()
+        self._latest = {} # {key: 最新任务}
+        self._relay = _Relay()
+        self._relay.finished.connect(self._deliver)
+
+    def submit(self, fn, on_done=None, on_error=None, key=None, write=False):
+        task = QueryTask(fn, on_done, on_error, key, write)
+        if key:
+            old = self._latest.get(key)
+            if old: old.cancel()
+            self._latest[key] = task
+        self._pool.start(_Runnable(self, task))
+        return task
+
+    def running(self, key):
+        """该 key 是否有尚未完成的任务 (已取消但仍在工作线程上收尾的也算)"""
+        return key in self._latest
+
+    def cancel(self, key):
+        # 只做标记，不移除 key：被中断的任务要等 _deliver 才算结束，否则 running() 会让同 key 任务并发执行
+        task = self._latest.get(key)
+        if task: task.cancel()
+
+    def _conn(self, write):
+        attr = 'write_conn' if write else 'read_conn'
+        conn = getattr(self._local, attr, None)
+        if conn is None:
+            if write:
+                conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False, factory=ProfiledConnection)
+            else:
+                conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False,
+                                       factory=ProfiledConnection)
+            setattr(self._local, attr, conn)
+            with self._lock: self._conns.append(conn)
+        return conn
+
+    def _execute(self, task):
+        result = error = None
+        try:
+            conn = self._conn(task.write)
+            if task.attach(conn):
+                try:
+                    result = task.fn(conn)
+                    if task.write and conn.in_transaction: commit_local(conn)
+                finally:
+                    task.detach()
+                    if task.write and conn.in_transaction: conn.rollback()
+        except Exception as e:
+            error = e
+        # 已取消的任务也要回到界面线程，由 _deliver 移除 key
+        self._relay.finished.emit(task, result, error)
+
+    def _deliver(self, task, result, error):
+        if task.key and self._latest.get(task.key) is task: del self._latest[task.key]
+        if task.cancelled: return
+        if error is None:
+            if task.on_done: task.on_done(result)
+        elif task.on_error:
+            task.on_error(error)
+        else:
+            print(f"Query Task Error: {error}")
+
+    def shutdown(self):
+        for task in list(self._latest.values()): task.cancel()
+        self._latest = {}
+        self._pool.waitForDone(3000)
+        with self._lock:
+            for conn in self._conns:
+                try: conn.close()
+                except Exception: pass
+            self._conns = []
+
+_pools = {}
+
+def get_query_pool(db_path):
+    pool = _pools.get(db_path)
+    if pool is None:
+        pool = _pools[db_path] = QueryPool(db_path)
+    return pool